@@ -0,0 +1,71 @@
+"""asyncio counterparts of the mglib request functions
+
+Requests run on a thread pool over the shared keep-alive session, so many
+MG-RAST calls can be in flight at once from a single event loop.
+
+    from mglib import aio
+    objs = aio.run(aio.gather([aio.obj_from_url(u) for u in urls]))
+"""
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from . import mglib
+
+# maximum number of requests in flight at once, defaults to connection pool size
+CONCURRENCY = int(os.environ.get('MGRAST_CONCURRENCY', mglib.POOL_SIZE))
+
+# run blocking mglib function on the loop's thread pool
+async def _call(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+# return python struct from JSON output of MG-RAST or Shock API
+async def obj_from_url(url, auth=None, data=None, debug=False, method=None, stream=None):
+    return await _call(mglib.obj_from_url, url, auth=auth, data=data, debug=debug, method=method, stream=stream)
+
+# return full response body from MG-RAST or Shock API as bytes
+async def bytes_from_url(url, accept='text/plain', auth=None, data=None, debug=False, method=None):
+    def read():
+        return mglib.body_from_url(url, accept, auth=auth, data=data, debug=debug, method=method).read()
+    return await _call(read)
+
+# print to file results of MG-RAST or Shock API
+async def file_from_url(url, handle, auth=None, data=None, debug=False, sha1=False):
+    return await _call(mglib.file_from_url, url, handle, auth=auth, data=data, debug=debug, sha1=sha1)
+
+# return python struct from JSON output of asynchronous MG-RAST API
+# waits on the event loop, not on a pool thread, between status checks
+async def async_rest_api(url, auth=None, data=None, debug=False, delay=mglib.POLL_CEILING, floor=mglib.POLL_FLOOR):
+    result, status_url = await _call(mglib._async_submit, url, auth=auth, data=data, debug=debug)
+    if status_url is None:
+        return result
+    result = await obj_from_url(status_url, auth=auth, debug=debug)
+    for wait in mglib.poll_delays(floor, delay):
+        if not mglib._async_pending(result):
+            break
+        if debug:
+            print("waiting %.1f seconds ..."%wait)
+        await asyncio.sleep(wait)
+        result = await obj_from_url(status_url, auth=auth, debug=debug)
+    return mglib._async_result(url, result)
+
+# await coroutines with at most 'concurrency' running at once
+# returns results in input order
+async def gather(coros, concurrency=None):
+    sem = asyncio.Semaphore(concurrency or CONCURRENCY)
+    async def bounded(coro):
+        async with sem:
+            return await coro
+    return await asyncio.gather(*[bounded(c) for c in coros])
+
+# run coroutine to completion on a new event loop, return its result
+def run(main, workers=None):
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers or CONCURRENCY))
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
@@ -0,0 +1,413 @@
+"""BIOM table backed by a scipy sparse matrix
+
+Biom holds the abundance matrix of a BIOM 1.0 document as a CSR matrix with
+a numeric dtype, alongside the row and column dicts and remaining top-level
+fields, and converts to and from the JSON structs returned by the MG-RAST API.
+
+    b = Biom.from_dict(obj_from_url(url))
+    b.matrix.sum(axis=0)
+    json.dump(b.to_dict(), hdl)
+
+A Biom can also be saved as a bundle: a directory of .npy arrays holding the
+matrix in both CSR and CSC layout, with JSON sidecars for the rows, columns
+and other fields. Arrays are memory-mapped on load, so a slice of rows or
+columns only reads the part of the file it needs.
+
+    b.save_bundle('table.biomb')
+    Biom.load_bundle('table.biomb', rows=range(100, 200))
+
+BIOM 2.1 HDF5 files are read and written with save_hdf5 / load_hdf5, which
+need the optional h5py package.
+"""
+import os
+import json
+import time
+import numpy as np
+import scipy.sparse as sp
+
+# top-level fields written when not present in source
+DEFAULTS = {
+    "format_url": "http://biom-format.org",
+    "format": "Biological Observation Matrix 1.0",
+    "matrix_element_type": "int",
+    "matrix_element_value": "abundance",
+    "generated_by": "MG-RAST",
+    "type": ""
+}
+
+# int64 if all values are integral (1 and 1.0 alike), else float64
+def value_dtype(values):
+    for v in values:
+        if isinstance(v, bool) or not (isinstance(v, int) or (isinstance(v, float) and v.is_integer() and abs(v) < 2**63)):
+            return np.float64
+    return np.int64
+
+# indexes of the last occurrence of each (row, col) pair, in input order
+def _last_triples(rows, cols, ncols):
+    keys = rows * ncols + cols
+    _, first = np.unique(keys[::-1], return_index=True)
+    return np.sort(len(keys) - 1 - first)
+
+# build CSR matrix from BIOM sparse triples [row, col, value]
+#  a repeated (row, col) keeps its last value, as when filling a dense matrix in order
+def triples_to_csr(triples, nrows, ncols, dtype=None):
+    if not triples:
+        return sp.csr_matrix((nrows, ncols), dtype=dtype or np.int64)
+    rows = np.fromiter((t[0] for t in triples), dtype=np.int64, count=len(triples))
+    cols = np.fromiter((t[1] for t in triples), dtype=np.int64, count=len(triples))
+    vals = [t[2] for t in triples]
+    vals = np.array(vals, dtype=dtype or value_dtype(vals))
+    keep = _last_triples(rows, cols, ncols)
+    if len(keep) < len(vals):
+        rows, cols, vals = rows[keep], cols[keep], vals[keep]
+    matrix = sp.coo_matrix((vals, (rows, cols)), shape=(nrows, ncols)).tocsr()
+    matrix.eliminate_zeros()
+    return matrix
+
+# build CSR matrix from BIOM dense list of rows
+def dense_to_csr(data, nrows, ncols, dtype=None):
+    if nrows == 0 or ncols == 0:
+        return sp.csr_matrix((nrows, ncols), dtype=dtype or np.int64)
+    array = np.asarray(data, dtype=dtype)
+    if array.dtype.kind not in 'iuf':
+        array = array.astype(np.float64)
+    if (dtype is None) and (array.dtype.kind == 'f') and np.all(np.abs(array) < 2**63) and np.all(array == np.floor(array)):
+        array = array.astype(np.int64)
+    return sp.csr_matrix(array.reshape(nrows, ncols))
+
+# bundle layout
+BUNDLE_FORMAT = "MG-RAST BIOM bundle 1"
+BUNDLE_INFO   = "info.json"
+
+# True if path is a BIOM bundle directory
+def is_bundle(path):
+    return os.path.isfile(os.path.join(path, BUNDLE_INFO))
+
+# HDF5 file signature
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+# True if path is an HDF5 file
+def is_hdf5(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as hdl:
+        return hdl.read(len(HDF5_SIGNATURE)) == HDF5_SIGNATURE
+
+def _h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("h5py is required for BIOM 2.1 HDF5 files, install it with 'pip install h5py'")
+    return h5py
+
+# write row or column dicts as BIOM 2.1 ids and metadata datasets
+#  lists of strings (taxonomy) are stored as 2D string arrays, strings as is, other values as JSON strings,
+#  fields other than id and metadata are stored as metadata and listed in attribute 'fields'
+def _write_axis(h5py, grp, items, matrix):
+    str_dt = h5py.special_dtype(vlen=str)
+    grp.create_dataset('ids', data=np.array([str(x['id']) for x in items], dtype=object), dtype=str_dt)
+    mgrp = grp.create_group('metadata')
+    grp.create_group('group-metadata')
+    mgrp_items = [dict(x.get('metadata') or {}) for x in items]
+    fields = sorted(set(k for x in items for k in x if k not in ('id', 'metadata')))
+    for i, x in enumerate(items):
+        for k in fields:
+            if k in x:
+                mgrp_items[i][k] = x[k]
+    grp.attrs['fields'] = json.dumps(fields)
+    for key in sorted(set(k for m in mgrp_items for k in m)):
+        values = [m.get(key) for m in mgrp_items]
+        present = [v for v in values if v is not None]
+        if all(isinstance(v, list) and all(isinstance(e, str) for e in v) for v in present):
+            values = [v or [] for v in values]
+            width = max([len(v) for v in values] + [1])
+            mgrp.create_dataset(key, data=np.array([v + ['']*(width-len(v)) for v in values], dtype=object), dtype=str_dt)
+        elif all(isinstance(v, str) for v in present):
+            mgrp.create_dataset(key, data=np.array([v or '' for v in values], dtype=object), dtype=str_dt)
+        else:
+            ds = mgrp.create_dataset(key, data=np.array([json.dumps(v) for v in values], dtype=object), dtype=str_dt)
+            ds.attrs['json'] = True
+    mat = grp.create_group('matrix')
+    for part in ('data', 'indices', 'indptr'):
+        array = getattr(matrix, part)
+        if len(array) and part != 'indptr':
+            mat.create_dataset(part, data=array, chunks=True, compression='gzip')
+        else:
+            mat.create_dataset(part, data=array)
+
+# read row or column dicts from BIOM 2.1 group, optionally only selected indices
+def _read_axis(grp, sel):
+    def decode(v):
+        return v.decode('utf8') if isinstance(v, bytes) else v
+    ids = grp['ids'][()]
+    if sel is not None:
+        ids = ids[sel]
+    items = [{'id': decode(i), 'metadata': {}} for i in ids]
+    fields = set(json.loads(grp.attrs['fields'])) if 'fields' in grp.attrs else set()
+    for key, ds in grp['metadata'].items():
+        values = ds[()]
+        if sel is not None:
+            values = values[sel]
+        is_json = bool(ds.attrs.get('json', False))
+        for item, v in zip(items, values):
+            if ds.ndim == 2:
+                v = [decode(e) for e in v]
+                while v and v[-1] == '':
+                    v.pop()
+            else:
+                v = decode(v)
+                if is_json:
+                    v = json.loads(v)
+            # missing values are stored empty
+            if (v is None) or (len(v) == 0 if isinstance(v, (list, str)) else False):
+                continue
+            if key in fields:
+                item[key] = v
+            else:
+                item['metadata'][key] = v
+    return items
+
+# selected indices as int array, None for all
+def _selection(sel, size):
+    if sel is None:
+        return None
+    if isinstance(sel, slice):
+        return np.arange(size)[sel]
+    return np.asarray(list(sel), dtype=np.int64)
+
+# compressed arrays restricted to selected rows (CSR) or columns (CSC)
+# only the selected segments of memory-mapped arrays are read
+def _take_major(indptr, indices, data, sel):
+    starts = np.asarray(indptr[sel], dtype=np.int64)
+    ends   = np.asarray(indptr[sel+1], dtype=np.int64)
+    new_indptr = np.zeros(len(sel)+1, dtype=np.int64)
+    np.cumsum(ends - starts, out=new_indptr[1:])
+    if len(sel) == 0:
+        return new_indptr, np.zeros(0, dtype=indices.dtype), np.zeros(0, dtype=data.dtype)
+    if np.all(np.diff(sel) == 1):
+        # contiguous range is a single read
+        return new_indptr, np.array(indices[starts[0]:ends[-1]]), np.array(data[starts[0]:ends[-1]])
+    new_indices = np.concatenate([indices[s:e] for s, e in zip(starts, ends)])
+    new_data = np.concatenate([data[s:e] for s, e in zip(starts, ends)])
+    return new_indptr, new_indices, new_data
+
+class Biom(object):
+    def __init__(self, matrix, rows, columns, info=None):
+        self.matrix  = sp.csr_matrix(matrix)
+        self.rows    = rows
+        self.columns = columns
+        self.info    = dict(info or {})
+        assert self.matrix.shape == (len(rows), len(columns)), "matrix shape does not match rows and columns"
+
+    # BIOM struct, or API response with BIOM under 'data'
+    @classmethod
+    def from_dict(cls, biom, dtype=None):
+        if "columns" not in biom:
+            biom = biom["data"]
+        nrows, ncols = len(biom['rows']), len(biom['columns'])
+        assert "matrix_type" in biom, repr(biom)
+        if biom['matrix_type'] == 'sparse':
+            matrix = triples_to_csr(biom['data'], nrows, ncols, dtype)
+        else:
+            matrix = dense_to_csr(biom['data'], nrows, ncols, dtype)
+        info = dict((k, v) for k, v in biom.items() if k not in ('rows', 'columns', 'data', 'shape', 'matrix_type'))
+        return cls(matrix, biom['rows'], biom['columns'], info)
+
+    # BIOM struct, data as sparse triples or dense list of rows
+    def to_dict(self, dense=False):
+        biom = dict(DEFAULTS)
+        biom.update(self.info)
+        biom['rows'] = self.rows
+        biom['columns'] = self.columns
+        biom['shape'] = list(self.shape)
+        if dense:
+            biom['matrix_type'] = 'dense'
+            biom['data'] = self.matrix.toarray().tolist()
+        else:
+            coo = self.matrix.tocoo()
+            biom['matrix_type'] = 'sparse'
+            biom['data'] = [list(t) for t in zip(coo.row.tolist(), coo.col.tolist(), coo.data.tolist())]
+        return biom
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def row_ids(self):
+        return [r['id'] for r in self.rows]
+
+    @property
+    def col_ids(self):
+        return [c['id'] for c in self.columns]
+
+    # numpy array of full matrix
+    def dense(self):
+        return self.matrix.toarray()
+
+    # numpy array of one column
+    def column(self, index):
+        return self.matrix[:,index].toarray().ravel()
+
+    # yield python lists of row values, densified a block of rows at a time
+    def iter_dense_rows(self, block=1000):
+        for start in range(0, self.shape[0], block):
+            for row in self.matrix[start:start+block].toarray().tolist():
+                yield row
+
+    # new Biom with subset of rows and columns, by index
+    def select(self, rows=None, columns=None):
+        matrix = self.matrix
+        new_rows, new_cols = self.rows, self.columns
+        if rows is not None:
+            matrix = matrix[rows]
+            new_rows = [self.rows[i] for i in rows]
+        if columns is not None:
+            matrix = matrix[:,columns]
+            new_cols = [self.columns[i] for i in columns]
+        return Biom(matrix, new_rows, new_cols, self.info)
+
+    # merge Biom objects, rows and columns matched by id
+    # a column found in several inputs is taken from the first, rows are combined
+    @classmethod
+    def merge(cls, bioms):
+        rows, cols = [], []
+        row_index, col_index = {}, {}
+        parts_r, parts_c, parts_v = [], [], []
+        for b in bioms:
+            cmap = np.empty(len(b.columns), dtype=np.int64)
+            for j, c in enumerate(b.columns):
+                if c['id'] in col_index:
+                    cmap[j] = -1
+                else:
+                    cmap[j] = col_index[c['id']] = len(cols)
+                    cols.append(c)
+            rmap = np.empty(len(b.rows), dtype=np.int64)
+            for i, r in enumerate(b.rows):
+                if r['id'] not in row_index:
+                    row_index[r['id']] = len(rows)
+                    rows.append(r)
+                rmap[i] = row_index[r['id']]
+            coo = b.matrix.tocoo()
+            keep = cmap[coo.col] >= 0
+            parts_r.append(rmap[coo.row[keep]])
+            parts_c.append(cmap[coo.col[keep]])
+            parts_v.append(coo.data[keep])
+        dtype = np.result_type(*[b.matrix.dtype for b in bioms]) if bioms else np.int64
+        if parts_v:
+            data = (np.concatenate(parts_v).astype(dtype), (np.concatenate(parts_r), np.concatenate(parts_c)))
+            matrix = sp.coo_matrix(data, shape=(len(rows), len(cols)))
+        else:
+            matrix = sp.csr_matrix((0, 0), dtype=dtype)
+        info = dict(bioms[0].info) if bioms else {}
+        info['id'] = "_".join([str(b.info.get('id')) for b in bioms])
+        info['date'] = time.strftime("%Y-%m-%d %H:%M:%S")
+        return cls(matrix, rows, cols, info)
+
+    # write bundle directory
+    def save_bundle(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        csr = self.matrix.copy()
+        csr.sort_indices()
+        csc = csr.tocsc()
+        for name, matrix in (('csr', csr), ('csc', csc)):
+            for part in ('indptr', 'indices', 'data'):
+                np.save(os.path.join(path, "%s_%s.npy"%(name, part)), getattr(matrix, part))
+        for name, value in (('rows', self.rows), ('columns', self.columns)):
+            with open(os.path.join(path, name+'.json'), 'w') as hdl:
+                json.dump(value, hdl, separators=(',',':'))
+        info = dict(self.info)
+        info['bundle_format'] = BUNDLE_FORMAT
+        info['shape'] = list(self.shape)
+        with open(os.path.join(path, BUNDLE_INFO), 'w') as hdl:
+            json.dump(info, hdl)
+
+    # read bundle directory, optionally only selected rows and / or columns
+    # rows and columns are a slice or list of indices
+    @classmethod
+    def load_bundle(cls, path, rows=None, columns=None):
+        with open(os.path.join(path, BUNDLE_INFO)) as hdl:
+            info = json.load(hdl)
+        if info.pop('bundle_format', None) != BUNDLE_FORMAT:
+            raise ValueError("%s is not a BIOM bundle"%path)
+        nrows, ncols = info.pop('shape')
+        row_sel = _selection(rows, nrows)
+        col_sel = _selection(columns, ncols)
+        def arrays(name):
+            return [np.load(os.path.join(path, "%s_%s.npy"%(name, part)), mmap_mode='r') for part in ('indptr', 'indices', 'data')]
+        if row_sel is not None:
+            indptr, indices, data = _take_major(*(arrays('csr') + [row_sel]))
+            matrix = sp.csr_matrix((data, indices, indptr), shape=(len(row_sel), ncols))
+            if col_sel is not None:
+                matrix = matrix[:,col_sel]
+        elif col_sel is not None:
+            indptr, indices, data = _take_major(*(arrays('csc') + [col_sel]))
+            matrix = sp.csc_matrix((data, indices, indptr), shape=(nrows, len(col_sel))).tocsr()
+        else:
+            indptr, indices, data = [np.array(a) for a in arrays('csr')]
+            matrix = sp.csr_matrix((data, indices, indptr), shape=(nrows, ncols))
+        with open(os.path.join(path, 'rows.json')) as hdl:
+            row_md = json.load(hdl)
+        with open(os.path.join(path, 'columns.json')) as hdl:
+            col_md = json.load(hdl)
+        if row_sel is not None:
+            row_md = [row_md[i] for i in row_sel]
+        if col_sel is not None:
+            col_md = [col_md[i] for i in col_sel]
+        return cls(matrix, row_md, col_md, info)
+
+    # write BIOM 2.1 HDF5 file, observations are rows and samples are columns
+    def save_hdf5(self, path):
+        h5py = _h5py()
+        csr = self.matrix.copy()
+        csr.sort_indices()
+        with h5py.File(path, 'w') as h5:
+            h5.attrs['id'] = str(self.info.get('id') or '')
+            h5.attrs['type'] = str(self.info.get('type') or '')
+            h5.attrs['format-url'] = "http://biom-format.org"
+            h5.attrs['format-version'] = [2, 1]
+            h5.attrs['generated-by'] = str(self.info.get('generated_by') or DEFAULTS['generated_by'])
+            h5.attrs['creation-date'] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            h5.attrs['shape'] = list(self.shape)
+            h5.attrs['nnz'] = csr.nnz
+            # remaining BIOM 1.0 fields, so JSON round trips keep them
+            extra = dict((k, v) for k, v in self.info.items() if k not in ('id', 'type', 'generated_by', 'date'))
+            h5.attrs['mgrast-info'] = json.dumps(extra)
+            _write_axis(h5py, h5.create_group('observation'), self.rows, csr)
+            _write_axis(h5py, h5.create_group('sample'), self.columns, csr.tocsc())
+
+    # read BIOM 2.1 HDF5 file, optionally only selected rows (observations) and / or columns (samples)
+    # rows and columns are a slice or list of indices
+    @classmethod
+    def load_hdf5(cls, path, rows=None, columns=None):
+        h5py = _h5py()
+        with h5py.File(path, 'r') as h5:
+            def attr(name, default=None):
+                value = h5.attrs.get(name, default)
+                return value.decode('utf8') if isinstance(value, bytes) else value
+            nrows, ncols = [int(x) for x in h5.attrs['shape']]
+            row_sel = _selection(rows, nrows)
+            col_sel = _selection(columns, ncols)
+            def arrays(axis):
+                mat = h5[axis]['matrix']
+                return [mat['indptr'][()], mat['indices'], mat['data']]
+            if row_sel is not None:
+                indptr, indices, data = _take_major(*(arrays('observation') + [row_sel]))
+                matrix = sp.csr_matrix((data, indices, indptr), shape=(len(row_sel), ncols))
+                if col_sel is not None:
+                    matrix = matrix[:,col_sel]
+            elif col_sel is not None:
+                indptr, indices, data = _take_major(*(arrays('sample') + [col_sel]))
+                matrix = sp.csc_matrix((data, indices, indptr), shape=(nrows, len(col_sel))).tocsr()
+            else:
+                indptr, indices, data = [np.asarray(a[()]) for a in arrays('observation')]
+                matrix = sp.csr_matrix((data, indices, indptr), shape=(nrows, ncols))
+            info = json.loads(attr('mgrast-info', '{}'))
+            info['id'] = attr('id')
+            info['type'] = attr('type')
+            info['generated_by'] = attr('generated-by')
+            info['date'] = attr('creation-date')
+            row_md = _read_axis(h5['observation'], row_sel)
+            col_md = _read_axis(h5['sample'], col_sel)
+        return cls(matrix, row_md, col_md, info)
@@ -0,0 +1,366 @@
+"""in-process numpy versions of the MG-RAST compute steps
+
+Functions take an abundance matrix with annotations in rows and metagenomes
+in columns, as a numpy array or scipy sparse matrix (Biom.matrix), and work
+on the whole matrix at once instead of posting it to the compute API or
+handing it to R through temp files.
+
+    data, keep = normalize(Biom.from_dict(biom).matrix)
+    rows = [biom['rows'][i] for i in keep]
+"""
+import numpy as np
+import scipy.sparse as sp
+
+NORMALIZE_METHODS = ['mgrast', 'log', 'standardize']
+
+# float64 copy of matrix, sparse input stays sparse
+def _as_float(matrix):
+    if sp.issparse(matrix):
+        return sp.csr_matrix(matrix, dtype=np.float64, copy=True)
+    return np.array(matrix, dtype=np.float64)
+
+# zero entries <= threshold and drop rows left with a sum below threshold,
+# as remove.singletons in preprocessing.r, returns (matrix, kept row indexes)
+def remove_singletons(matrix, threshold=1):
+    matrix = _as_float(matrix)
+    if sp.issparse(matrix):
+        matrix.data[np.isnan(matrix.data) | (matrix.data <= threshold)] = 0
+        matrix.eliminate_zeros()
+    else:
+        matrix[np.isnan(matrix) | (matrix <= threshold)] = 0
+    keep = np.flatnonzero(np.asarray(matrix.sum(axis=1)).ravel() >= threshold)
+    return matrix[keep], keep
+
+# log2(x + 1), zeros stay zero so sparse input stays sparse
+def log_transform(matrix):
+    matrix = _as_float(matrix)
+    if sp.issparse(matrix):
+        matrix.data = np.log2(matrix.data + 1)
+        return matrix
+    matrix[np.isnan(matrix)] = 0
+    return np.log2(matrix + 1)
+
+# center each column on its mean and divide by its sample standard deviation,
+# a constant column is only centered
+def standardize(matrix):
+    if sp.issparse(matrix):
+        matrix = matrix.toarray()
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.shape[0] == 0:
+        return matrix
+    sd = matrix.std(axis=0, ddof=1) if matrix.shape[0] > 1 else np.zeros(matrix.shape[1])
+    sd[(sd == 0) | np.isnan(sd)] = 1
+    return (matrix - matrix.mean(axis=0)) / sd
+
+# shift and scale whole matrix to range 0 to 1, unchanged if all values are equal
+def scale_range(matrix):
+    if matrix.size == 0:
+        return matrix
+    low = matrix.min()
+    span = matrix.max() - low
+    return (matrix - low) / span if span != 0 else matrix
+
+# normalize abundance matrix, returns (dense array, kept row indexes)
+#  'mgrast': MGRAST_preprocessing of preprocessing.r, remove singletons, log2(x+1),
+#            standardize columns, then scale to 0 .. 1
+#  'log': log2(x+1) only
+#  'standardize': log2(x+1) and standardize columns, no rows removed
+def normalize(matrix, method='mgrast', threshold=1):
+    if method not in NORMALIZE_METHODS:
+        raise ValueError("unknown normalize method '%s'"%method)
+    keep = np.arange(matrix.shape[0])
+    if method == 'mgrast':
+        matrix, keep = remove_singletons(matrix, threshold)
+    matrix = log_transform(matrix)
+    if method == 'log':
+        return (matrix.toarray() if sp.issparse(matrix) else matrix), keep
+    matrix = standardize(matrix)
+    if method == 'mgrast':
+        matrix = scale_range(matrix)
+    return matrix, keep
+
+# distance metrics of the MG-RAST compute API, as in matR / ecodist
+DISTANCES = ['bray-curtis', 'euclidean', 'maximum', 'manhattan', 'canberra', 'minkowski', 'difference']
+
+# condensed distances (as scipy pdist) between the rows of samples, a numpy array
+# or sparse matrix with one sample per row
+#  'minkowski' uses power 2 as the R default, 'canberra' leaves out features absent
+#  from both samples and rescales the sum as R does, 'difference' counts features
+#  present in only one of the two samples
+def pairwise_distances(samples, method='bray-curtis'):
+    from scipy.spatial.distance import pdist
+    if method not in DISTANCES:
+        raise ValueError("unknown distance '%s'"%method)
+    samples = samples.toarray() if sp.issparse(samples) else samples
+    samples = np.ascontiguousarray(samples, dtype=np.float64)
+    nsamp, nfeat = samples.shape
+    if method == 'bray-curtis':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.nan_to_num(pdist(samples, 'braycurtis'))
+    if method in ('difference', 'canberra'):
+        present = samples != 0
+        differ = pdist(present, 'hamming') * nfeat
+        if method == 'difference':
+            return np.rint(differ)
+        # features present in either sample, filled one sample's pairs at a time
+        count = present.sum(axis=1)
+        used = np.empty_like(differ)
+        pos = 0
+        for i in range(nsamp - 1):
+            used[pos:pos+nsamp-i-1] = count[i] + count[i+1:]
+            pos += nsamp - i - 1
+        used = (used + differ) / 2
+        dist = pdist(samples, 'canberra')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(used > 0, dist * nfeat / used, 0)
+    metric = {'euclidean': 'euclidean', 'minkowski': 'euclidean', 'maximum': 'chebyshev', 'manhattan': 'cityblock'}[method]
+    return pdist(samples, metric)
+
+# square distance matrix between the columns (metagenomes) of matrix
+def distance_matrix(matrix, method='bray-curtis'):
+    from scipy.spatial.distance import squareform
+    samples = matrix.T
+    if samples.shape[0] < 2:
+        return np.zeros((samples.shape[0], samples.shape[0]))
+    return squareform(pairwise_distances(samples, method))
+
+# principal coordinates of square distance matrix, as pco of ecodist used by the API
+# returns (eigenvalues scaled by their sum, unit eigenvectors as columns), largest first
+#  k limits the result to the top k eigenpairs, found with an iterative solver
+#  when that is well below the number of samples
+def pcoa(dist, k=None):
+    dist = np.asarray(dist, dtype=np.float64)
+    size = dist.shape[0]
+    gower = -0.5 * dist ** 2
+    gower -= gower.mean(axis=0)
+    gower -= gower.mean(axis=1)[:,None]
+    total = np.trace(gower)
+    if k and (k < size - 1) and (size > 100):
+        from scipy.sparse.linalg import eigsh
+        values, vectors = eigsh(gower, k=k, which='LA')
+    else:
+        values, vectors = np.linalg.eigh(gower)
+    order = np.argsort(values)[::-1][:k or size]
+    values, vectors = values[order], vectors[:,order]
+    scaled = values / total if total != 0 else np.zeros_like(values)
+    return scaled, vectors
+
+# cluster methods of the MG-RAST compute API (R hclust names) and scipy linkage method
+CLUSTER_METHODS = {'ward': 'ward', 'single': 'single', 'complete': 'complete', 'mcquitty': 'weighted', 'median': 'median', 'centroid': 'centroid'}
+
+# scipy linkage matrix of condensed distances, clustered as R hclust
+#  R applies the ward, median and centroid updates to the distances as given, while
+#  scipy applies them to squared distances, so those get square roots going in and
+#  squared heights coming out
+def linkage(dist, method='ward'):
+    from scipy.cluster.hierarchy import linkage as scipy_linkage
+    if method not in CLUSTER_METHODS:
+        raise ValueError("unknown cluster method '%s'"%method)
+    squared = method in ('ward', 'median', 'centroid')
+    dist = np.sqrt(dist) if squared else np.asarray(dist, dtype=np.float64)
+    tree = scipy_linkage(dist, method=CLUSTER_METHODS[method])
+    if squared:
+        tree[:,2] **= 2
+    return tree
+
+# leaf order and dendrogram of linkage matrix, dendrogram is 'merge' and 'height' of R hclust:
+# merge step i joins two of observation -k (1-based) or the cluster of step k
+def dendrogram(tree):
+    from scipy.cluster.hierarchy import leaves_list
+    size = tree.shape[0] + 1
+    ids = tree[:,:2].astype(np.int64)
+    merge = np.where(ids < size, -(ids + 1), ids - size + 1)
+    return leaves_list(tree), {"merge": merge.tolist(), "height": tree[:,2].tolist()}
+
+# indexes of the n rows with highest variance, in original order
+def top_variance_rows(matrix, n):
+    if sp.issparse(matrix):
+        matrix = sp.csr_matrix(matrix, dtype=np.float64)
+        var = np.asarray(matrix.multiply(matrix).mean(axis=1)).ravel() - np.asarray(matrix.mean(axis=1)).ravel() ** 2
+    else:
+        var = np.asarray(matrix, dtype=np.float64).var(axis=1)
+    if n >= len(var):
+        return np.arange(len(var))
+    return np.sort(np.argpartition(-var, n)[:n])
+
+# order rows and columns of matrix by hierarchical clustering, as /compute/heatmap of the API
+# returns struct of reordered 'data', 'rows' and 'columns', 1-based 'rowindex' / 'colindex'
+# original positions in new order, and 'rowdend' / 'coldend' dendrograms
+def heatmap(matrix, rows, columns, distance='bray-curtis', method='ward'):
+    dense = matrix.toarray() if sp.issparse(matrix) else np.asarray(matrix)
+    orders = []
+    for samples in (dense, dense.T):
+        if samples.shape[0] < 2:
+            orders.append((np.arange(samples.shape[0]), {"merge": [], "height": []}))
+        else:
+            orders.append(dendrogram(linkage(pairwise_distances(samples, distance), method)))
+    (rorder, rdend), (corder, cdend) = orders
+    return {
+        "data": dense[rorder][:,corder].tolist(),
+        "rows": [rows[i] for i in rorder],
+        "columns": [columns[i] for i in corder],
+        "rowindex": (rorder + 1).tolist(),
+        "colindex": (corder + 1).tolist(),
+        "rowdend": rdend,
+        "coldend": cdend
+    }
+
+# alpha diversity indexes, 'alpha' is the antilog of shannon as reported by the API
+ALPHA_INDEXES = ['alpha', 'shannon', 'simpson', 'chao1']
+
+# alpha diversity of every column (metagenome) of abundance matrix, in one pass over the nonzero values
+#  'shannon': -sum(p ln p), 'simpson': 1 - sum(p^2),
+#  'chao1': bias-corrected, observed + F1(F1-1) / 2(F2+1) with F1 / F2 the singleton / doubleton counts
+# columns with no abundance have diversity 0
+def alpha_diversity(matrix, index='alpha'):
+    if index not in ALPHA_INDEXES:
+        raise ValueError("unknown alpha diversity index '%s'"%index)
+    coo = sp.coo_matrix(matrix, dtype=np.float64)
+    keep = coo.data > 0
+    col, values = coo.col[keep], coo.data[keep]
+    ncols = coo.shape[1]
+    if index == 'chao1':
+        observed = np.bincount(col, minlength=ncols)
+        single = np.bincount(col, weights=(values == 1), minlength=ncols)
+        double = np.bincount(col, weights=(values == 2), minlength=ncols)
+        return observed + single * (single - 1) / (2 * (double + 1))
+    totals = np.bincount(col, weights=values, minlength=ncols)
+    prop = values / totals[col]
+    if index == 'simpson':
+        return np.where(totals > 0, 1 - np.bincount(col, weights=prop ** 2, minlength=ncols), 0)
+    shannon = np.bincount(col, weights=-prop * np.log(prop), minlength=ncols)
+    if index == 'alpha':
+        return np.where(totals > 0, np.exp(shannon), 0)
+    return shannon
+
+# Benjamini-Hochberg FDR of p-values, same shape as input
+# as R p.adjust, NaN p-values are left out of the count and stay NaN
+def fdr(pvalues):
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    flat = pvalues.ravel()
+    result = np.full(flat.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(flat))
+    order = valid[np.argsort(flat[valid], kind='stable')]
+    size = len(order)
+    # running minimum from the largest p-value down
+    q = np.minimum(1, size * flat[order] / np.arange(1, size + 1))
+    result[order] = np.minimum.accumulate(q[::-1])[::-1]
+    return result.reshape(pvalues.shape)
+
+# least squares regression of every row of matrix on metadata, as scipy.stats.linregress per row
+# metadata is one value per column, or a columns x fields array to regress on each field
+# returns (slope, r, p) arrays of rows, or of rows x fields
+def correlate(matrix, metadata):
+    from scipy.stats import t as t_dist
+    if sp.issparse(matrix):
+        matrix = matrix.toarray()
+    matrix = np.asarray(matrix, dtype=np.float64)
+    meta = np.asarray(metadata, dtype=np.float64)
+    single = meta.ndim == 1
+    meta = meta.reshape(meta.shape[0], -1)
+    size = matrix.shape[1]
+    mcent = meta - meta.mean(axis=0)
+    dcent = matrix - matrix.mean(axis=1)[:,None]
+    sxx = (mcent ** 2).sum(axis=0)
+    syy = (dcent ** 2).sum(axis=1)[:,None]
+    sxy = dcent.dot(mcent)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = sxy / sxx
+        r = np.where(syy * sxx > 0, sxy / np.sqrt(syy * sxx), 0)
+        r = np.clip(r, -1, 1)
+        df = size - 2
+        tval = r * np.sqrt(df / ((1 - r) * (1 + r)))
+    pval = 2 * t_dist.sf(np.abs(tval), df)
+    if single:
+        return slope[:,0], r[:,0], pval[:,0]
+    return slope, r, pval
+
+# Holm adjusted p-values, as R p.adjust default, NaN p-values are left out of the count
+def holm(pvalues):
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    result = np.full(pvalues.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(pvalues))
+    order = valid[np.argsort(pvalues[valid], kind='stable')]
+    size = len(order)
+    adjusted = np.maximum.accumulate((size - np.arange(size)) * pvalues[order])
+    result[order] = np.minimum(1, adjusted)
+    return result
+
+# group significance tests of matR sigtest that have a native version
+GROUP_TESTS = ['Kruskal-Wallis', 't-test-paired', 't-test-unpaired', 'Mann-Whitney-unpaired-Wilcoxon', 'ANOVA-one-way']
+
+# sum of t^3 - t over runs of t tied values in each row
+def _tie_sums(matrix):
+    ordered = np.sort(matrix, axis=1)
+    nrows, ncols = ordered.shape
+    starts = np.ones(ordered.shape, dtype=bool)
+    starts[:,1:] = ordered[:,1:] != ordered[:,:-1]
+    pos = np.flatnonzero(starts.ravel())
+    runs = np.diff(np.append(pos, ordered.size))
+    return np.bincount(pos // ncols, weights=runs ** 3 - runs, minlength=nrows)
+
+# apply statistical test between column groups to every row of matrix, as matR sigtest
+# returns struct of group 'levels' (sorted), per row group 'mean' and 'sd' (rows x levels),
+# and test 'statistic' and 'p' arrays, two group tests compare the first level to the second
+#  't-test-unpaired' is Welch's t-test, 't-test-paired' pairs group members in column order,
+#  'Mann-Whitney-unpaired-Wilcoxon' reports W, exact p for rows without ties when both
+#  groups are under 50, else normal approximation with continuity correction as R wilcox.test
+def group_test(matrix, groups, test='Kruskal-Wallis'):
+    from scipy import stats
+    if test not in GROUP_TESTS:
+        raise ValueError("unknown group test '%s'"%test)
+    if sp.issparse(matrix):
+        matrix = matrix.toarray()
+    matrix = np.asarray(matrix, dtype=np.float64)
+    levels = sorted(set(groups))
+    member = np.array([[g == l for g in groups] for l in levels])
+    sizes = member.sum(axis=1)
+    mean = matrix.dot(member.T) / sizes
+    # sum of squared deviations from the group mean, one group at a time to bound memory
+    sqdev = np.empty_like(mean)
+    for k in range(len(levels)):
+        sqdev[:,k] = ((matrix[:,member[k]] - mean[:,k,None]) ** 2).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = sqdev / (sizes - 1)
+        result = {'levels': levels, 'mean': mean, 'sd': np.sqrt(var)}
+        if test == 'ANOVA-one-way':
+            total = matrix.shape[1]
+            between = (sizes * (mean - matrix.mean(axis=1)[:,None]) ** 2).sum(axis=1)
+            within = sqdev.sum(axis=1)
+            stat = (between / (len(levels) - 1)) / (within / (total - len(levels)))
+            result['statistic'], result['p'] = stat, stats.f.sf(stat, len(levels) - 1, total - len(levels))
+            return result
+        if test == 'Kruskal-Wallis':
+            total = matrix.shape[1]
+            ranks = stats.rankdata(matrix, axis=1)
+            ranksum = ranks.dot(member.T)
+            stat = 12 * (ranksum ** 2 / sizes).sum(axis=1) / (total * (total + 1)) - 3 * (total + 1)
+            stat /= 1 - _tie_sums(matrix) / (total ** 3 - total)
+            result['statistic'], result['p'] = stat, stats.chi2.sf(stat, len(levels) - 1)
+            return result
+        if len(levels) != 2:
+            raise ValueError("test '%s' needs exactly 2 groups"%test)
+        first, second = matrix[:,member[0]], matrix[:,member[1]]
+        if test == 't-test-unpaired':
+            err = var[:,0] / sizes[0] + var[:,1] / sizes[1]
+            stat = (mean[:,0] - mean[:,1]) / np.sqrt(err)
+            df = err ** 2 / ((var[:,0] / sizes[0]) ** 2 / (sizes[0] - 1) + (var[:,1] / sizes[1]) ** 2 / (sizes[1] - 1))
+            result['statistic'], result['p'] = stat, 2 * stats.t.sf(np.abs(stat), df)
+            return result
+        if test == 't-test-paired':
+            if sizes[0] != sizes[1]:
+                raise ValueError("test '%s' needs groups of equal size"%test)
+            diff = first - second
+            stat = diff.mean(axis=1) / (diff.std(axis=1, ddof=1) / np.sqrt(sizes[0]))
+            result['statistic'], result['p'] = stat, 2 * stats.t.sf(np.abs(stat), sizes[0] - 1)
+            return result
+    # Mann-Whitney
+    stat = np.full(matrix.shape[0], np.nan)
+    pval = np.full(matrix.shape[0], np.nan)
+    exact = (_tie_sums(matrix) == 0) & (sizes[0] < 50) & (sizes[1] < 50)
+    for method, rows in (('exact', exact), ('asymptotic', ~exact)):
+        if rows.any():
+            found = stats.mannwhitneyu(first[rows], second[rows], axis=1, method=method, use_continuity=True)
+            stat[rows], pval[rows] = found.statistic, found.pvalue
+    result['statistic'], result['p'] = stat, pval
+    return result
@@ -1,6 +1,6 @@
 group_stats_plot <- function(
-                         file_in = "",
-                         file_out = "",
+                         file_in = "", # filename, or matrix of abundances
+                         file_out = "", # filename, or NULL to only return the ordered summary
                          append_group_headers=FALSE,
                          figure_out = NULL, # give a name and it will produce a file
                          figure_width_in=6,
@@ -69,17 +69,21 @@ group_stats_plot <- function(
   }
 
 # import data
-  my_data <- read.table(
-                        file_in,
-                        header=TRUE,
-                        stringsAsFactors=FALSE,
-                        sep="\t",
-                        comment.char="",
-                        quote="",
-                        check.names=FALSE,
-                        row.names=1,
-                        skip=group_lines
-                        )
+  if ( is.character(file_in) ){
+    my_data <- read.table(
+                          file_in,
+                          header=TRUE,
+                          stringsAsFactors=FALSE,
+                          sep="\t",
+                          comment.char="",
+                          quote="",
+                          check.names=FALSE,
+                          row.names=1,
+                          skip=group_lines
+                          )
+  }else{ # matrix already in memory
+    my_data <- as.data.frame(file_in, stringsAsFactors=FALSE)
+  }
 
 # get dimensions of the data
   my_data.n_rows <- nrow(my_data)
@@ -157,7 +161,9 @@ group_stats_plot <- function(
   my_stats.summary.ordered <- my_stats.summary[ order(my_stats.summary[,order_by], decreasing=order_decreasing), ]
 
 # flat file output of the summary file
-  write.table(my_stats.summary.ordered, file = file_out, col.names=NA, sep="\t", quote=FALSE)
+  if ( !is.null(file_out) ){
+    write.table(my_stats.summary.ordered, file = file_out, col.names=NA, sep="\t", quote=FALSE)
+  }
 
 # create a subselection of the data above based on selected number of categories
   my_stats.summary.ordered.subset <- as.matrix(my_stats.summary.ordered[1:my_n,])
@@ -182,7 +188,7 @@ group_stats_plot <- function(
     split.screen(c(1,2))
     screen(1)
     text( x=0.5, y=0.9 ,labels=paste(
-                        "file in:  ",file_in, "\n",
+                        "file in:  ",if (is.character(file_in)) file_in else "(matrix)", "\n",
                         "file out: ",file_out, "\n",
                         "sorted by output column ", order_by, ", \"",colnames(my_stats.summary.ordered)[order_by], "\"", "\n",
                         "Number of categories: ", my_n,
@@ -199,4 +205,6 @@ group_stats_plot <- function(
   
     dev.off()
   }
+
+  invisible(as.matrix(my_stats.summary.ordered))
 }
@@ -0,0 +1,239 @@
+"""incremental JSON parsing from a file handle or HTTP response
+
+Objects are walked key by key and arrays element by element, each element
+being decoded whole, so only the largest single array element (one BIOM row
+or data entry) and one read chunk need to be held as text at any time.
+"""
+import json
+import codecs
+
+CHUNK_SIZE = 1024 * 1024
+WHITESPACE = ' \t\n\r'
+# characters that may continue a JSON number
+NUMBER_CHARS = '0123456789.eE+-'
+
+class JsonStream(object):
+    def __init__(self, handle, encoding='utf8', chunk_size=CHUNK_SIZE):
+        self.handle = handle
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.chunk_size = chunk_size
+        self.decode = json.JSONDecoder().raw_decode
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0  # characters dropped from front of buffer
+        self.eof = False
+
+    # read more input into buffer, returns False at end of input
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        if self.pos > 0:
+            self.offset += self.pos
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.handle.read(max(size or 0, self.chunk_size))
+        if not chunk:
+            self.eof = True
+            self.buf += self.decoder.decode(b'', final=True)
+            return False
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk)
+        self.buf += chunk
+        return True
+
+    # character position of next unparsed input
+    def tell(self):
+        return self.offset + self.pos
+
+    # return next non-whitespace character without consuming it, '' at end
+    def peek(self):
+        while True:
+            while (self.pos < len(self.buf)) and (self.buf[self.pos] in WHITESPACE):
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("expected '%s' at position %d" %(char, self.tell()))
+        self.pos += 1
+
+    @staticmethod
+    def _is_number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    # decode one complete JSON value
+    def read_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decode(self.buf, self.pos)
+                # a number is complete only once a character that cannot continue it follows,
+                # otherwise it may go on in the next chunk (1. + 25)
+                if self.eof or ((end < len(self.buf)) and not (self._is_number(value) and (self.buf[end] in NUMBER_CHARS))):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            # grow geometrically so large values are re-scanned a bounded number of times
+            self._fill(len(self.buf) - self.pos)
+
+    # iterate over keys of an object, caller must consume each value
+    def iter_object(self):
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError("expected ',' or '}' at position %d" %(self.tell() - 1))
+
+    # iterate over elements of an array, each decoded whole
+    def iter_array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value()
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError("expected ',' or ']' at position %d" %(self.tell() - 1))
+
+    # decode next value, walking objects and arrays so no large text copy is held
+    def load(self):
+        char = self.peek()
+        if char == '{':
+            obj = {}
+            for key in self.iter_object():
+                obj[key] = self.load()
+            return obj
+        if char == '[':
+            return list(self.iter_array())
+        return self.read_value()
+
+# return python struct decoded incrementally from handle
+def load(handle, encoding='utf8'):
+    return JsonStream(handle, encoding=encoding).load()
+
+# iterate over a BIOM document from handle without building it
+#  yields ('rows', row) and ('data', entry) for each array element,
+#  and (key, value) for every other field, an API 'data' envelope is unwrapped
+def iter_biom(handle, encoding='utf8'):
+    stream = JsonStream(handle, encoding=encoding)
+    for item in _iter_biom_object(stream):
+        yield item
+
+def _iter_biom_object(stream):
+    for key in stream.iter_object():
+        char = stream.peek()
+        if (key == 'data') and (char == '{'):
+            for item in _iter_biom_object(stream):
+                yield item
+        elif (key in ('rows', 'data')) and (char == '['):
+            for element in stream.iter_array():
+                yield key, element
+        else:
+            yield key, stream.read_value()
+
+# byte offset index of a BIOM JSON document, handle must be opened in binary mode
+#  'fields': key -> [start, end] of every top-level field other than rows and data
+#  'rows': [start, end] of every row
+#  'blocks': [start, end, first, count, min, max] for each block of data entries,
+#    first / count are entry positions (rows of a dense matrix), min / max the
+#    lowest and highest row index found in the block (entries of a sparse matrix)
+def index_biom(handle, block=1024):
+    # latin-1 maps every byte to one character, so character positions are byte offsets
+    stream = JsonStream(handle, encoding='latin-1')
+    index = {'fields': {}, 'rows': [], 'blocks': []}
+    _index_biom_object(stream, index, block)
+    return index
+
+def _index_biom_object(stream, index, block):
+    for key in stream.iter_object():
+        char = stream.peek()
+        if (key == 'data') and (char == '{'):
+            _index_biom_object(stream, index, block)
+        elif (key == 'rows') and (char == '['):
+            for start, end, value in _iter_spans(stream):
+                index['rows'].append([start, end])
+        elif (key == 'data') and (char == '['):
+            current = None
+            for start, end, value in _iter_spans(stream):
+                row = value[0] if value and isinstance(value[0], int) else -1
+                if current and (current[3] < block):
+                    current[1] = end
+                    current[3] += 1
+                    current[4] = min(current[4], row)
+                    current[5] = max(current[5], row)
+                else:
+                    if current:
+                        index['blocks'].append(current)
+                    first = (current[2] + current[3]) if current else 0
+                    current = [start, end, first, 1, row, row]
+            if current:
+                index['blocks'].append(current)
+        else:
+            start = stream.tell()
+            stream.read_value()
+            index['fields'][key] = [start, stream.tell()]
+
+# iterate over elements of an array as (start, end, value)
+def _iter_spans(stream):
+    stream.expect('[')
+    if stream.peek() == ']':
+        stream.pos += 1
+        return
+    while True:
+        stream.peek()
+        start = stream.tell()
+        value = stream.read_value()
+        yield start, stream.tell(), value
+        char = stream.peek()
+        stream.pos += 1
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError("expected ',' or ']' at position %d" %(stream.tell() - 1))
+
+# BIOM struct holding only rows row_start to row_end (exclusive, None for all),
+# read in one streaming pass without building the full document
+def window_biom(handle, row_start=0, row_end=None, encoding='utf8'):
+    def in_window(r):
+        return (r >= row_start) and ((row_end is None) or (r < row_end))
+    biom = {}
+    rows, sparse, dense = [], [], []
+    nrows = ndata = 0
+    for key, value in iter_biom(handle, encoding=encoding):
+        if key == 'rows':
+            if in_window(nrows):
+                rows.append(value)
+            nrows += 1
+        elif key == 'data':
+            # matrix_type may come later in the document, keep candidates for both layouts
+            mtype = biom.get('matrix_type')
+            if (mtype != 'dense') and value and isinstance(value[0], int) and in_window(value[0]):
+                sparse.append([value[0] - row_start] + value[1:])
+            if (mtype != 'sparse') and in_window(ndata):
+                dense.append(value)
+            ndata += 1
+        else:
+            biom[key] = value
+    biom['rows'] = rows
+    biom['data'] = sparse if biom.get('matrix_type') == 'sparse' else dense
+    if 'columns' in biom:
+        biom['shape'] = [len(rows), len(biom['columns'])]
+    return biom
@@ -1,16 +1,22 @@
 from __future__ import print_function
+import io
 import os
 import sys
 import time
 import copy
+import codecs
 import base64
 import json
 import string
 import time
 import random
 import hashlib
+import heapq
 import subprocess
+import threading
 import requests
+import numpy as np
+from requests.adapters import HTTPAdapter
 from requests_toolbelt import MultipartEncoder
 
 try:  # python3
@@ -23,6 +29,8 @@ except ImportError:  # python2
     from urllib2 import urlopen, Request, HTTPError
 
 from .__init__ import API_URL
+from . import jsonstream
+from .biom import Biom, triples_to_csr, is_bundle, is_hdf5
 
 if not sys.version_info[0:2][0] == 3 and not sys.version_info[0:2] == (2, 7) :
     sys.stderr.write('ERROR: MG-RAST Tools requires at least Python 2.7.')
@@ -33,8 +41,30 @@ if not sys.version_info[0:2][0] == 3 and not sys.version_info[0:2] == (2, 7) :
 
 auth_file = os.path.join(os.path.expanduser('~'), ".mgrast_auth")
 
+# connection pool settings, number of keep-alive connections kept per host
+POOL_SIZE = int(os.environ.get('MGRAST_POOL_SIZE', 10))
+
+_session = None
+_session_lock = threading.Lock()
+
+# return process-wide HTTP session with keep-alive connection pool
+def get_session(pool_size=None):
+    global _session, POOL_SIZE
+    with _session_lock:
+        if pool_size and (pool_size != POOL_SIZE):
+            POOL_SIZE = pool_size
+            if _session:
+                _session.close()
+                _session = None
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+    return _session
+
 # return response body from MG-RAST or Shock API
-def body_from_url(url, accept, auth=None, data=None, debug=False, method=None):
+def body_from_url(url, accept, auth=None, data=None, debug=False, method=None, headers=None):
     header = {'Accept': accept}
     scriptname = os.path.basename(sys.argv[0])
     header['User-Agent'] = 'mglib:' + scriptname
@@ -42,58 +72,80 @@ def body_from_url(url, accept, auth=None, data=None, debug=False, method=None):
         header['Authorization'] = 'mgrast '+auth
     if data or method:
         header['Content-Type'] = 'application/json'
+    if headers:
+        header.update(headers)
     if debug:
         if data:
             print("data:\t"+repr(data))
         print("header:\t"+json.dumps(header))
         print("url:\t"+url)
-    try:
-        print("Making request "+url, file=sys.stderr)
-        req = Request(url, data, headers=header)
-        if method:
-            req.get_method = lambda: method
-        res = urlopen(req)
-    except HTTPError as error:
+    if not method:
+        method = 'POST' if data else 'GET'
+    print("Making request "+url, file=sys.stderr)
+    res = get_session().request(method, url, data=data, headers=header, stream=True)
+    if res.status_code >= 400:
         if debug:
             sys.stderr.write("URL: %s\n" %url)
+        content = res.content
         try:
-            eobj = json.loads(error.read().decode("utf8"))
+            eobj = json.loads(content.decode("utf8"))
             if 'ERROR' in eobj:
-                sys.stderr.write("ERROR (%s): %s\n" %(error.code, eobj['ERROR']))
+                sys.stderr.write("ERROR (%s): %s\n" %(res.status_code, eobj['ERROR']))
             elif 'error' in eobj:
-                sys.stderr.write("ERROR (%s): %s\n" %(error.code, eobj['error'][0]))
+                sys.stderr.write("ERROR (%s): %s\n" %(res.status_code, eobj['error'][0]))
         except:
-            sys.stderr.write("ERROR (%s): %s\n" %(error.code, error.read().decode("utf8")))
+            sys.stderr.write("ERROR (%s): %s\n" %(res.status_code, content.decode("utf8", "replace")))
         finally:
-            raise(HTTPerror)
-    if not res:
-        sys.stderr.write("ERROR: no results returned\n")
-        sys.exit(1)
-    return res
+            raise HTTPError(url, res.status_code, res.reason, res.headers, None)
+    # file-like raw stream, connection returns to pool once body is read
+    res.raw.decode_content = True
+    return res.raw
+
+# JSON responses larger than this (by Content-Length) are decoded incrementally from the socket,
+# smaller ones are read whole and decoded with json.loads, which is faster
+STREAM_JSON_SIZE = int(os.environ.get('MGRAST_STREAM_JSON_SIZE', 16 * 1024 * 1024))
+
+# True if response body should be left on the socket for incremental decoding
+def _stream_response(result, stream=None):
+    content_type = result.headers.get("content-type", "")
+    if (content_type in ("application/x-download", "application/octet-stream")) or (content_type[0:9] == "text/html"):
+        return False
+    if stream is not None:
+        return stream
+    try:
+        return int(result.headers.get("content-length", 0)) > STREAM_JSON_SIZE
+    except ValueError:
+        return False
+
+# decode API response, body is the read bytes or, when streamed, the response itself
+def _decode_response(result, body):
+    content_type = result.headers.get("content-type", "")
+    if content_type == "application/x-download" or content_type == "application/octet-stream":
+        return body   # Watch out!
+    if content_type[0:9] == "text/html":  # json decoder won't work
+        return body   # Watch out!
+    if type(body) is bytes:
+        return json.loads(body.decode("utf8"))
+    return jsonstream.load(body)
 
 # return python struct from JSON output of MG-RAST or Shock API
-def obj_from_url(url, auth=None, data=None, debug=False, method=None):
+#  stream: decode the body incrementally (True), read it whole (False), or decide by size (None)
+def obj_from_url(url, auth=None, data=None, debug=False, method=None, stream=None):
     url = quote(url, safe='/:=?&', encoding="utf-8", errors="strict")
     if type(data) is str:
         data=data.encode("utf8")
+    # only the request and transfer are retried, a malformed body is not re-requested
     try:
         result = body_from_url(url, 'application/json', auth=auth, data=data, debug=debug, method=method)
-        read = result.read()
+        body = result if _stream_response(result, stream) else result.read()
     except:  # try one more time  ConnectionResetError is incompatible with python2
         result = body_from_url(url, 'application/json', auth=auth, data=data, debug=debug, method=method)
-        read = result.read()
-    if result.headers["content-type"] == "application/x-download" or result.headers["content-type"] == "application/octet-stream":
-        return(read)   # Watch out!
-    if result.headers["content-type"][0:9] == "text/html":  # json decoder won't work
-        return(read)   # Watch out!
-    if result.headers["content-type"] == "application/json":  # If header is set, this should work 
-        data = read.decode("utf8")
-        obj = json.loads(data)
-    else:
-        data = read.decode("utf8")
-        obj = json.loads(data)
+        body = result if _stream_response(result, stream) else result.read()
+    obj = _decode_response(result, body)
+    if type(obj) is bytes:
+        return(obj)   # Watch out!
     if obj is None:
-        sys.stderr.write("ERROR: return structure not valid json format\n" + repr(data))
+        sys.stderr.write("ERROR: return structure not valid json format\n")
         sys.exit(1)
     if len(list(obj.keys())) == 0:
         if debug:
@@ -111,25 +163,250 @@ def obj_from_url(url, auth=None, data=None, debug=False, method=None):
         sys.exit(1)
     return obj
 
+# iterate over BIOM output of MG-RAST API without building the whole document
+#  yields ('rows', row), ('data', entry), or (key, value) for other fields
+def iter_biom_from_url(url, auth=None, data=None, debug=False):
+    url = quote(url, safe='/:=?&', encoding="utf-8", errors="strict")
+    if type(data) is str:
+        data=data.encode("utf8")
+    result = body_from_url(url, 'application/json', auth=auth, data=data, debug=debug)
+    return jsonstream.iter_biom(result)
+
+# local cache of idempotent API GET responses
+#  MGRAST_CACHE: 'on' (default), 'off', or 'offline' (never touch the network)
+CACHE_MODE = os.environ.get('MGRAST_CACHE', 'on')
+CACHE_DIR  = os.environ.get('MGRAST_CACHE_DIR', os.path.join(os.path.expanduser('~'), ".mgrast_cache"))
+CACHE_SIZE = int(os.environ.get('MGRAST_CACHE_SIZE', 512 * 1024 * 1024))  # bytes
+# time to live in seconds by API path, first match wins
+CACHE_TTL = [ ('/m5nr/', 7 * 86400),
+              ('/metagenome/', 86400),
+              ('/project/', 86400),
+              ('/download/', 86400) ]
+CACHE_TTL_DEFAULT = 3600
+
+# return cache file path for url within auth scope
+def _cache_path(url, auth=None):
+    scope = hashlib.sha256((auth or '').encode('utf8')).hexdigest()
+    key = hashlib.sha256((scope + '\t' + url).encode('utf8')).hexdigest()
+    return os.path.join(CACHE_DIR, key[:2], key + '.json')
+
+# return time to live in seconds for url
+def cache_ttl(url):
+    path = urlparse(url).path
+    for prefix, ttl in CACHE_TTL:
+        if prefix in path:
+            return ttl
+    return CACHE_TTL_DEFAULT
+
+# return cached python struct for url, or None if missing or expired
+def cache_get(url, auth=None, ttl=None):
+    cfile = _cache_path(url, auth)
+    try:
+        stat = os.stat(cfile)
+    except OSError:
+        return None
+    if ttl is None:
+        ttl = cache_ttl(url)
+    if (CACHE_MODE != 'offline') and (time.time() - stat.st_mtime > ttl):
+        return None
+    try:
+        with open(cfile, 'r') as hdl:
+            obj = json.load(hdl)
+    except:
+        return None
+    # access time orders eviction, modify time is the fetch time
+    try:
+        os.utime(cfile, (time.time(), stat.st_mtime))
+    except OSError:
+        pass
+    return obj
+
+# bytes used by each cache directory, walked once per process then kept as a running total
+_cache_usage = {}
+_cache_lock = threading.Lock()
+
+# list cache entries as (access time, size, path), returns (entries, total size)
+#  entries removed meanwhile by another process are skipped
+def _cache_entries():
+    entries = []
+    total = 0
+    for root, dirs, files in os.walk(CACHE_DIR):
+        for f in files:
+            try:
+                stat = os.stat(os.path.join(root, f))
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, os.path.join(root, f)))
+            total += stat.st_size
+    return entries, total
+
+# store python struct for url, evicting least recently used entries over CACHE_SIZE
+#  the cache is only walked and pruned when the running total goes over the limit
+def cache_put(url, obj, auth=None):
+    cfile = _cache_path(url, auth)
+    cdir = os.path.dirname(cfile)
+    if not os.path.isdir(cdir):
+        try:
+            os.makedirs(cdir)
+        except OSError:
+            if not os.path.isdir(cdir):
+                raise
+    tmp = cfile + '.' + random_str()
+    with open(tmp, 'w') as hdl:
+        json.dump(obj, hdl, separators=(',',':'))
+    try:
+        old_size = os.path.getsize(cfile)
+    except OSError:
+        old_size = 0
+    new_size = os.path.getsize(tmp)
+    os.rename(tmp, cfile)
+    with _cache_lock:
+        if CACHE_DIR not in _cache_usage:
+            _cache_usage[CACHE_DIR] = _cache_entries()[1]
+        else:
+            _cache_usage[CACHE_DIR] += new_size - old_size
+        if _cache_usage[CACHE_DIR] <= CACHE_SIZE:
+            return
+        # other processes may share the cache, recount before evicting
+        entries, total = _cache_entries()
+        for atime, size, path in sorted(entries):
+            if total <= CACHE_SIZE:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # already evicted by another process
+            total -= size
+        _cache_usage[CACHE_DIR] = total
+
+# return python struct from JSON output of MG-RAST API GET, using local cache
+def cached_obj_from_url(url, auth=None, debug=False, ttl=None):
+    if CACHE_MODE == 'off':
+        return obj_from_url(url, auth=auth, debug=debug)
+    obj = cache_get(url, auth=auth, ttl=ttl)
+    if obj is not None:
+        if debug:
+            print("cache hit:\t"+url)
+        return obj
+    if CACHE_MODE == 'offline':
+        sys.stderr.write("ERROR: %s not in cache, offline mode\n" %url)
+        sys.exit(1)
+    obj = obj_from_url(url, auth=auth, debug=debug)
+    if isinstance(obj, (dict, list)):
+        cache_put(url, obj, auth=auth)
+    return obj
+
+# read size in bytes for streaming downloads
+BUFFER_SIZE = 1024 * 1024
+
 # print to file results of MG-RAST or Shock API
-def file_from_url(url, handle, auth=None, data=None, debug=False, sha1=False):
+#  bytes are copied unchanged, text handles are written through their binary buffer
+#  returns sha1 hexdigest, or md5 hexdigest if md5 set, or (sha1, md5) if both
+def file_from_url(url, handle, auth=None, data=None, debug=False, sha1=False, md5=False, buffer_size=BUFFER_SIZE):
     result = body_from_url(url, 'text/plain', auth=auth, data=data, debug=debug)
     sha1hash = hashlib.sha1()
+    md5hash = hashlib.md5()
+    if isinstance(handle, io.TextIOBase) and hasattr(handle, 'buffer'):
+        handle.flush()
+        write = handle.buffer.write
+    elif isinstance(handle, io.TextIOBase):
+        # in-memory text handle, decode keeping characters split across reads intact
+        decoder = codecs.getincrementaldecoder('utf8')()
+        write = lambda b: handle.write(decoder.decode(bytes(b)))
+    else:
+        write = handle.write
+    hashes = []
+    if sha1:
+        hashes.append(sha1hash)
+    if md5:
+        hashes.append(md5hash)
+    _copy_stream(result, write, hashes, buffer_size)
+    if sha1 and md5:
+        return sha1hash.hexdigest(), md5hash.hexdigest()
+    return md5hash.hexdigest() if md5 else sha1hash.hexdigest()
+
+# copy response body to write function through one reused buffer, updating hashes
+# returns number of bytes copied
+def _copy_stream(result, write, hashes=[], buffer_size=BUFFER_SIZE):
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    total = 0
     while True:
-        chunk = result.read(8192)
-        if not chunk:
+        size = result.readinto(buf)
+        if not size:
             break
-        if sha1:
-            sha1hash.update(chunk)
-        handle.write(chunk.decode('utf8'))
-    return sha1hash.hexdigest()
+        chunk = view[:size]
+        for h in hashes:
+            h.update(chunk)
+        write(chunk)
+        total += size
+    return total
+
+# return md5 hexdigest of local file
+def file_md5(filename, buffer_size=BUFFER_SIZE):
+    md5hash = hashlib.md5()
+    with open(filename, 'rb') as hdl:
+        for block in iter(lambda: hdl.read(buffer_size), b''):
+            md5hash.update(block)
+    return md5hash.hexdigest()
+
+# download MG-RAST or Shock file to path, resuming from an earlier partial download
+#  skipped if path already has given md5, data is kept in path.part until complete
+#  returns number of bytes transferred, or None if checksum does not match
+def download_file(url, path, auth=None, md5=None, size=None, debug=False, buffer_size=BUFFER_SIZE):
+    if md5 and os.path.isfile(path) and (file_md5(path, buffer_size) == md5):
+        return 0
+    part = path + '.part'
+    offset = os.path.getsize(part) if os.path.isfile(part) else 0
+    if size and (offset > size):
+        offset = 0
+    md5hash = hashlib.md5()
+    if offset:
+        with open(part, 'rb') as hdl:
+            for block in iter(lambda: hdl.read(buffer_size), b''):
+                md5hash.update(block)
+    total = 0
+    if (not size) or (offset < size):
+        try:
+            result = body_from_url(url, 'text/plain', auth=auth, debug=debug, headers={'Range': 'bytes=%d-'%offset} if offset else None)
+        except HTTPError:
+            if not offset:
+                raise
+            # range not satisfiable, start over
+            offset = 0
+            md5hash = hashlib.md5()
+            result = body_from_url(url, 'text/plain', auth=auth, debug=debug)
+        if offset and (result.status != 206):
+            # server sent whole file
+            offset = 0
+            md5hash = hashlib.md5()
+        with open(part, 'ab' if offset else 'wb') as hdl:
+            total = _copy_stream(result, hdl.write, [md5hash], buffer_size)
+    if md5 and (md5hash.hexdigest() != md5):
+        os.remove(part)
+        sys.stderr.write("ERROR: checksum mismatch for %s\n" %path)
+        return None
+    os.rename(part, path)
+    return total
 
 # print to stdout results of MG-RAST API
 def stdout_from_url(url, auth=None, data=None, debug=False):
     file_from_url(url, sys.stdout, auth=auth, data=data, debug=debug)
 
-# return python struct from JSON output of asynchronous MG-RAST API
-def async_rest_api(url, auth=None, data=None, debug=False, delay=60):
+# bounds in seconds of polling interval for asynchronous MG-RAST API calls
+POLL_FLOOR = float(os.environ.get('MGRAST_POLL_FLOOR', 1))
+POLL_CEILING = float(os.environ.get('MGRAST_POLL_CEILING', 60))
+
+# generate polling delays: exponential backoff with jitter, kept within floor and ceiling
+def poll_delays(floor=POLL_FLOOR, ceiling=POLL_CEILING, factor=2, jitter=0.25):
+    delay = min(floor, ceiling)
+    while True:
+        yield min(ceiling, max(floor, delay * random.uniform(1 - jitter, 1 + jitter)))
+        delay = min(ceiling, delay * factor)
+
+# submit asynchronous MG-RAST API call
+# returns (result, None) when done, or (None, status url) to poll
+def _async_submit(url, auth=None, data=None, debug=False):
     try:
         parameters = parse_qs(url.split("?")[1])
         assert "asynchronous" in parameters, "Must specify asynchronous=1 for asynchronous call!"
@@ -140,24 +417,27 @@ def async_rest_api(url, auth=None, data=None, debug=False, delay=60):
 # assume this is not an asynchronous call and it's done.
     if type(submit) == bytes:   # can't decode
         try: 
-            return decode("utf-8", submit)
+            return decode("utf-8", submit), None
         except:
-            return submit
+            return submit, None
     if ('status' in submit) and (submit['status'] != 'submitted') and (submit['status'] != "processing") and ('data' in submit):
-        return submit
+        return submit, None
     if not ('url' in submit.keys()):
-        return submit
+        return submit, None
 #    if not (('status' in submit) and (submit['status'] == 'submitted') and ('url' in submit)):
 #        return submit  # No status, no url and no submitted
-    result = obj_from_url(submit['url'], auth=auth, debug=debug)
+    return None, submit['url']
+
+# true if asynchronous MG-RAST API result is still being computed
+def _async_pending(result):
+    if type(result) is bytes:
+        return False
+    return ('status' in result.keys()) and (result['status'] == 'submitted' or result['status'] == "processing")
+
+# return python struct from finished asynchronous MG-RAST API result
+def _async_result(url, result):
     if type(result) is bytes:
         return(result)
-    if 'status' in result.keys():
-        while result['status'] == 'submitted' or result['status'] == "processing":
-            if debug:
-                print("waiting %d seconds ..."%delay)
-            time.sleep(delay)
-            result = obj_from_url(submit['url'], auth=auth, debug=debug)
     if 'url' in result.keys() or 'next' in result.keys(): # does not need to wait
         return(result)
     try:
@@ -176,31 +456,98 @@ def async_rest_api(url, auth=None, data=None, debug=False, delay=60):
         return result
     return result['data']
 
+# return python struct from JSON output of asynchronous MG-RAST API
+# status is polled quickly at first, backing off from floor up to delay seconds
+def async_rest_api(url, auth=None, data=None, debug=False, delay=POLL_CEILING, floor=POLL_FLOOR):
+    result, status_url = _async_submit(url, auth=auth, data=data, debug=debug)
+    if status_url is None:
+        return result
+    result = obj_from_url(status_url, auth=auth, debug=debug)
+    for wait in poll_delays(floor, delay):
+        if not _async_pending(result):
+            break
+        if debug:
+            print("waiting %.1f seconds ..."%wait)
+        time.sleep(wait)
+        result = obj_from_url(status_url, auth=auth, debug=debug)
+    return _async_result(url, result)
+
+# submit many asynchronous MG-RAST API calls and poll them all from one loop
+# at most 'workers' calls are outstanding at once, default is all
+# yields (index of url, result) as each result becomes ready
+def async_rest_api_many(urls, auth=None, data=None, debug=False, delay=POLL_CEILING, floor=POLL_FLOOR, workers=None):
+    queue = list(range(len(urls)))
+    waiting = []  # heap of (next poll time, index, status url, delay generator)
+    while queue or waiting:
+        while queue and ((not workers) or (len(waiting) < workers)):
+            i = queue.pop(0)
+            result, status_url = _async_submit(urls[i], auth=auth, data=data, debug=debug)
+            if status_url is None:
+                yield i, result
+            else:
+                heapq.heappush(waiting, (time.time(), i, status_url, poll_delays(floor, delay)))
+        if not waiting:
+            continue
+        next_time, i, status_url, delays = heapq.heappop(waiting)
+        wait = next_time - time.time()
+        if wait > 0:
+            if debug:
+                print("waiting %.1f seconds ..."%wait)
+            time.sleep(wait)
+        result = obj_from_url(status_url, auth=auth, debug=debug)
+        if _async_pending(result):
+            heapq.heappush(waiting, (time.time() + next(delays), i, status_url, delays))
+        else:
+            yield i, _async_result(urls[i], result)
+
+# file reader that updates md5 with every byte read through it
+class _HashingReader(object):
+    def __init__(self, handle):
+        self.handle = handle
+        self.md5 = hashlib.md5()
+    def read(self, size=-1):
+        chunk = self.handle.read(size)
+        self.md5.update(chunk)
+        return chunk
+    def fileno(self):
+        return self.handle.fileno()
+    def tell(self):
+        return self.handle.tell()
+    def close(self):
+        self.handle.close()
+
 # POST file to MG-RAST or Shock
-def post_file(url, keyname, filename, data={}, auth=None, debug=False):
+#  if md5 is set, returns (result, md5 hexdigest of the file computed while sending it)
+#  tries is the number of attempts, callers retrying on their own pass tries=1
+def post_file(url, keyname, filename, data={}, auth=None, debug=False, md5=False, tries=3):
 
     if debug:
         print("post_file", url)
-    data[keyname] = (os.path.basename(filename), open(filename, 'rb'))
-    datagen = MultipartEncoder(data)
-    header = {"Content-Type": datagen.content_type}
+    header = {}
     if auth:
         header['Authorization'] = 'mgrast '+auth
-    if debug:
-        print("data:\t"+repr(data))
-        print("header:\t"+repr(header))
-        print("url:\t"+url)
 
     success = False
     sleep   = 60
-    maxt    = 3
+    maxt    = tries
     counter = 0
     obj     = None
+    reader  = None
 
-    # try maxt times
+    # try maxt times, file is re-read for each try
     while not success and counter < maxt :
+        reader = _HashingReader(open(filename, 'rb'))
+        fields = dict(data)
+        fields[keyname] = (os.path.basename(filename), reader)
+        datagen = MultipartEncoder(fields)
+        header["Content-Type"] = datagen.content_type
+        if debug:
+            print("data:\t"+repr(fields))
+            print("header:\t"+repr(header))
+            print("url:\t"+url)
+        res = None
         try:
-            res = requests.post(url, data=datagen, headers=header, stream=True)
+            res = get_session().post(url, data=datagen, headers=header, stream=True)
         except HTTPError as error:
             try:
                 eobj = json.loads(error.read())
@@ -212,10 +559,12 @@ def post_file(url, keyname, filename, data={}, auth=None, debug=False):
                 sys.stderr.write("ERROR (%s): %s\n" %(error.code, error.read()))
             finally:
                 # sys.exit(1)
-                return None
+                reader.close()
+                return (None, None) if md5 else None
         except OSError as error: 
             sys.stderr.write("ERROR with post_file\n")
-            sys.stderr.write("ERROR (%s): %s\n" %(error.code, error.read()))
+            sys.stderr.write("ERROR: %s\n" %error)
+        reader.close()
         if not res:
             sys.stderr.write("ERROR: no results returned for %s\n"% (filename))
             # sys.exit(1)
@@ -230,9 +579,149 @@ def post_file(url, keyname, filename, data={}, auth=None, debug=False):
         # increase counter
         if not success :
             counter += 1
-            time.sleep(counter * sleep)
+            if counter < maxt:
+                time.sleep(counter * sleep)
+    if md5:
+        return obj, (reader.md5.hexdigest() if success else None)
     return(obj)
 
+# chunked uploads to Shock: size of each part, parts sent at once, tries per part
+PART_SIZE    = int(os.environ.get('MGRAST_PART_SIZE', 100 * 1024 * 1024))
+PART_WORKERS = int(os.environ.get('MGRAST_PART_WORKERS', 4))
+PART_TRIES   = 5
+# completed parts of unfinished uploads are recorded here
+UPLOAD_JOURNAL_DIR = os.environ.get('MGRAST_UPLOAD_JOURNAL', os.path.join(os.path.expanduser('~'), ".mgrast_uploads"))
+
+# file reader limited to length bytes starting at offset
+class _PartReader(object):
+    def __init__(self, filename, offset, length):
+        self.handle = open(filename, 'rb')
+        self.handle.seek(offset)
+        self.len = length  # bytes left, used by MultipartEncoder
+    def read(self, size=-1):
+        if (size is None) or (size < 0) or (size > self.len):
+            size = self.len
+        chunk = self.handle.read(size)
+        self.len -= len(chunk)
+        return chunk
+    def close(self):
+        self.handle.close()
+
+# send multipart form to Shock, returns response struct or None on failure
+def _shock_request(url, fields=None, auth=None, method='POST', debug=False):
+    header = {}
+    if auth:
+        header['Authorization'] = 'mgrast '+auth
+    datagen = None
+    if fields is not None:
+        datagen = MultipartEncoder(fields)
+        header["Content-Type"] = datagen.content_type
+    if debug:
+        print(method, url)
+    try:
+        res = get_session().request(method, url, data=datagen, headers=header)
+        obj = res.json()
+    except (requests.exceptions.RequestException, ValueError) as error:
+        sys.stderr.write("ERROR: %s\n" %error)
+        return None
+    if (res.status_code >= 400) or obj.get('error'):
+        sys.stderr.write("ERROR (%s): %s\n" %(res.status_code, obj.get('error')))
+        return None
+    return obj
+
+# journal of an unfinished chunked upload, keyed by file path
+def _journal_path(filename):
+    key = hashlib.sha256(os.path.abspath(filename).encode('utf8')).hexdigest()
+    return os.path.join(UPLOAD_JOURNAL_DIR, key + '.json')
+
+# return journal if it belongs to this version of the file and part size
+def _journal_load(path, filename, part_size):
+    stat = os.stat(filename)
+    try:
+        with open(path) as hdl:
+            journal = json.load(hdl)
+    except (IOError, OSError, ValueError):
+        return None
+    if [journal.get('size'), journal.get('mtime'), journal.get('part_size')] != [stat.st_size, stat.st_mtime, part_size]:
+        return None
+    return journal
+
+# write journal to a temp file renamed into place, as cache_put does, so a reader never sees it half written
+def _journal_save(path, journal):
+    if not os.path.isdir(UPLOAD_JOURNAL_DIR):
+        try:
+            os.makedirs(UPLOAD_JOURNAL_DIR)
+        except OSError:
+            if not os.path.isdir(UPLOAD_JOURNAL_DIR):
+                raise
+    tmp = path + '.' + random_str()
+    with open(tmp, 'w') as hdl:
+        json.dump(journal, hdl)
+    os.rename(tmp, path)
+
+# POST file to Shock in parts
+#  parts are uploaded in parallel and each is retried on its own with backoff,
+#  completed parts are journaled so rerunning an interrupted upload resumes it
+#  compression is 'gzip' or 'bzip2' for shock to unpack the file once complete
+#  returns the Shock node struct as post_file does, or None on failure
+#  if md5 is set, returns (result, md5 hexdigest of the file) and hashes while uploading
+def post_file_parts(url, filename, data={}, auth=None, debug=False, md5=False, compression=None, part_size=PART_SIZE, workers=PART_WORKERS):
+    from concurrent.futures import ThreadPoolExecutor
+    size   = os.path.getsize(filename)
+    nparts = max(1, (size + part_size - 1) // part_size)
+    jpath  = _journal_path(filename)
+    journal = _journal_load(jpath, filename, part_size)
+    # node of an earlier attempt may have been removed
+    if journal and (not _shock_request(url+"/"+journal['node'], auth=auth, method='GET', debug=debug)):
+        journal = None
+    if journal:
+        sys.stderr.write("resuming upload of %s: %d of %d parts done\n" %(filename, len(journal['parts']), nparts))
+    else:
+        fields = dict(data)
+        fields.setdefault('file_name', os.path.basename(filename))
+        fields['parts'] = str(nparts)
+        if compression:
+            fields['compression'] = compression
+        result = _shock_request(url, fields, auth=auth, debug=debug)
+        if not result:
+            return (None, None) if md5 else None
+        stat = os.stat(filename)
+        journal = {'file': os.path.abspath(filename), 'size': stat.st_size, 'mtime': stat.st_mtime, 'part_size': part_size, 'node': result['data']['id'], 'parts': []}
+        _journal_save(jpath, journal)
+    node_url = url+"/"+journal['node']
+    lock = threading.Lock()
+
+    def send(part):
+        offset = (part - 1) * part_size
+        delays = poll_delays(POLL_FLOOR, POLL_CEILING)
+        for tries in range(PART_TRIES):
+            if tries:
+                time.sleep(next(delays))
+            reader = _PartReader(filename, offset, min(part_size, size - offset))
+            try:
+                result = _shock_request(node_url, {str(part): (os.path.basename(filename), reader)}, auth=auth, method='PUT', debug=debug)
+            finally:
+                reader.close()
+            if result:
+                with lock:
+                    journal['parts'].append(part)
+                    _journal_save(jpath, journal)
+                return True
+        return False
+
+    todo = [p for p in range(1, nparts+1) if p not in set(journal['parts'])]
+    with ThreadPoolExecutor(max_workers=max(1, workers) + (1 if md5 else 0)) as pool:
+        checksum = pool.submit(file_md5, filename) if md5 else None
+        sent = list(pool.map(send, todo))
+        digest = checksum.result() if md5 else None
+    if not all(sent):
+        sys.stderr.write("ERROR: %d of %d parts failed for %s, rerun to resume\n" %(sent.count(False), nparts, filename))
+        return (None, None) if md5 else None
+    result = _shock_request(node_url, auth=auth, method='GET', debug=debug)
+    if result:
+        os.remove(jpath)
+    return (result, digest) if md5 else result
+
 # safe handling of stdout for piping
 def safe_print(text):
     text = "".join([x if ord(x) < 128 else '?' for x in text])
@@ -252,51 +741,194 @@ def safe_print(text):
 
 # transform sparse matrix to dense matrix (2D array)
 def sparse_to_dense(sMatrix, rmax, cmax):
-    dMatrix = [[0 for i in range(cmax)] for j in range(rmax)]
-    for sd in sMatrix:
-        r, c, v = sd
-        dMatrix[r][c] = v
-    return dMatrix
+    return triples_to_csr(sMatrix, rmax, cmax).toarray().tolist()
+
+# row names used in tabbed table
+def biom_row_names(rows, use_id=True, hierarchy=False):
+    names = []
+    for r in rows:
+        name = r['id']
+        md = r.get('metadata') or {}
+        if hierarchy and ('hierarchy' in md):
+            h = [md['hierarchy'][level] for level in ['level1', 'level2', 'level3', 'level4', 'function'] if level in md['hierarchy']]
+            if len(h):
+                name = name + "\t" + ":".join(h)
+        if (not use_id) and ('ontology' in md):
+            name += ' : '+md['ontology'][-1]
+        names.append(name)
+    return names
+
+# iterate over BIOM matrix rows as (cell strings, max value), values formatted as given in the input
+#  sparse entries are grouped by row without building the dense matrix, missing cells are 0
+def _iter_tab_cells(biom):
+    nrows, ncols = len(biom['rows']), len(biom['columns'])
+    data = biom['data']
+    if biom['matrix_type'] != 'sparse':
+        for row in data:
+            yield [str(v) for v in row], max(row) if row else None
+        return
+    zero_row = ["0"] * ncols
+    rindex = np.fromiter((t[0] for t in data), dtype=np.int64, count=len(data))
+    # stable sort, a later duplicate entry overwrites an earlier one
+    order = np.argsort(rindex, kind='stable')
+    indptr = np.searchsorted(rindex[order], np.arange(nrows + 1)).tolist()
+    order = order.tolist()
+    for i in range(nrows):
+        entries = {}
+        for k in order[indptr[i]:indptr[i+1]]:
+            entries[data[k][1]] = data[k][2]
+        cells = list(zero_row)
+        for j, v in entries.items():
+            cells[j] = str(v)
+        values = list(entries.values())
+        if len(entries) < ncols:
+            values.append(0)
+        yield cells, max(values) if values else None
 
 # transform BIOM format to tabbed table
+# written row by row, output is buffered in blocks of about buffer_size characters
 # returns max value of matrix
-def biom_to_tab(biom, hdl, rows=None, use_id=True, col_name=False , hierarchy=False):
-    assert 'matrix_type' in biom.keys(), repr(biom)
-    if biom['matrix_type'] == 'sparse':
-        matrix = sparse_to_dense(biom['data'], biom['shape'][0], biom['shape'][1])
-    else:
-        matrix = biom['data']
+def biom_to_tab(biom, hdl, rows=None, use_id=True, col_name=False , hierarchy=False, buffer_size=BUFFER_SIZE):
     if col_name:
         hdl.write("\t%s\n" %"\t".join([c['name'] for c in biom['columns']]))
     else:
         hdl.write("\t%s\n" %"\t".join([c['id'] for c in biom['columns']]))
-    rowmax = []
-    for i, row in enumerate(matrix):
-        name = None
-        if hierarchy :
-            name = biom['rows'][i]['id']
-            h=[]
-            for level in [ 'level1' , 'level2' , 'level3' , 'level4' , 'function'] :
-                if 'hierarchy' in biom['rows'][i]['metadata'] and level in biom['rows'][i]['metadata']['hierarchy'] :
-                    h.append( biom['rows'][i]['metadata']['hierarchy'][level])
-            hs = ":".join(h)
-            if len(h) :
-                name = name + "\t" + hs    
-        else :
-            name = biom['rows'][i]['id']
-        if (not use_id) and ('ontology' in biom['rows'][i]['metadata']):
-            name += ' : '+biom['rows'][i]['metadata']['ontology'][-1]
-        if rows and (name not in rows):
-            continue
+    names = biom_row_names(biom['rows'], use_id=use_id, hierarchy=hierarchy)
+    rowmax = None
+    lines, size = [], 0
+    try:
+        for name, (cells, top) in zip(names, _iter_tab_cells(biom)):
+            if rows and (name not in rows):
+                continue
+            if (top is not None) and ((rowmax is None) or (top > rowmax)):
+                rowmax = top
+            line = "%s\t%s\n" %(name, "\t".join(cells))
+            lines.append(line)
+            size += len(line)
+            if size >= buffer_size:
+                hdl.write("".join(lines))
+                lines, size = [], 0
+        if lines:
+            hdl.write("".join(lines))
+    except:
         try:
-            rowmax.append(max(row))
-            hdl.write("%s\t%s\n" %(name, "\t".join(map(str, row))))
+            hdl.close()
         except:
-            try:
-                hdl.close()
-            except:
-                pass
-    return max(rowmax)
+            pass
+    return rowmax
+
+# load BIOM struct from JSON file, stdin ('-'), BIOM 2.1 HDF5 file, or BIOM bundle directory
+#  rows and columns select a slice or list of indices from HDF5 or bundle input
+def load_biom(path, rows=None, columns=None):
+    if (path != '-') and is_bundle(path):
+        return Biom.load_bundle(path, rows=rows, columns=columns).to_dict()
+    if (path != '-') and is_hdf5(path):
+        return Biom.load_hdf5(path, rows=rows, columns=columns).to_dict()
+    hdl = sys.stdin if path == '-' else open(path, 'r')
+    try:
+        return json.load(hdl)
+    finally:
+        if hdl is not sys.stdin:
+            hdl.close()
+
+# sidecar byte-offset index of BIOM JSON file
+BIOM_INDEX_SUFFIX = '.idx'
+BIOM_INDEX_VERSION = 1
+
+# return index of BIOM JSON file, reused from sidecar when current, else built and saved
+# returns None if there is no current index and build is False
+def biom_index(path, build=True):
+    stat = os.stat(path)
+    ipath = path + BIOM_INDEX_SUFFIX
+    try:
+        with open(ipath, 'r') as hdl:
+            index = json.load(hdl)
+        if [index.get('version'), index.get('size'), index.get('mtime')] == [BIOM_INDEX_VERSION, stat.st_size, stat.st_mtime]:
+            return index
+    except (IOError, OSError, ValueError):
+        pass
+    if not build:
+        return None
+    with open(path, 'rb') as hdl:
+        index = jsonstream.index_biom(hdl)
+    index.update({'version': BIOM_INDEX_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime})
+    try:
+        with open(ipath, 'w') as hdl:
+            json.dump(index, hdl, separators=(',',':'))
+    except (IOError, OSError):
+        sys.stderr.write("WARNING: unable to save BIOM index %s\n"%ipath)
+    return index
+
+# BIOM struct with rows row_start to row_end (exclusive, None for all) of BIOM JSON file,
+# reading only the byte ranges given by its index
+def biom_window_from_index(path, index, row_start=0, row_end=None):
+    nrows = len(index['rows'])
+    row_end = nrows if row_end is None else min(row_end, nrows)
+    with open(path, 'rb') as hdl:
+        def span(start, end):
+            hdl.seek(start)
+            return hdl.read(end - start).decode('utf8')
+        biom = dict((k, json.loads(span(*v))) for k, v in index['fields'].items())
+        rows, data = [], []
+        if row_end > row_start:
+            rows = json.loads("["+span(index['rows'][row_start][0], index['rows'][row_end-1][1])+"]")
+        sparse = biom.get('matrix_type') == 'sparse'
+        for start, end, first, count, low, high in index['blocks']:
+            if sparse and ((high < row_start) or (low >= row_end)):
+                continue
+            if (not sparse) and ((first + count <= row_start) or (first >= row_end)):
+                continue
+            entries = json.loads("["+span(start, end)+"]")
+            if sparse:
+                data.extend([[e[0] - row_start] + e[1:] for e in entries if row_start <= e[0] < row_end])
+            else:
+                data.extend(entries[max(0, row_start - first):row_end - first])
+    biom['rows'] = rows
+    biom['data'] = data
+    if 'columns' in biom:
+        biom['shape'] = [len(rows), len(biom['columns'])]
+    return biom
+
+# load BIOM struct with rows row_start to row_end (exclusive, None for all)
+#  bundle and HDF5 input are sliced, JSON files use a sidecar index (built if missing and index is set),
+#  stdin or JSON without index is scanned in one streaming pass
+def load_biom_window(path, row_start=0, row_end=None, index=True):
+    if biom_is_sliceable(path):
+        return load_biom(path, rows=slice(row_start, row_end))
+    if path == '-':
+        return jsonstream.window_biom(sys.stdin.buffer, row_start, row_end)
+    idx = biom_index(path, build=index)
+    if idx is None:
+        with open(path, 'rb') as hdl:
+            return jsonstream.window_biom(hdl, row_start, row_end)
+    return biom_window_from_index(path, idx, row_start, row_end)
+
+# True if BIOM input can be read partially
+def biom_is_sliceable(path):
+    return (path != '-') and (is_bundle(path) or is_hdf5(path))
+
+# write BIOM struct as 'json' to file or stdout ('-'), as 'hdf5' BIOM 2.1 file, or as 'bundle' directory
+def save_biom(biom, path, format='json'):
+    if format == 'json':
+        if (not path) or (path == '-'):
+            safe_print(json.dumps(biom)+"\n")
+        else:
+            with open(path, 'w') as hdl:
+                json.dump(biom, hdl)
+    elif format == 'hdf5':
+        Biom.from_dict(biom).save_hdf5(path)
+    elif format == 'bundle':
+        Biom.from_dict(biom).save_bundle(path)
+    else:
+        raise ValueError("unknown BIOM format: %s"%format)
+
+# convert BIOM JSON file to BIOM bundle directory
+def biom_to_bundle(biom_file, bundle_dir):
+    save_biom(load_biom(biom_file), bundle_dir, format='bundle')
+
+# convert BIOM bundle directory to BIOM JSON file, or stdout ('-')
+def bundle_to_biom(bundle_dir, biom_file, dense=False):
+    save_biom(Biom.load_bundle(bundle_dir).to_dict(dense=dense), biom_file)
 
 # retrieve a list of metadata values from biom file columns for given term
 # order is same as columns
@@ -316,91 +948,41 @@ def profile_to_matrix(p):
     if p['columns'][0]['id'] != 'abundance':
         # not a profile
         return p
-    trim = True if len(p['columns']) > 1 else False
+    b = Biom.from_dict(p).select(columns=[0])
+    p['columns'] = b.columns
     p['columns'][0]['id'] = p['id']
     p['matrix_element_type'] = 'int'
     p['matrix_element_value'] = 'abundance'
     p['date'] = time.strftime("%Y-%m-%d %H:%M:%S")
-    assert 'matrix_type' in p.keys(), repr(p)
-    if p['matrix_type'] == 'sparse':
-        p['data'] = sparse_to_dense(p['data'], p['shape'][0], p['shape'][1])
-    if trim:
-        p['columns'] = p['columns'][:1]
-        for i in range(len(p['rows'])):
-            p['data'][i] = p['data'][i][:1]
+    p['matrix_type'] = 'dense'
+    p['data'] = b.matrix.toarray().tolist()
+    p['shape'] = list(b.shape)
     return p
 
 # merge two BIOM objects
 def merge_biom(b1, b2):
     """input: 2 biom objects of same 'type', 'matrix_element_type', and 'matrix_element_value'
     return: merged biom object, duplicate columns skipped, duplicate rows added"""
-    # hack for using in loop when one of 2 is empty
-    if b1 and (not b2):
-        return b1
-    if b2 and (not b1):
-        return b2
-    # transform profile BIOM from UI export into matrix BIOM
-    b1 = profile_to_matrix(b1)
-    b2 = profile_to_matrix(b2)
-    # validate
-    if not (b1 and b2 and (b1['type'] == b2['type']) and (b1['matrix_element_type'] == b2['matrix_element_type']) and (b1['matrix_element_value'] == b2['matrix_element_value'])):
-        sys.stderr.write("The inputed biom objects are not compatable for merging\n")
+    return merge_bioms([b1, b2])
+
+# merge any number of BIOM objects in one pass
+def merge_bioms(bioms):
+    """input: list of biom objects of same 'type', 'matrix_element_type', and 'matrix_element_value'
+    return: merged sparse biom object, duplicate columns kept from first biom that has them, duplicate rows added
+    rows and columns are shared with the inputs, not copied"""
+    # skip empty, transform profile BIOM from UI export into matrix BIOM
+    bioms = [profile_to_matrix(b) for b in bioms if b]
+    if not bioms:
         return None
-    # build
-    mBiom = { "generated_by": b1['generated_by'],
-               "matrix_type": 'dense',
-               "date": time.strftime("%Y-%m-%d %H:%M:%S"),
-               "columns": copy.deepcopy(b1['columns']),
-               "rows": copy.deepcopy(b1['rows']),
-               "data": sparse_to_dense(b1['data'], b1['shape'][0], b1['shape'][1]) if b1['matrix_type'] == 'sparse' else copy.deepcopy(b1['data']),
-               "shape": [],
-               "matrix_element_value": b1['matrix_element_value'],
-               "matrix_element_type": b1['matrix_element_type'],
-               "format_url": "http://biom-format.org",
-               "format": "Biological Observation Matrix 1.0",
-               "id": b1['id']+'_'+b2['id'],
-               "type": b1['type'] }
-    # make sure we are dense
-    assert 'matrix_type' in b2.keys(), repr(b2)
-    if b2['matrix_type'] == 'sparse':
-        b2['data'] = sparse_to_dense(b2['data'], b2['shape'][0], b2['shape'][1])
-    # get lists of ids
-    c1_id = [c['id'] for c in b1['columns']]
-    r1_id = [r['id'] for r in b1['rows']]
-    r2_id = [r['id'] for r in b2['rows']]
-    c2_keep = 0
-    # merge columns, skip duplicate by id
-    for c in b2['columns']:
-        if c['id'] not in c1_id:
-            mBiom['columns'].append(c)
-            c2_keep += 1
-    # merge b2-cols into b1-rows
-    for i, r in enumerate(mBiom['rows']):
-        add_row = []
-        try:
-            # b1-row is in b2, use those values
-            r2_index = r2_id.index(r['id'])
-            for j, c in enumerate(b2['columns']):
-                if c['id'] not in c1_id:
-                    add_row.append(b2['data'][r2_index][j])
-        except:
-            # b1-row not in b2, add 0's
-            add_row = [0]*c2_keep
-        mBiom['data'][i].extend(add_row)
-    # add b2-rows that are not in b1
-    for i, r in enumerate(b2['rows']):
-        if r['id'] in r1_id:
-            continue
-        # b1-col all 0's
-        add_row = [0]*b1['shape'][1]
-        # add b2-cols
-        for j, c in enumerate(b2['columns']):
-            if c['id'] not in c1_id:
-                add_row.append(b2['data'][i][j])
-        mBiom['rows'].append(r)
-        mBiom['data'].append(add_row)
-    mBiom['shape'] = [ len(mBiom['rows']), len(mBiom['columns']) ]
-    return mBiom
+    if len(bioms) == 1:
+        return bioms[0]
+    # validate
+    first = bioms[0]
+    for b in bioms[1:]:
+        if not ((b['type'] == first['type']) and (b['matrix_element_type'] == first['matrix_element_type']) and (b['matrix_element_value'] == first['matrix_element_value'])):
+            sys.stderr.write("The inputed biom objects are not compatable for merging\n")
+            return None
+    return Biom.merge([Biom.from_dict(b) for b in bioms]).to_dict()
 
 # transform BIOM format to matrix in json format
 def biom_to_matrix(biom, col_name=False, sig_stats=False):
@@ -415,24 +997,52 @@ def biom_to_matrix(biom, col_name=False, sig_stats=False):
     except KeyError:
         rows = [r['id'] for r in biom['rows']]
 #        rows = [";".join(r['metadata']['hierarchy']) for r in biom['rows']]
-    assert "matrix_type" in biom.keys(), repr(biom)
-    if biom['matrix_type'] == 'sparse':
-        data = sparse_to_dense(biom['data'], len(rows), len(cols))
-    else:
-        data = biom['data']
+    data = Biom.from_dict(biom).dense().tolist()
     if sig_stats and ('significance' in biom['rows'][0]['metadata']) and (len(biom['rows'][0]['metadata']['significance']) > 0):
         cols.extend([s[0] for s in biom['rows'][0]['metadata']['significance']] )
         for i, r in enumerate(biom['rows']):
             data[i].extend([s[1] for s in r['metadata']['significance']] )
     return rows, cols, data
 
+# transform BIOM format to row names, column names and scipy sparse matrix, rows named as in biom_to_matrix
+def biom_to_array(biom, col_name=False):
+    obj = Biom.from_dict(biom)
+    cols = [c['name'] for c in obj.columns] if col_name else obj.col_ids
+    try:
+        rows = [";".join(r['metadata']['taxonomy']) for r in obj.rows]
+    except (KeyError, TypeError):
+        rows = obj.row_ids
+    return rows, cols, obj.matrix
+
+# transform BIOM format to row names, column names and scipy sparse matrix, named as in biom_to_tab
+def biom_to_tab_array(biom, col_name=False):
+    obj = Biom.from_dict(biom)
+    cols = [c['name'] for c in obj.columns] if col_name else obj.col_ids
+    return biom_row_names(obj.rows), cols, obj.matrix
+
+# number formatted as R prints it in tables, 15 significant digits
+def r_format(x):
+    if np.isnan(x):
+        return 'NA'
+    if np.isinf(x):
+        return 'Inf' if x > 0 else '-Inf'
+    return '%.15g'%x
+
+# tabbed table text as R write.table(col.names=NA, quote=FALSE) writes a numeric matrix
+def r_table(rows, cols, matrix):
+    lines = ["\t%s\n"%"\t".join(cols)]
+    for name, values in zip(rows, np.asarray(matrix, dtype=np.float64)):
+        lines.append("%s\t%s\n"%(name, "\t".join(map(r_format, values))))
+    return "".join(lines)
+
 # transform tabbed table to matrix in json format
+#  indata is table text or a file handle, cells are kept as strings
 def tab_to_matrix(indata):
-    lines = indata.split('\n')
+    lines = indata if hasattr(indata, 'read') else iter(indata.split('\n'))
     data = []
     rows = []
-    cols = lines[0].strip().split('\t')
-    for line in lines[1:]:
+    cols = next(lines, '').strip().split('\t')
+    for line in lines:
         parts = line.strip().split('\t')
         first = parts.pop(0)
         if len(cols) == len(parts):
@@ -440,6 +1050,50 @@ def tab_to_matrix(indata):
             data.append(parts)
     return rows, cols, data
 
+# number of data rows parsed into each array chunk of a tabbed table
+TAB_CHUNK_ROWS = 10000
+
+# typed array from tabbed table cells, int64 if all are integers else float64, unless dtype given
+def _cells_to_array(cells, ncols, dtype=None):
+    if not cells:
+        return np.zeros((0, ncols), dtype=dtype or np.int64)
+    if dtype is not None:
+        return np.array(cells, dtype=dtype)
+    try:
+        return np.array(cells, dtype=np.int64)
+    except (ValueError, OverflowError):
+        return np.array(cells, dtype=np.float64)
+
+# iterate over tabbed table body from handle, yields (rows, array) for every chunk_rows data rows
+#  cols is the parsed header, rows without a cell for every column are skipped as in tab_to_matrix
+def iter_tab_chunks(handle, cols, chunk_rows=TAB_CHUNK_ROWS, dtype=None):
+    rows, cells = [], []
+    for line in handle:
+        parts = line.strip().split('\t')
+        first = parts.pop(0)
+        if len(cols) == len(parts):
+            rows.append(first)
+            cells.append(parts)
+            if len(rows) >= chunk_rows:
+                yield rows, _cells_to_array(cells, len(cols), dtype)
+                rows, cells = [], []
+    if rows:
+        yield rows, _cells_to_array(cells, len(cols), dtype)
+
+# transform tabbed table to typed matrix, read line by line from handle (or table text)
+#  returns rows, cols, 2D numpy array (int64 if all cells are integers else float64, unless dtype given)
+def tab_to_array(handle, dtype=None, chunk_rows=TAB_CHUNK_ROWS):
+    if not hasattr(handle, 'read'):
+        handle = io.StringIO(handle)
+    cols = handle.readline().strip().split('\t')
+    rows, chunks = [], []
+    for r, a in iter_tab_chunks(handle, cols, chunk_rows=chunk_rows, dtype=dtype):
+        rows.extend(r)
+        chunks.append(a)
+    if not chunks:
+        return rows, cols, _cells_to_array([], len(cols), dtype)
+    return rows, cols, np.concatenate(chunks)
+
 # return a subselection of matrix columns
 def sub_matrix(matrix, ncols):
     if ncols >= len(matrix[0]):
@@ -534,17 +1188,74 @@ def random_str(size=8):
     chars = string.ascii_letters + string.digits
     return ''.join(random.choice(chars) for x in range(size))
 
-# this is a bit of a hack, need to redo using rpy2
-def execute_r(cmd, debug=False):
-    r_cmd = "echo '%s' | R --vanilla --slave --silent"%cmd
+# command used to start R
+R_COMMAND = ['R', '--vanilla', '--slave', '--silent']
+# set once a persistent R worker failed, later commands start R each time
+_r_worker_failed = False
+
+# run R commands on a persistent R worker of the shared pool (see rworker, imported on first use)
+#  leading source("file") lines are run once per worker
+#  data: dict of R variable name -> (rows, columns, matrix), assigned as numeric matrices first
+#  fetch: list of R variable names returned afterwards as (rows, columns, numpy array)
+#  if no worker can be used, R is started for this command alone (execute_r_once)
+def execute_r(cmd, debug=False, data=None, fetch=None):
+    global _r_worker_failed
     if debug:
-        print(r_cmd)
-    else:
-        process = subprocess.Popen(r_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-        output, error = process.communicate()
-        if error:
-            sys.stderr.write(error)
+        print(cmd)
+        return [([], [], np.zeros((0, 0))) for name in (fetch or [])]
+    from . import rworker
+    if _r_worker_failed or (rworker.R_WORKERS < 1):
+        return execute_r_once(cmd, data=data, fetch=fetch)
+    files, code = rworker.split_sources(cmd)
+    try:
+        with rworker.get_pool(R_COMMAND).worker() as worker:
+            for path in files:
+                worker.source(path)
+            for name, (rows, cols, matrix) in (data or {}).items():
+                worker.assign(name, matrix, rows, cols)
+            worker.run(code)
+            return [worker.fetch(name) for name in (fetch or [])]
+    except rworker.RWorkerError as e:
+        sys.stderr.write("WARNING: R worker failed (%s), starting R for each command\n"%e)
+        _r_worker_failed = True
+        return execute_r_once(cmd, data=data, fetch=fetch)
+    except rworker.RError as e:
+        sys.stderr.write("ERROR: R failed: %s\n"%e)
+        sys.exit(1)
+
+# run R commands in a new R process, same arguments as execute_r
+#  matrices are passed through tabbed files in a temporary directory
+def execute_r_once(cmd, data=None, fetch=None):
+    import shutil
+    import tempfile
+    tmp_dir = tempfile.mkdtemp(prefix='mgrast_r_')
+    def r_path(name):
+        return os.path.join(tmp_dir, name+'.txt').replace('\\', '/')
+    try:
+        lines = []
+        for name, (rows, cols, matrix) in (data or {}).items():
+            with open(r_path('in_'+name), 'w') as hdl:
+                hdl.write(r_table(rows, cols, matrix.toarray() if hasattr(matrix, 'toarray') else matrix))
+            lines.append('%s <- data.matrix(read.table("%s", row.names=1, header=TRUE, sep="\\t", comment.char="", quote="", check.names=FALSE))'%(name, r_path('in_'+name)))
+        lines.append(cmd)
+        for name in (fetch or []):
+            lines.append('write.table(as.matrix(%s), file="%s", sep="\\t", col.names=NA, quote=FALSE, na="NaN")'%(name, r_path('out_'+name)))
+        try:
+            process = subprocess.Popen(R_COMMAND, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as e:
+            sys.stderr.write("ERROR: unable to start R: %s\n"%e)
+            sys.exit(1)
+        output, error = process.communicate("\n".join(lines).encode('utf8'))
+        if process.returncode != 0:
+            sys.stderr.write("ERROR: R failed: %s\n"%error.decode('utf8', 'replace').strip())
             sys.exit(1)
+        results = []
+        for name in (fetch or []):
+            with open(r_path('out_'+name), 'r') as hdl:
+                results.append(tab_to_array(hdl, dtype=np.float64))
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
 def _cmd_exists(cmd):
     return subprocess.call("type %s"%cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE) == 0
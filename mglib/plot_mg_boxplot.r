@@ -7,7 +7,7 @@
 #   plot_mg_boxplot(table_in="test_data.txt", image_out="my_boxplot",label_rows=TRUE, image_width_in=10, image_height_in=10, image_res_dpi=200)
 
 plot_mg_boxplot <<- function(
-                          table_in="", # annotation abundance table (raw or normalized values)
+                          table_in="", # annotation abundance table (raw or normalized values), filename or matrix
                           image_out="default",
                           label_rows=FALSE,
                           label_cex=0.1,
@@ -33,7 +33,11 @@ plot_mg_boxplot <<- function(
   ######## import/parse all inputs
   
   # import DATA the data (from tab text)
-  data_matrix <- data.matrix(read.table(table_in, row.names=1, header=TRUE, sep="\t", comment.char="", quote="", check.names=FALSE))
+  if ( is.character(table_in) ){
+    data_matrix <- data.matrix(read.table(table_in, row.names=1, header=TRUE, sep="\t", comment.char="", quote="", check.names=FALSE))
+  }else{ # matrix already in memory
+    data_matrix <- data.matrix(table_in)
+  }
   
   ###################################################################################################################################
   # Generate the plot
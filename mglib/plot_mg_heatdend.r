@@ -7,7 +7,7 @@
 #   plot_mg_heatdend(table_in="test_data.txt", image_out="my_heat-dend",label_rows=TRUE, image_width_in=10, image_height_in=10, image_res_dpi=200)
 
 plot_mg_heatdend <<- function(
-                          table_in="", # annotation abundance table (raw or normalized values)
+                          table_in="", # annotation abundance table (raw or normalized values), filename or matrix
                           image_out="default",
                           label_rows=FALSE,
                           order_columns=FALSE,
@@ -36,7 +36,11 @@ plot_mg_heatdend <<- function(
   ######## import/parse all inputs
   
   # import DATA the data (from tab text)
-  data_matrix <- data.matrix(read.table(table_in, row.names=1, header=TRUE, sep="\t", comment.char="", quote="", check.names=FALSE))
+  if ( is.character(table_in) ){
+    data_matrix <- data.matrix(read.table(table_in, row.names=1, header=TRUE, sep="\t", comment.char="", quote="", check.names=FALSE))
+  }else{ # matrix already in memory
+    data_matrix <- data.matrix(table_in)
+  }
   # convert data to a matR collection
   data_collection <- suppressWarnings(as(data_matrix, "collection")) # take the input data and create a matR object with it
 
@@ -37,7 +37,7 @@
 #   plot_mg_pcoa(table_in="test_data.txt", image_out = "wacky_pcoa", plot_pcs = c(1,3,5), label_points=NA, color_table="test_colors.txt", auto_colors=TRUE, color_column=3, pch_table="test_pch.txt", pch_column=3, image_width_in=10, image_height_in=10, image_res_dpi=250)
 
 plot_mg_pcoa <<- function(
-                          table_in="", # annotation abundance table (raw or normalized values)
+                          table_in="", # annotation abundance table (raw or normalized values), filename or matrix
                           image_out="default",
                           plot_pcs=c(1,2,3), # R formated string telling which coordinates to plot, and how many (2 or 3 coordinates)
                           dist_metric="euclidean", # distance metric to use one of (bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference)
@@ -76,7 +76,11 @@ plot_mg_pcoa <<- function(
   ######## import/parse all inputs
   
   # import DATA the data (from tab text)
-  data_matrix <- data.matrix(read.table(table_in, row.names=1, header=TRUE, sep="\t", comment.char="", quote="", check.names=FALSE))
+  if ( is.character(table_in) ){
+    data_matrix <- data.matrix(read.table(table_in, row.names=1, header=TRUE, sep="\t", comment.char="", quote="", check.names=FALSE))
+  }else{ # matrix already in memory
+    data_matrix <- data.matrix(table_in)
+  }
   
   # convert data to a matR collection
   data_collection <- suppressWarnings(as(data_matrix, "collection")) # take the input data and create a matR object with it
@@ -1,6 +1,6 @@
 MGRAST_preprocessing <<- function(
-                                  file_in,     # name of the input file (tab delimited text with the raw counts)
-                                  file_out = "preprocessed_data",    # name of the output data file (tab delimited text of preprocessed data)
+                                  file_in,     # name of the input file (tab delimited text with the raw counts), or matrix of raw counts
+                                  file_out = "preprocessed_data",    # name of the output data file (tab delimited text of preprocessed data), NULL for none
                                   remove_sg = TRUE, # boolean to remove singleton counts
                                   sg_threshold = 1 # rows with a sum of counts equal to or less than this value will be removed if remove_sg=TRUE
                                   )
@@ -35,7 +35,11 @@ MGRAST_preprocessing <<- function(
    
 ###### MAIN
 ### Input the data
-    input_data = data.matrix(read.table(file_in, row.names=1, header=TRUE, sep="\t", comment.char="", quote=""))
+    if ( is.character(file_in) ){
+      input_data = data.matrix(read.table(file_in, row.names=1, header=TRUE, sep="\t", comment.char="", quote=""))
+    }else{
+      input_data = data.matrix(file_in)
+    }
    
 ### remove singletons
     if(remove_sg==TRUE){
@@ -45,6 +49,9 @@ MGRAST_preprocessing <<- function(
 ### Norm, standardize, and scale the data
     input_data <- normalize(x=input_data)
 
-###### write the log transformed and centered data to a file
-    write.table(input_data, file=file_out, sep="\t", col.names = NA, row.names = TRUE, quote = FALSE)
+###### write the log transformed and centered data to a file, and return it
+    if ( !is.null(file_out) ){
+      write.table(input_data, file=file_out, sep="\t", col.names = NA, row.names = TRUE, quote = FALSE)
+    }
+    invisible(input_data)
   }
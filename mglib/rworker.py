@@ -0,0 +1,308 @@
+"""long-lived R processes for the R-based tools
+
+An RWorker starts one R session and keeps it running. Commands are sent
+over a localhost socket, so each R library is sourced once per worker and
+R starts once per process rather than once per command. Numeric matrices
+move as raw little-endian float64 buffers, column-major as R stores them,
+with their row and column names, instead of as tabbed text files.
+
+    with get_pool().worker() as r:
+        r.source(rlib+'/plot_mg_boxplot.r')
+        r.assign('mgrast_data', matrix, rows, cols)
+        r.run('plot_mg_boxplot(table_in=mgrast_data, image_out="box")')
+
+Messages are a 4 byte little-endian op code followed by its arguments:
+strings and name lists are a 4 byte length and UTF-8 bytes (names each end
+in a newline), every reply starts with a 4 byte status, 0 for success or 1
+followed by the error message.
+
+mglib.execute_r falls back to starting R once per command, with matrices
+in temporary tabbed files, when MGRAST_R_WORKERS is 0 or a worker cannot
+be started or loses its connection (RWorkerError).
+"""
+import os
+import re
+import time
+import atexit
+import socket
+import struct
+import random
+import subprocess
+import threading
+import contextlib
+import numpy as np
+
+try:
+    import queue
+except ImportError:  # python2
+    import Queue as queue
+
+# number of R workers in the shared pool, 0 to start R once per command instead
+R_WORKERS = int(os.environ.get('MGRAST_R_WORKERS', 1))
+# seconds to wait for a new R worker to connect
+R_START_TIMEOUT = 60
+
+OP_QUIT, OP_RUN, OP_ASSIGN, OP_FETCH = 0, 1, 2, 3
+
+# wait up to timeout seconds for process to exit, returns False if still running
+def _wait(process, timeout):
+    deadline = time.time() + timeout
+    while process.poll() is None:
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.1)
+    return True
+
+# command loop run by each R worker, connects back to the python side with its token
+R_SERVER = """
+local({
+  con <- socketConnection(host="127.0.0.1", port=%d, server=FALSE, blocking=TRUE, open="r+b", timeout=31536000)
+  read_int <- function() readBin(con, "integer", n=1, size=4, endian="little")
+  read_str <- function() { n <- read_int(); if (n == 0) "" else rawToChar(readBin(con, "raw", n=n)) }
+  read_names <- function() { s <- read_str(); if (s == "") NULL else strsplit(s, "\\n", fixed=TRUE)[[1]] }
+  write_int <- function(x) writeBin(as.integer(x), con, size=4, endian="little")
+  write_str <- function(s) { b <- charToRaw(enc2utf8(paste(s, collapse="\\n"))); write_int(length(b)); writeBin(b, con) }
+  write_names <- function(x) write_str(if (length(x)) paste0(x, "\\n", collapse="") else "")
+  write_str("%s")
+  flush(con)
+  repeat {
+    op <- read_int()
+    if ((length(op) == 0) || (op == 0)) break
+    # read the whole request before running anything, so an error cannot desync the stream
+    if (op == 1) {
+      code <- read_str()
+      task <- function() { eval(parse(text=code), envir=globalenv()); write_int(0) }
+    } else if (op == 2) {
+      name <- read_str(); nr <- read_int(); nc <- read_int()
+      rn <- read_names(); cn <- read_names()
+      values <- readBin(con, "double", n=nr*nc, size=8, endian="little")
+      task <- function() {
+        assign(name, matrix(values, nrow=nr, ncol=nc, dimnames=list(rn, cn)), envir=globalenv())
+        write_int(0)
+      }
+    } else if (op == 3) {
+      name <- read_str()
+      task <- function() {
+        x <- as.matrix(get(name, envir=globalenv()))
+        storage.mode(x) <- "double"
+        payload <- list(nrow(x), ncol(x), rownames(x), colnames(x), as.vector(x))
+        write_int(0); write_int(payload[[1]]); write_int(payload[[2]])
+        write_names(payload[[3]]); write_names(payload[[4]])
+        writeBin(payload[[5]], con, size=8, endian="little")
+      }
+    } else {
+      task <- function() stop(paste("unknown op", op))
+    }
+    tryCatch(task(), error=function(e) {
+      while (dev.cur() > 1) dev.off()
+      write_int(1)
+      write_str(conditionMessage(e))
+    })
+    flush(con)
+  }
+  close(con)
+})
+"""
+
+# error reported by R for a command, the worker stays usable
+class RError(Exception):
+    pass
+
+# R worker could not be started or its connection was lost
+class RWorkerError(RError):
+    pass
+
+# one running R session
+class RWorker(object):
+    def __init__(self, command=None, timeout=R_START_TIMEOUT):
+        self.sourced = set()
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        token = '%032x'%random.SystemRandom().getrandbits(128)
+        script = R_SERVER%(listener.getsockname()[1], token)
+        devnull = open(os.devnull, 'wb')
+        try:
+            self.process = subprocess.Popen(command or ['R', '--vanilla', '--slave', '--silent'], stdin=subprocess.PIPE,
+                                            stdout=devnull, stderr=devnull)
+        except OSError as e:
+            listener.close()
+            raise RWorkerError("unable to start R: %s"%e)
+        finally:
+            devnull.close()
+        self.process.stdin.write(script.encode('utf8'))
+        self.process.stdin.close()
+        try:
+            self._accept(listener, token, timeout)
+        finally:
+            listener.close()
+
+    # wait for the R process to connect and identify itself with token
+    def _accept(self, listener, token, timeout):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RWorkerError("R exited with status %d before connecting"%self.process.returncode)
+            listener.settimeout(1)
+            try:
+                sock, addr = listener.accept()
+            except socket.timeout:
+                continue
+            sock.settimeout(max(1, deadline - time.time()))
+            self.sock, self.rfile = sock, sock.makefile('rb')
+            try:
+                if self._read_str() == token:
+                    sock.settimeout(None)
+                    return
+            except (RError, OSError, socket.error):
+                pass
+            sock.close()
+        self.process.kill()
+        raise RWorkerError("R did not connect within %d seconds"%timeout)
+
+    def _read(self, size):
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise RWorkerError("R worker closed connection")
+        return data
+
+    def _read_int(self):
+        return struct.unpack('<i', self._read(4))[0]
+
+    def _read_str(self):
+        size = self._read_int()
+        return self._read(size).decode('utf8') if size else ''
+
+    def _read_names(self):
+        text = self._read_str()
+        return text.split('\n')[:-1] if text else []
+
+    @staticmethod
+    def _str(text):
+        data = text.encode('utf8')
+        return struct.pack('<i', len(data)) + data
+
+    @staticmethod
+    def _names(names):
+        return RWorker._str(''.join(str(n).replace('\n', ' ')+'\n' for n in names))
+
+    def _check(self):
+        if self._read_int() != 0:
+            raise RError(self._read_str())
+
+    # evaluate R code in the global environment, raises RError with R's message on failure
+    def run(self, code):
+        self.sock.sendall(struct.pack('<i', OP_RUN) + self._str(code))
+        self._check()
+
+    # source R file, only the first time on this worker
+    def source(self, path):
+        if path not in self.sourced:
+            self.run('source("%s")'%path.replace('\\', '\\\\').replace('"', '\\"'))
+            self.sourced.add(path)
+
+    # assign numeric matrix (numpy array or scipy sparse) to R variable name, with optional dimnames
+    def assign(self, name, matrix, rows=None, columns=None):
+        if hasattr(matrix, 'toarray'):
+            matrix = matrix.toarray()
+        matrix = np.asarray(matrix, dtype='<f8')
+        nrows, ncols = matrix.shape
+        self.sock.sendall(struct.pack('<i', OP_ASSIGN) + self._str(name) + struct.pack('<ii', nrows, ncols) +
+                          self._names(rows or []) + self._names(columns or []))
+        self.sock.sendall(matrix.tobytes(order='F'))
+        self._check()
+
+    # return R variable name as (row names, column names, float64 numpy array)
+    def fetch(self, name):
+        self.sock.sendall(struct.pack('<i', OP_FETCH) + self._str(name))
+        self._check()
+        nrows, ncols = self._read_int(), self._read_int()
+        rows, columns = self._read_names(), self._read_names()
+        data = np.frombuffer(self._read(8 * nrows * ncols), dtype='<f8')
+        return rows, columns, data.reshape((nrows, ncols), order='F').astype(np.float64)
+
+    def close(self):
+        try:
+            self.sock.sendall(struct.pack('<i', OP_QUIT))
+            self.sock.close()
+        except (OSError, socket.error):
+            pass
+        if not _wait(self.process, 10):
+            self.process.kill()
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+# fixed number of R workers, started on first use and handed out one caller at a time
+class RPool(object):
+    def __init__(self, size=R_WORKERS, command=None):
+        self.size = size
+        self.command = command
+        self.idle = queue.LifoQueue()
+        self.started = 0
+        self.lock = threading.Lock()
+
+    def _start(self):
+        try:
+            return RWorker(self.command)
+        except:
+            with self.lock:
+                self.started -= 1
+            raise
+
+    def _discard(self, worker):
+        worker.close()
+        with self.lock:
+            self.started -= 1
+
+    # context manager holding a worker, a worker whose R process died is replaced
+    # and one that lost its connection or was interrupted mid-message is shut down
+    @contextlib.contextmanager
+    def worker(self):
+        with self.lock:
+            start = self.idle.empty() and (self.started < self.size)
+            if start:
+                self.started += 1
+        worker = self._start() if start else self.idle.get()
+        if not worker.alive:
+            worker = self._start()
+        try:
+            yield worker
+        except RWorkerError:
+            self._discard(worker)
+            raise
+        except RError:
+            self.idle.put(worker)
+            raise
+        except:
+            self._discard(worker)
+            raise
+        self.idle.put(worker)
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get().close()
+        self.started = 0
+
+_pool = None
+
+# pool of R workers shared by the process, closed at exit, command is used when it is first created
+def get_pool(command=None):
+    global _pool
+    if _pool is None:
+        _pool = RPool(command=command)
+        atexit.register(_pool.close)
+    return _pool
+
+# split leading source("file") lines from R code, returns (files, remaining code)
+def split_sources(code):
+    files = []
+    lines = code.split('\n')
+    while lines:
+        match = re.match(r'^\s*source\("([^"]+)"\)\s*;?\s*$', lines[0])
+        if not match:
+            break
+        files.append(match.group(1))
+        lines.pop(0)
+    return files, '\n'.join(lines)
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 
 import sys
+import numpy as np
 from operator import itemgetter
 from argparse import ArgumentParser
-from mglib import get_auth_token, obj_from_url, VERSION, API_URL, AUTH_LIST, async_rest_api, safe_print, urlencode
+from mglib import get_auth_token, cached_obj_from_url, VERSION, API_URL, AUTH_LIST, async_rest_api, safe_print, urlencode, Biom
 
 prehelp = """
 NAME
@@ -91,30 +92,19 @@ def main(args):
                    ('version', opts.version),
                    ('source', opts.source) ]
         url = opts.url+'/m5nr/ontology?'+urlencode(params, True)
-        data = obj_from_url(url)
+        data = cached_obj_from_url(url)
         level = 'level4' if opts.level == 'function' else opts.level
         sub_ann = set(map(lambda x: x[level], data['data']))
-    biomorig = biom
-    biom = biomorig["data"] 
-    # sort data
-    assert "matrix_type" in biom.keys(), repr(biom)
-    if biom["matrix_type"] == "sparse":
-        for d in sorted(biom['data'], key=itemgetter(2), reverse=True):
-            name = biom['rows'][d[0]]['id']  # if opts.source != 'Subsystems' else biom['rows'][d[0]]['metadata']['ontology'][-1]
-            if len(top_ann) >= opts.top:
-                break
-            if sub_ann and (name not in sub_ann):
-                continue
-            top_ann[name] = d[2]
-    if biom["matrix_type"] == "dense":
-        sortindex = sorted(range(len(biom['data'])), key=biom['data'].__getitem__, reverse=True)
-        for n in sortindex:
-            name = biom['rows'][n]['id'] # if opts.source != 'Subsystems' else biom['rows'][n]['metadata']['ontology'][-1]
-            if len(top_ann) >= opts.top:
-                break
-            if sub_ann and (name not in sub_ann):
-                continue
-            top_ann[name] = biom['data'][n][0]
+    # sort rows by abundance in first column
+    biom = Biom.from_dict(biom)
+    abundance = biom.column(0)
+    for n in np.argsort(-abundance, kind='stable'):
+        name = biom.rows[n]['id']  # if opts.source != 'Subsystems' else biom.rows[n]['metadata']['ontology'][-1]
+        if (len(top_ann) >= opts.top) or (abundance[n] == 0):
+            break
+        if sub_ann and (name not in sub_ann):
+            continue
+        top_ann[name] = abundance[n]
 
     # output data
     for k, v in sorted(top_ann.items(), key=itemgetter(1), reverse=True):
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 
 import sys
+import numpy as np
 from operator import itemgetter
 from argparse import ArgumentParser
-from mglib import get_auth_token, obj_from_url, async_rest_api, AUTH_LIST, sparse_to_dense, safe_print, API_URL, VERSION, urlencode
+from mglib import get_auth_token, cached_obj_from_url, async_rest_api, AUTH_LIST, Biom, safe_print, API_URL, VERSION, urlencode
 
 prehelp = """
 NAME
@@ -90,25 +91,18 @@ def main(args):
                   ('min_level', opts.level),
                   ('version', opts.version)]
         url = opts.url+'/m5nr/taxonomy?'+urlencode(params, True)
-        data = obj_from_url(url)
+        data = cached_obj_from_url(url)
         sub_ann = set(map(lambda x: x[opts.level], data['data']))
-    biomorig = biom
-    biom = biomorig["data"]
-    if biom['matrix_type'] == "dense":
-        data = biom['data']
-    else:
-        data = sparse_to_dense(biom['data'], len(biom['rows']), len(biom['cols']))
-    rows = [biom['rows'][i]['id'] for i in range(len(biom['rows']))]
-    datalist = [biom['data'][i][0] for i in range(len(biom['rows']))]
-    data2 = zip(rows, datalist)
-    # sort data
-    for d in sorted(data2, key=itemgetter(1), reverse=True):
-        name = d[0]
-        if len(top_ann) >= opts.top:
+    # sort rows by abundance in first column
+    biom = Biom.from_dict(biom)
+    abundance = biom.column(0)
+    for n in np.argsort(-abundance, kind='stable'):
+        name = biom.rows[n]['id']
+        if (len(top_ann) >= opts.top) or (abundance[n] == 0):
             break
         if sub_ann and (name not in sub_ann):
             continue
-        top_ann[name] = d[1]
+        top_ann[name] = abundance[n]
 
     # output data
     for k, v in sorted(top_ann.items(), key=itemgetter(1), reverse=True):
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import os
+import sys
+from argparse import ArgumentParser
+from mglib import load_biom, save_biom, Biom, AUTH_LIST, VERSION
+
+prehelp = """
+NAME
+    mg-biom-convert
+
+VERSION
+    %s
+
+SYNOPSIS
+    mg-biom-convert [ --help, --input <input file, bundle directory or stdin>, --output <output file or directory>, --format <cv: 'json', 'hdf5' or 'bundle'>, --dense <boolean> ]
+
+DESCRIPTION
+    Tool to convert between BIOM 1.0 JSON, BIOM 2.1 HDF5, and the binary BIOM bundle format
+"""
+
+posthelp = """
+Input
+    BIOM file (JSON or HDF5) or BIOM bundle directory
+
+Output
+    BIOM bundle directory, BIOM HDF5 file, or BIOM JSON file (stdout if '-')
+
+EXAMPLES
+    mg-biom-convert --input table.biom --output table.biomb --format bundle
+
+SEE ALSO
+    -
+
+AUTHORS
+    %s
+"""
+
+def main(args):
+    ArgumentParser.format_description = lambda self, formatter: self.description
+    ArgumentParser.format_epilog = lambda self, formatter: self.epilog
+    parser = ArgumentParser(usage='', description=prehelp%VERSION, epilog=posthelp%AUTH_LIST)
+    parser.add_argument("-i", "--input", dest="input", default='-', help="input: filename, BIOM bundle directory, or stdin (-), default is stdin")
+    parser.add_argument("-o", "--output", dest="output", default='-', help="output: filename, BIOM bundle directory, or stdout (-), default is stdout")
+    parser.add_argument("-f", "--format", dest="format", default='bundle', help="output format: 'json' for BIOM 1.0 file, 'hdf5' for BIOM 2.1 file, 'bundle' for BIOM bundle directory, default is bundle")
+    parser.add_argument("--dense", dest="dense", action="store_true", default=False, help="write dense BIOM matrix for 'json' format, default is sparse")
+    
+    # get inputs
+    opts = parser.parse_args()
+    if (opts.input != '-') and (not os.path.exists(opts.input)):
+        sys.stderr.write("ERROR: input data missing\n")
+        return 1
+    if opts.format not in ['json', 'hdf5', 'bundle']:
+        sys.stderr.write("ERROR: invalid format\n")
+        return 1
+    if (opts.format != 'json') and (opts.output == '-'):
+        sys.stderr.write("ERROR: %s output requires --output\n"%opts.format)
+        return 1
+    
+    # convert
+    try:
+        biom = load_biom(opts.input)
+        if opts.dense and (opts.format == 'json'):
+            biom = Biom.from_dict(biom).to_dict(dense=True)
+    except:
+        sys.stderr.write("ERROR: input BIOM data not correct format\n")
+        return 1
+    save_biom(biom, opts.output, format=opts.format)
+    return 0
+    
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -4,7 +4,7 @@ import os
 import sys
 import json
 from argparse import ArgumentParser
-from mglib import merge_biom, AUTH_LIST, VERSION, safe_print
+from mglib import merge_bioms, load_biom, save_biom, AUTH_LIST, VERSION
 
 prehelp = """
 NAME
@@ -14,7 +14,7 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-biom-merge [ --help --retain_dup_ids ] biom1 biom2 [ biom3 biom4 ... ]
+    mg-biom-merge [ --help --retain_dup_ids --output <output file or stdout> --format <cv: 'json', 'hdf5' or 'bundle'> ] biom1 biom2 [ biom3 biom4 ... ]
 
 DESCRIPTION
     Tool to merge two or more BIOM format files
@@ -22,10 +22,10 @@ DESCRIPTION
 
 posthelp = """
 Input
-    Two or more BIOM files
+    Two or more BIOM files (JSON or HDF5) or BIOM bundle directories
 
 Output
-    Merged BIOM to stdout
+    Merged BIOM to stdout, or to --output file in given --format
 
 EXAMPLES
     mg-biom-merge --help
@@ -42,44 +42,43 @@ def main(args):
     ArgumentParser.format_epilog = lambda self, formatter: self.epilog
     parser = ArgumentParser(usage='', description=prehelp%VERSION, epilog=posthelp%AUTH_LIST)
     parser.add_argument("--retain_dup_ids", dest="retain_dups", action="store_true", default=False, help="append input number to duplicate input ID's rather than discarding duplicates, default is false")
+    parser.add_argument("--output", dest="output", default='-', help="output: filename, BIOM bundle directory, or stdout (-), default is stdout")
+    parser.add_argument("--format", dest="format", default='json', help="output format: 'json' for BIOM 1.0, 'hdf5' for BIOM 2.1, 'bundle' for BIOM bundle directory, default is json")
+    parser.add_argument("inputs", nargs="*", help="BIOM inputs")
 
     # get inputs
     opts = parser.parse_args()
+    args = opts.inputs
+    if opts.format not in ['json', 'hdf5', 'bundle']:
+        sys.stderr.write("ERROR: invalid format\n")
+        return 1
+    if (opts.format != 'json') and (opts.output == '-'):
+        sys.stderr.write("ERROR: %s output requires --output\n"%opts.format)
+        return 1
     if len(args) < 2:
         sys.stderr.write("ERROR: must have at least 2 file inputs\n")
         return 1
     for f in args:
-        if not os.path.isfile(f):
-            sys.stderr.write("ERROR: %s is not a valid file\n")
+        if not os.path.exists(f):
+            sys.stderr.write("ERROR: %s is not a valid file\n"%f)
             return 1
-    # get first
-    try:
-        biom = json.load(open(args[0], 'r'))
-    except:
-        sys.stderr.write("ERROR: %s BIOM data not correct format\n"%args[0])
-        return 1
-
-    input_num = 1
-    if opts.retain_dups:
-        for index in range(len(biom['columns'])):
-            biom['columns'][index]['id'] = biom['columns'][index]['id'] + "_" + str(input_num)
-
-    # merge rest
-    for f in args[1:]:
+    # load all, merge in one pass
+    bioms = []
+    for input_num, f in enumerate(args, 1):
         try:
-            b = json.load(open(f, 'r'))
+            b = load_biom(f)
         except:
             sys.stderr.write("ERROR: %s BIOM data not correct format\n"%f)
             return 1
 
         if opts.retain_dups:
-            input_num += 1
             for index in range(len(b['columns'])):
                 b['columns'][index]['id'] = b['columns'][index]['id'] + "_" + str(input_num)
+        bioms.append(b)
 
-        biom = merge_biom(biom, b)
+    biom = merge_bioms(bioms)
     
-    safe_print(json.dumps(biom)+"\n")
+    save_biom(biom, opts.output, format=opts.format)
     return 0
 
 if __name__ == "__main__":
@@ -2,9 +2,8 @@
 
 import os
 import sys
-import json
 from argparse import ArgumentParser
-from mglib import biom_to_matrix, AUTH_LIST, VERSION
+from mglib import biom_to_matrix, load_biom_window, AUTH_LIST, VERSION
 
 prehelp = """
 NAME
@@ -14,15 +13,17 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-biom-view [ --help, --input <input file or stdin>, --output <output file or stdout>, --row_start <integer>, --row_end <integer>, --col_start <integer>, --col_end <integer>, --stats <boolean> ]
+    mg-biom-view [ --help, --input <input file or stdin>, --output <output file or stdout>, --row_start <integer>, --row_end <integer>, --col_start <integer>, --col_end <integer>, --stats <boolean>, --no_index <boolean> ]
 
 DESCRIPTION
     Tool to view slice of BIOM file as table with row and column ids
+    The first view of a BIOM JSON file saves a byte-offset index next to it (<input>.idx),
+    later views read only the requested rows
 """
 
 posthelp = """
 Input
-    BIOM file
+    BIOM file (JSON or HDF5) or BIOM bundle directory
 
 Output
     Tab-delimited table of BIOM sub-selection
@@ -41,17 +42,18 @@ def main(args):
     ArgumentParser.format_description = lambda self, formatter: self.description
     ArgumentParser.format_epilog = lambda self, formatter: self.epilog
     parser = ArgumentParser(usage='', description=prehelp%VERSION, epilog=posthelp%AUTH_LIST)
-    parser.add_argument("-i", "--input", dest="input", default='-', help="input: filename or stdin (-), default is stdin")
+    parser.add_argument("-i", "--input", dest="input", default='-', help="input: filename, BIOM bundle directory, or stdin (-), default is stdin")
     parser.add_argument("-o", "--output", dest="output", default='-', help="input: filename or stdout (-), default is stdout")
     parser.add_argument("--row_start", dest="row_start", type=int, default=None, help="row position to start table with, default is first")
     parser.add_argument("--row_end", dest="row_end", type=int, default=None, help="row position to end table with, default is last")
     parser.add_argument("--col_start", dest="col_start", type=int, default=None, help="column position to start table with, default is first")
     parser.add_argument("--col_end", dest="col_end", type=int, default=None, help="column position to end table with, default is last")
     parser.add_argument("--stats", dest="stats", action="store_true", default=False, help="include significance stats in output, default is off")
+    parser.add_argument("--no_index", dest="no_index", action="store_true", default=False, help="do not build a sidecar index (<input>.idx) for BIOM JSON input, scan the input instead, default is off")
     
     # get inputs
     opts = parser.parse_args()
-    if (opts.input != '-') and (not os.path.isfile(opts.input)):
+    if (opts.input != '-') and (not os.path.exists(opts.input)):
         sys.stderr.write("ERROR: input data missing\n")
         return 1
 
@@ -60,30 +62,28 @@ def main(args):
     else:
         out_hdl = open(opts.output, 'w')
 
-    # parse inputs
+    # parse inputs, only the row window is read: sliced from a BIOM bundle or HDF5 file,
+    # located through a sidecar byte-offset index for a BIOM JSON file, else scanned
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
-        try:
-            biom = json.loads(indata)
-            rows, cols, data = biom_to_matrix(biom, sig_stats=opts.stats)
-        except:
-            sys.stderr.write("ERROR: input BIOM data not correct format\n")
-            return 1
+        biom = load_biom_window(opts.input, max(0, (opts.row_start or 1) - 1), opts.row_end, index=(not opts.no_index))
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
+    try:
+        rows, cols, data = biom_to_matrix(biom, sig_stats=opts.stats)
+    except:
+        sys.stderr.write("ERROR: input BIOM data not correct format\n")
+        return 1
     
-    row_start = 0 if opts.row_start is None else opts.row_start - 1
-    row_end   = len(rows) if opts.row_end is None else opts.row_end
+    # rows and data hold only the requested row window
     col_start = 0 if opts.col_start is None else opts.col_start - 1
     col_end   = len(cols) if opts.col_end is None else opts.col_end
     
     # output data
     try:
-        sub_rows = rows[row_start:row_end]
         out_hdl.write("\t%s\n" %"\t".join(cols[col_start:col_end]))
-        for i, d in enumerate(data[row_start:row_end]):
-            out_hdl.write("%s\t%s\n" %(sub_rows[i], "\t".join(map(str, d[col_start:col_end]))))
+        for i, d in enumerate(data):
+            out_hdl.write("%s\t%s\n" %(rows[i], "\t".join(map(str, d[col_start:col_end]))))
         out_hdl.close()
     except:
         sys.stderr.write("ERROR: unable to sub-select BIOM, inputted positions are out of bounds\n")
@@ -3,8 +3,9 @@
 import os
 import sys
 import json
+import numpy as np
 from argparse import ArgumentParser
-from mglib import safe_print, AUTH_LIST, VERSION, random_str, biom_to_tab, execute_r
+from mglib import safe_print, AUTH_LIST, VERSION, biom_to_tab_array, tab_to_array, execute_r, r_table
 
 prehelp = """
 NAME
@@ -67,32 +68,28 @@ def main(args):
         return 1
     
     # get inputs
-    tmp_in  = 'tmp_'+random_str()+'.txt'
-    tmp_out = 'tmp_'+random_str()+'.txt'
-    tmp_hdl = open(tmp_in, 'w')
+    rows    = []
     mg_list = []
+    matrix  = None
     groups  = []
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
+        in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
         if opts.format == 'biom':
             try:
-                indata = json.loads(indata)
-                biom_to_tab(indata, tmp_hdl)
-                mg_list = map(lambda x: x['id'], indata['columns'])
+                indata = json.load(in_hdl)
+                rows, mg_list, matrix = biom_to_tab_array(indata)
                 try:
-                    groups = map(lambda x: x['group'], indata['columns'])
+                    groups = [c['group'] for c in indata['columns']]
                 except:
                     pass
             except:
                 sys.stderr.write("ERROR: input BIOM data not correct format\n")
                 return 1
         else:
-            tmp_hdl.write(indata)
-            mg_list = indata.split('\n')[0].strip().split('\t')
+            rows, mg_list, matrix = tab_to_array(in_hdl, dtype=np.float64)
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
-    tmp_hdl.close()
     
     # get groups if not in BIOM
     if not groups:
@@ -116,22 +113,20 @@ def main(args):
     # build R cmd
     group_str  = 'c('+','.join(map(lambda x: '"%s"'%x, groups))+')'
     r_cmd = """source("%s/group_stats_plot.r")
-suppressMessages( group_stats_plot(
-    file_in="%s",
-    file_out="%s",
+mgrast_stats <- suppressMessages( group_stats_plot(
+    file_in=mgrast_data,
+    file_out=NULL,
     figure_out=NULL,
     stat_test="%s",
     order_by=NULL,
     order_decreasing=TRUE,
     my_grouping=%s
-))"""%(opts.rlib, tmp_in, tmp_out, opts.stat_test, group_str)
-    execute_r(r_cmd)
+))"""%(opts.rlib, opts.stat_test, group_str)
+    srows, scols, stats = execute_r(r_cmd, data={'mgrast_data': (rows, mg_list, matrix)}, fetch=['mgrast_stats'])[0]
     
     # output results
-    results = open(tmp_out, 'r').readlines()
+    results = r_table(srows, scols, stats).splitlines(True)
     output  = "\n".join(results[0:opts.top+1])
-    os.remove(tmp_in)
-    os.remove(tmp_out)
     safe_print(output)
     
     return 0
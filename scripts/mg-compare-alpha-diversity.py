@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 
+import os
 import sys
 from argparse import ArgumentParser
-from mglib import urlencode, API_URL, VERSION, AUTH_LIST, get_auth_token, obj_from_url, safe_print
+from mglib import urlencode, API_URL, VERSION, AUTH_LIST, get_auth_token, safe_print, aio, async_rest_api, async_rest_api_many, merge_bioms, load_biom, tab_to_array
+from mglib.biom import Biom
+from mglib.compute import alpha_diversity, ALPHA_INDEXES
 
 prehelp = """
 NAME
@@ -12,13 +15,18 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-compare-alpha-diversity [ --help, --user <user>, --passwd <password>, --token <oAuth token>, --ids <metagenome ids>, --level <taxon level>, --source <datasource> ]
+    mg-compare-alpha-diversity [ --help, --user <user>, --passwd <password>, --token <oAuth token>, --ids <metagenome ids>, --level <taxon level>, --source <datasource>, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --index <cv: alpha, shannon, simpson, chao1>, --engine <cv: 'local' or 'api'> ]
 
 DESCRIPTION
     Calculate alpha diversity for multiple metagenomes.
 """
 
 posthelp = """
+Input
+    Optional, instead of --ids: tab-delimited table of abundance profiles, metagenomes in columns and annotation in rows.
+    OR
+    BIOM format of abundance profiles.
+
 Output
     Tab-delimited list of metagenome IDs and their alpha diversity scores.
 
@@ -43,25 +51,83 @@ def main(args):
     parser.add_argument("--token", dest="token", default=None, help="OAuth token")
     parser.add_argument("--level", dest="level", default='species', help="taxon level to retrieve abundances for, default is species")
     parser.add_argument("--source", dest="source", default='SEED', help="datasource to filter results by, default is SEED")
+    parser.add_argument("--input", dest="input", default=None, help="input: filename, BIOM bundle directory, or stdin (-), used instead of --ids")
+    parser.add_argument("--format", dest="format", default='biom', help="input format: 'text' for tabbed table, 'biom' for BIOM format, default is biom")
+    parser.add_argument("--index", dest="index", default='alpha', help="diversity index, one of: alpha (antilog of shannon, as MG-RAST), shannon, simpson, chao1, default is alpha")
+    parser.add_argument("--engine", dest="engine", default='local', help="where to compute: 'local' from one abundance matrix, or 'api' with one MG-RAST compute call per metagenome, default is local")
     
     # get inputs
     opts = parser.parse_args()
-    if not opts.ids:
-        sys.stderr.write("ERROR: one or more ids required\n")
+    if (not opts.ids) and (not opts.input):
+        sys.stderr.write("ERROR: one or more ids, or input, required\n")
+        return 1
+    if opts.input and (opts.input != '-') and (not os.path.exists(opts.input)):
+        sys.stderr.write("ERROR: input data missing\n")
+        return 1
+    if opts.format not in ['text', 'biom']:
+        sys.stderr.write("ERROR: invalid input format\n")
+        return 1
+    if opts.engine not in ['local', 'api']:
+        sys.stderr.write("ERROR: invalid engine\n")
+        return 1
+    if opts.index not in ALPHA_INDEXES:
+        sys.stderr.write("ERROR: invalid index\n")
+        return 1
+    if (opts.engine == 'api') and (opts.input or (opts.index != 'alpha')):
+        sys.stderr.write("ERROR: engine 'api' only computes index 'alpha' from --ids\n")
         return 1
     
     # get auth
     token = get_auth_token(opts)
     
-    # build url / retrieve data / output data
-    id_list = opts.ids.split(',')
-    params  = [ ('level', opts.level), ('source', opts.source) ]
-    for i in id_list:
-        url  = opts.url+'/compute/alphadiversity/'+i+'?'+urlencode(params, True)
-        data = obj_from_url(url, auth=token)
-        safe_print("%s\t%s\n" %(i, data['data']))
+    # remote: one call per metagenome, run concurrently
+    if opts.engine == 'api':
+        id_list = opts.ids.split(',')
+        params  = [ ('level', opts.level), ('source', opts.source) ]
+        urls    = [opts.url+'/compute/alphadiversity/'+i+'?'+urlencode(params, True) for i in id_list]
+        results = aio.run(aio.gather([aio.obj_from_url(url, auth=token) for url in urls]))
+        for i, data in zip(id_list, results):
+            safe_print("%s\t%s\n" %(i, data['data']))
+        return 0
+    
+    # local: one abundance matrix for all metagenomes
+    try:
+        if opts.input and (opts.format == 'text'):
+            in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
+            rows, cols, matrix = tab_to_array(in_hdl)
+        else:
+            if opts.input:
+                biom = load_biom(opts.input)
+            else:
+                biom = fetch_matrix(opts, token)
+            obj = Biom.from_dict(biom)
+            cols, matrix = obj.col_ids, obj.matrix
+    except:
+        sys.stderr.write("ERROR: unable to load input data\n")
+        return 1
+    
+    # output data
+    for i, value in zip(cols, alpha_diversity(matrix, opts.index).tolist()):
+        safe_print("%s\t%s\n" %(i, value))
     
     return 0
+
+# BIOM abundance matrix of ids at taxon level, fetched in chunks of 50 metagenomes computed concurrently
+def fetch_matrix(opts, token, size=50):
+    id_list = opts.ids.strip().split(',')
+    params  = [ ('group_level', opts.level),
+                ('source', opts.source),
+                ('result_type', 'abundance'),
+                ('asynchronous', '1') ]
+    urls = []
+    for i in range(0, len(id_list), size):
+        urls.append(opts.url+'/matrix/organism?'+urlencode(params + [('id', m) for m in id_list[i:i+size]], True))
+    if len(urls) == 1:
+        return async_rest_api(urls[0], auth=token)
+    chunks = [None] * len(urls)
+    for i, biom in async_rest_api_many(urls, auth=token):
+        chunks[i] = biom['data'] if 'columns' not in biom else biom
+    return merge_bioms(chunks)
     
 
 if __name__ == "__main__":
@@ -3,8 +3,9 @@
 import os
 import sys
 import json
+import numpy as np
 from argparse import ArgumentParser
-from mglib import AUTH_LIST, VERSION, get_auth_token, random_str, biom_to_tab, execute_r
+from mglib import AUTH_LIST, VERSION, get_auth_token, biom_to_tab_array, tab_to_array, execute_r
 
 prehelp = """
 NAME
@@ -14,7 +15,7 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-compare-boxplot-plot [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --plot <filename for png>, --reference <boolean>, --rlib <R lib path>, --height <image height in inches>, --width <image width in inches>, --dpi <image DPI>, --name <boolean>, --label <boolean> ]
+    mg-compare-boxplot-plot [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --plot <filename for png>, --rlib <R lib path>, --height <image height in inches>, --width <image width in inches>, --dpi <image DPI>, --name <boolean>, --label <boolean> ]
 
 DESCRIPTION
     Tool to generate boxplot vizualizations from metagenome abundance profiles.
@@ -72,50 +73,42 @@ def main(args):
     if not opts.rlib:
         sys.stderr.write("ERROR: missing path to R libs\n")
         return 1
-    for o in ['reference', 'name', 'label']:
+    for o in ['name', 'label']:
         if getattr(opts, o) not in [0, 1]:
             sys.stderr.write("ERROR: invalid value for '%s'\n"%o)
             return 1
     
-    return 0
     # get auth
     token = get_auth_token(opts)
     
     # parse input for R
-    tmp_in  = 'tmp_'+random_str()+'.txt'
-    tmp_hdl = open(tmp_in, 'w')
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
+        in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
         if opts.format == 'biom':
             try:
-                indata = json.loads(indata)
                 col_name = True if opts.name == 1 else False
-                biom_to_tab(indata, tmp_hdl, col_name=col_name)
+                rows, cols, matrix = biom_to_tab_array(json.load(in_hdl), col_name=col_name)
             except:
                 sys.stderr.write("ERROR: input BIOM data not correct format\n")
                 return 1
         else:
-            tmp_hdl.write(indata)
+            rows, cols, matrix = tab_to_array(in_hdl, dtype=np.float64)
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
-    tmp_hdl.close()
     
     # build R cmd
     label = 'TRUE' if opts.label == 1 else 'FALSE'
     r_cmd = """source("%s/plot_mg_boxplot.r")
 suppressMessages( plot_mg_boxplot(
-    table_in="%s",
+    table_in=mgrast_data,
     image_out="%s",
     label_rows=%s,
     image_height_in=%.1f,
     image_width_in=%.1f,
     image_res_dpi=%d
-))"""%(opts.rlib, tmp_in, opts.plot, label, opts.height, opts.width, opts.dpi)
-    execute_r(r_cmd)
-    
-    # cleanup
-    os.remove(tmp_in)
+))"""%(opts.rlib, opts.plot, label, opts.height, opts.width, opts.dpi)
+    execute_r(r_cmd, data={'mgrast_data': (rows, cols, matrix)})
     
     return 0
     
@@ -5,7 +5,7 @@ import sys
 import json
 import copy
 from argparse import ArgumentParser
-from mglib import VERSION, AUTH_LIST, API_URL, get_auth_token, obj_from_url, urlencode, async_rest_api, biom_to_tab, merge_biom
+from mglib import VERSION, AUTH_LIST, API_URL, get_auth_token, cached_obj_from_url, urlencode, async_rest_api, async_rest_api_many, biom_to_tab, merge_bioms, save_biom
 
 prehelp = """
 NAME
@@ -15,7 +15,7 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-compare-functions [ --help, --user <user>, --passwd <password>, --token <oAuth token>, --ids <metagenome ids>, --level <functional level>, --source <function datasource>, --filter_level <function level>, --filter_name <function name>, --intersect_source <taxon datasource>, --intersect_level <taxon level>, --intersect_name <taxon name>, --evalue <evalue negative exponent>, --identity <percent identity>, --length <alignment length>, --format <cv: 'text' or 'biom'> ]
+    mg-compare-functions [ --help, --user <user>, --passwd <password>, --token <oAuth token>, --ids <metagenome ids>, --level <functional level>, --source <function datasource>, --filter_level <function level>, --filter_name <function name>, --intersect_source <taxon datasource>, --intersect_level <taxon level>, --intersect_name <taxon name>, --evalue <evalue negative exponent>, --identity <percent identity>, --length <alignment length>, --format <cv: 'text', 'biom' or 'hdf5'> ]
 
 DESCRIPTION
     Retrieve matrix of functional abundance profiles for multiple metagenomes.
@@ -53,13 +53,14 @@ def main(args):
     parser.add_argument("--intersect_level", dest="intersect_level", default=None, help="taxon level for insersection")
     parser.add_argument("--intersect_name", dest="intersect_name", default=None, help="taxon name(s) for insersection, file or comma seperated list")
     parser.add_argument("--output", dest="output", default='-', help="output: filename or stdout (-), default is stdout")
-    parser.add_argument("--format", dest="format", default='biom', help="output format: 'text' for tabbed table, 'biom' for BIOM format, default is biom")
+    parser.add_argument("--format", dest="format", default='biom', help="output format: 'text' for tabbed table, 'biom' for BIOM format, 'hdf5' for BIOM 2.1 HDF5 file (requires --output), default is biom")
     parser.add_argument("--hierarchy", type=bool , dest="hierarchy", default=False, help="if output format text, print functional hierarchy")
     parser.add_argument("--evalue", type=int, dest="evalue", default=15, help="negative exponent value for maximum e-value cutoff, default is 15")
     parser.add_argument("--identity", type=int, dest="identity", default=60, help="percent value for minimum %% identity cutoff, default is 60")
     parser.add_argument("--length", type=int, dest="length", default=15, help="value for minimum alignment length cutoff, default is 15")
     parser.add_argument("--version", type=int, dest="version", default=1, help="M5NR annotation version to use, default is 1")
     parser.add_argument("--temp", dest="temp", default=None, help="filename to temporarly save biom output at each iteration")
+    parser.add_argument("--workers", type=int, dest="workers", default=8, help="number of 50 metagenome chunks to compute in parallel, default is 8")
     
     # get inputs
     opts = parser.parse_args()
@@ -72,7 +73,10 @@ def main(args):
     if (opts.intersect_name and (not opts.intersect_level)) or ((not opts.intersect_name) and opts.intersect_level):
         sys.stderr.write("ERROR: both --intersect_level and --intersect_name need to be used together\n")
         return 1
-    if opts.format not in ['text', 'biom']:
+    if (opts.format == 'hdf5') and ((not opts.output) or (opts.output == '-')):
+        sys.stderr.write("ERROR: hdf5 format requires --output\n")
+        return 1
+    if opts.format not in ['text', 'biom', 'hdf5']:
         sys.stderr.write("ERROR: invalid input format\n")
         return 1
     
@@ -116,16 +120,31 @@ def main(args):
     biom = None
     size = 50
     if len(id_list) > size:
-        for i in xrange(0, len(id_list), size):
+        urls = []
+        for i in range(0, len(id_list), size):
             sub_ids = id_list[i:i+size]
             cur_params = copy.deepcopy(params)
             for i in sub_ids:
                 cur_params.append(('id', i))
-            cur_url  = opts.url+'/matrix/function?'+urlencode(cur_params, True)
-            cur_biom = async_rest_api(cur_url, auth=token)
-            biom = merge_biom(biom, cur_biom)
-            if opts.temp:
-                json.dump(biom, open(opts.temp, 'w'))
+            urls.append(opts.url+'/matrix/function?'+urlencode(cur_params, True))
+        # chunks are computed concurrently, merged in one pass once all are done
+        # with temp, chunks are merged in order into a running biom as soon as their predecessors are in,
+        # each chunk is merged once and the temp file is rewritten whenever the running biom grows
+        chunks = [None] * len(urls)
+        done = 0
+        for i, cur_biom in async_rest_api_many(urls, auth=token, workers=opts.workers):
+            if 'columns' not in cur_biom:
+                cur_biom = cur_biom['data']
+            chunks[i] = cur_biom
+            if opts.temp and (i == done):
+                while (done < len(chunks)) and (chunks[done] is not None):
+                    biom = merge_bioms([biom, chunks[done]])
+                    chunks[done] = None
+                    done += 1
+                with open(opts.temp, 'w') as hdl:
+                    json.dump(biom, hdl)
+        if not opts.temp:
+            biom = merge_bioms(chunks)
     else:
         for i in id_list:
             params.append(('id', i))
@@ -152,13 +171,16 @@ def main(args):
                    ('min_level', opts.level),
                    ('source', opts.source) ]
         url = opts.url+'/m5nr/ontology?'+urlencode(params, True)
-        data = obj_from_url(url)
+        data = cached_obj_from_url(url)
         level = 'level4' if opts.level == 'function' else opts.level
         for ann in data['data']:
             if (opts.filter_level in ann) and (level in ann) and (ann[opts.filter_level] in filter_list):
                 sub_ann.add(ann[level])
     
     # output data
+    if opts.format == 'hdf5':
+        save_biom(biom["data"] if "columns" not in biom else biom, opts.output, format='hdf5')
+        return 0
     if (not opts.output) or (opts.output == '-'):
         out_hdl = sys.stdout
     else:
@@ -167,7 +189,7 @@ def main(args):
     if opts.format == 'biom':
         out_hdl.write(json.dumps(biom)+"\n")
     else:
-        biom_to_tab(biom["data"], out_hdl, rows=sub_ann , hierarchy=opts.hierarchy)
+        biom_to_tab(biom["data"] if "columns" not in biom else biom, out_hdl, rows=sub_ann , hierarchy=opts.hierarchy)
     
     out_hdl.close()
     return 0
@@ -3,8 +3,9 @@
 import os
 import sys
 import json
+import numpy as np
 from argparse import ArgumentParser
-from mglib import VERSION, AUTH_LIST, get_auth_token, random_str, biom_to_tab, execute_r
+from mglib import VERSION, AUTH_LIST, get_auth_token, biom_to_tab_array, tab_to_array, execute_r
 
 prehelp = """
 NAME
@@ -14,7 +15,7 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-compare-heatmap-plot [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --plot <filename for png>, --reference <boolean>, --cluster <cv: ward, single, complete, mcquitty, median, centroid>, --distance <cv: bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference>, --rlib <R lib path>, --height <image height in inches>, --width <image width in inches>, --dpi <image DPI>, --order <boolean>, --name <boolean>, --label <boolean> ]
+    mg-compare-heatmap-plot [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --plot <filename for png>, --cluster <cv: ward, single, complete, mcquitty, median, centroid>, --distance <cv: bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference>, --rlib <R lib path>, --height <image height in inches>, --width <image width in inches>, --dpi <image DPI>, --order <boolean>, --name <boolean>, --label <boolean> ]
 
 DESCRIPTION
     Tool to generate heatmap-dendrogram vizualizations from metagenome abundance profiles.
@@ -75,7 +76,7 @@ def main(args):
     if not opts.rlib:
         sys.stderr.write("ERROR: missing path to R libs\n")
         return 1
-    for o in ['reference', 'order', 'name', 'label']:
+    for o in ['order', 'name', 'label']:
         if getattr(opts, o) not in [0, 1]:
             sys.stderr.write("ERROR: invalid value for '%s'\n"%o)
             return 1
@@ -84,42 +85,35 @@ def main(args):
     token = get_auth_token(opts)
     
     # parse input for R
-    tmp_in  = 'tmp_'+random_str()+'.txt'
-    tmp_hdl = open(tmp_in, 'w')
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
+        in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
         if opts.format == 'biom':
             try:
-                indata = json.loads(indata)
                 col_name = True if opts.name == 1 else False
-                biom_to_tab(indata, tmp_hdl, col_name=col_name)
+                rows, cols, matrix = biom_to_tab_array(json.load(in_hdl), col_name=col_name)
             except:
                 sys.stderr.write("ERROR: input BIOM data not correct format\n")
                 return 1
         else:
-            tmp_hdl.write(indata)
+            rows, cols, matrix = tab_to_array(in_hdl, dtype=np.float64)
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
-    tmp_hdl.close()
     
     # build R cmd
     order = 'TRUE' if opts.order == 1 else 'FALSE'
     label = 'TRUE' if opts.label == 1 else 'FALSE'
     r_cmd = """source("%s/plot_mg_heatdend.r")
 suppressMessages( plot_mg_heatdend(
-    table_in="%s",
+    table_in=mgrast_data,
     image_out="%s",
     order_columns=%s,
     label_rows=%s,
     image_height_in=%.1f,
     image_width_in=%.1f,
     image_res_dpi=%d
-))"""%(opts.rlib, tmp_in, opts.plot, order, label, opts.height, opts.width, opts.dpi)
-    execute_r(r_cmd)
-    
-    # cleanup
-    os.remove(tmp_in)
+))"""%(opts.rlib, opts.plot, order, label, opts.height, opts.width, opts.dpi)
+    execute_r(r_cmd, data={'mgrast_data': (rows, cols, matrix)})
     
     return 0
     
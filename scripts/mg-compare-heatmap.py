@@ -4,7 +4,8 @@ import os
 import sys
 import json
 from argparse import ArgumentParser
-from mglib import obj_from_url, tab_to_matrix, AUTH_LIST, API_URL, biom_to_matrix, VERSION
+from mglib import obj_from_url, tab_to_array, AUTH_LIST, API_URL, biom_to_matrix, biom_to_array, VERSION, load_biom
+from mglib.compute import normalize, heatmap, top_variance_rows, DISTANCES, CLUSTER_METHODS
 
 prehelp = """
 NAME
@@ -14,7 +15,7 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-compare-heatmap [ --help, --input <input file or stdin>, --output <output file or stdout>, --format <cv: 'text' or 'biom'>, --cluster <cv: ward, single, complete, mcquitty, median, centroid>, --distance <cv: bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference>, --name <boolean>, --normalize <boolean> ]
+    mg-compare-heatmap [ --help, --input <input file or stdin>, --output <output file or stdout>, --format <cv: 'text' or 'biom'>, --cluster <cv: ward, single, complete, mcquitty, median, centroid>, --distance <cv: bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference>, --name <boolean>, --normalize <boolean>, --engine <cv: 'local' or 'api'>, --top <integer>, --pretty <boolean> ]
 
 DESCRIPTION
     Retrieve Dendogram Heatmap from abundance profiles for multiple metagenomes.
@@ -44,46 +45,73 @@ def main(args):
     ArgumentParser.format_epilog = lambda self, formatter: self.epilog
     parser = ArgumentParser(usage='', description=prehelp%VERSION, epilog=posthelp%AUTH_LIST)
     parser.add_argument("--url", dest="url", default=API_URL, help="communities API url")
-    parser.add_argument("--input", dest="input", default='-', help="input: filename or stdin (-), default is stdin")
+    parser.add_argument("--input", dest="input", default='-', help="input: filename, BIOM bundle directory, or stdin (-), default is stdin")
     parser.add_argument("--output", dest="output", default='-', help="output: filename or stdout (-), default is stdout")
     parser.add_argument("--format", dest="format", default='biom', help="input format: 'text' for tabbed table, 'biom' for BIOM format, default is biom")
     parser.add_argument("--cluster", dest="cluster", default='ward', help="cluster function, one of: ward, single, complete, mcquitty, median, centroid, default is ward")
     parser.add_argument("--distance", dest="distance", default='bray-curtis', help="distance function, one of: bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference, default is bray-curtis")
     parser.add_argument("--name", dest="name", type=int, default=0, help="label columns by name, default is by id: 1=true, 0=false")
     parser.add_argument("--normalize", dest="normalize", type=int, default=0, help="normalize the input data, default is off: 1=true, 0=false")
+    parser.add_argument("--engine", dest="engine", default='local', help="where to compute: 'local' in-process or 'api' on MG-RAST compute API, default is local")
+    parser.add_argument("--top", dest="top", type=int, default=0, help="cluster only this many rows with highest variance, default is all rows")
+    parser.add_argument("--pretty", dest="pretty", type=int, default=0, help="indent JSON output, default is off: 1=true, 0=false")
 
     # get inputs
     opts = parser.parse_args()
-    if (opts.input != '-') and (not os.path.isfile(opts.input)):
+    if (opts.input != '-') and (not os.path.exists(opts.input)):
         sys.stderr.write("ERROR: input data missing\n")
         return 1
     if opts.format not in ['text', 'biom']:
         sys.stderr.write("ERROR: invalid input format\n")
         return 1
+    if opts.engine not in ['local', 'api']:
+        sys.stderr.write("ERROR: invalid engine\n")
+        return 1
+    if opts.cluster not in CLUSTER_METHODS:
+        sys.stderr.write("ERROR: invalid cluster function\n")
+        return 1
+    if opts.distance not in DISTANCES:
+        sys.stderr.write("ERROR: invalid distance function\n")
+        return 1
     
     # parse inputs
     rows = []
     cols = []
     data = []
+    matrix = None
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
         if opts.format == 'biom':
             try:
-                biom = json.loads(indata)
-                rows, cols, data = biom_to_matrix(biom, col_name=opts.name)
+                biom = load_biom(opts.input)
+                if opts.engine == 'local':
+                    rows, cols, matrix = biom_to_array(biom, col_name=opts.name)
+                else:
+                    rows, cols, data = biom_to_matrix(biom, col_name=opts.name)
             except:
                 sys.stderr.write("ERROR: input BIOM data not correct format\n")
                 return 1
         else:
-            rows, cols, data = tab_to_matrix(indata)
+            in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
+            rows, cols, matrix = tab_to_array(in_hdl)
+            data = matrix.tolist()
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
 
     # retrieve data
-    raw  = '0' if opts.normalize else '1'
-    post = {"raw": raw, "cluster": opts.cluster, "distance": opts.distance, "columns": cols, "rows": rows, "data": data}
-    hmap = obj_from_url(opts.url+'/compute/heatmap', data=json.dumps(post, separators=(',',':')))
+    if opts.engine == 'local':
+        if opts.normalize:
+            matrix, keep = normalize(matrix)
+            rows = [rows[i] for i in keep]
+        if opts.top:
+            keep = top_variance_rows(matrix, opts.top)
+            matrix = matrix[keep]
+            rows = [rows[i] for i in keep]
+        hmap = heatmap(matrix, rows, cols, distance=opts.distance, method=opts.cluster)
+    else:
+        raw  = '0' if opts.normalize else '1'
+        post = {"raw": raw, "cluster": opts.cluster, "distance": opts.distance, "columns": cols, "rows": rows, "data": data}
+        hmap = obj_from_url(opts.url+'/compute/heatmap', data=json.dumps(post, separators=(',',':')))
     
     # output data
     if (not opts.output) or (opts.output == '-'):
@@ -91,7 +119,10 @@ def main(args):
     else:
         out_hdl = open(opts.output, 'w')
     
-    out_hdl.write(json.dumps(hmap, separators=(', ',': '), indent=4)+"\n")
+    if opts.pretty:
+        out_hdl.write(json.dumps(hmap, separators=(', ',': '), indent=4)+"\n")
+    else:
+        out_hdl.write(json.dumps(hmap, separators=(',',':'))+"\n")
     out_hdl.close()
     return 0
 
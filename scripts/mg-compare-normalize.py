@@ -3,8 +3,10 @@
 import os
 import sys
 import json
+import numpy as np
 from argparse import ArgumentParser
-from mglib import AUTH_LIST, VERSION, API_URL, random_str, biom_to_tab, biom_to_matrix, execute_r, tab_to_matrix, obj_from_url
+from mglib import AUTH_LIST, VERSION, API_URL, biom_to_array, execute_r, tab_to_array, obj_from_url, load_biom
+from mglib.compute import normalize, NORMALIZE_METHODS
 
 
 prehelp = """
@@ -15,7 +17,7 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-compare-normalize [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --output <output file or stdout> ]
+    mg-compare-normalize [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --engine <cv: 'local', 'api' or 'r'>, --output <output file or stdout> ]
 
 DESCRIPTION
     Calculate normalized values from abundance profiles for multiple metagenomes.
@@ -46,82 +48,83 @@ def main(args):
     parser = ArgumentParser(usage='', description=prehelp%VERSION, epilog=posthelp%AUTH_LIST)
     parser.add_argument("--url", dest="url", default=API_URL, help="communities API url")
     parser.add_argument("--rlib", dest="rlib", default=None, help="R lib path")
-    parser.add_argument("--input", dest="input", default='-', help="input: filename or stdin (-), default is stdin")
+    parser.add_argument("--engine", dest="engine", default=None, help="where to normalize: 'local' in-process, 'api' on MG-RAST compute API, or 'r' with R in rlib, default is local ('r' if --rlib given)")
+    parser.add_argument("--method", dest="method", default='mgrast', help="local normalize method: 'mgrast' (remove singletons, log, standardize, scale to 0-1), 'log', or 'standardize', default is mgrast")
+    parser.add_argument("--input", dest="input", default='-', help="input: filename, BIOM bundle directory, or stdin (-), default is stdin")
     parser.add_argument("--output", dest="output", default='-', help="output: filename or stdout (-), default is stdout")
     parser.add_argument("--outdir", dest="outdir", default=None, help="ouput is placed in dir as filenmae.obj, fielname.type, only for 'biom' input")
     parser.add_argument("--format", dest="format", default='biom', help="input / output format: 'text' for tabbed table, 'biom' for BIOM format, default is biom")
     
     # get inputs
     opts = parser.parse_args()
-    if (opts.input != '-') and (not os.path.isfile(opts.input)):
+    if (opts.input != '-') and (not os.path.exists(opts.input)):
         sys.stderr.write("ERROR: input data missing\n")
         return 1
     if opts.format not in ['text', 'biom']:
         sys.stderr.write("ERROR: invalid format\n")
         return 1
+    if not opts.engine:
+        opts.engine = 'r' if opts.rlib else 'local'
+    if opts.engine not in ['local', 'api', 'r']:
+        sys.stderr.write("ERROR: invalid engine\n")
+        return 1
+    if opts.method not in NORMALIZE_METHODS:
+        sys.stderr.write("ERROR: invalid method\n")
+        return 1
     if (not opts.rlib) and ('KB_PERL_PATH' in os.environ):
         opts.rlib = os.environ['KB_PERL_PATH']
+    if (opts.engine == 'r') and (not opts.rlib):
+        sys.stderr.write("ERROR: engine 'r' requires --rlib\n")
+        return 1
     
     # parse inputs
     biom = None
     rows = []
     cols = []
-    data = []
-    maxval = 0
-    tmp_in = 'tmp_'+random_str()+'.txt'
-    tmp_hdl = open(tmp_in, 'w')
+    matrix = None
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
         if opts.format == 'biom':
             try:
-                biom = json.loads(indata)
-                if opts.rlib:
-                    maxval = biom_to_tab(biom, tmp_hdl)
-                else:
-                    rows, cols, data = biom_to_matrix(biom)
+                biom = load_biom(opts.input)
+                rows, cols, matrix = biom_to_array(biom)
             except:
                 sys.stderr.write("ERROR: input BIOM data not correct format\n")
                 return 1
         else:
-            rows, cols, data = tab_to_matrix(indata)
-            data = map(lambda x: map(float, x), data) # floatify it
-            if opts.rlib:
-                tmp_hdl.write(indata)
+            in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
+            rows, cols, matrix = tab_to_array(in_hdl, dtype=np.float64)
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
-    finally:
-        tmp_hdl.close()
     
     # check values to see if already normalized, otherwise R fails badly
-    data = list(data)
-    if len(data) > 0:
-        maxval = max(map(max, data))
+    maxval = matrix.max() if matrix.shape[0] and matrix.shape[1] else 0
     if maxval <= 1:
-        os.remove(tmp_in)
         sys.stderr.write("ERROR: data is already normalized.\n")
         return 1
     
     # retrieve data
     norm = None
-    if opts.rlib:
-        tmp_out = 'tmp_'+random_str()+'.txt'
+    keep = None
+    if opts.engine == 'local':
+        ndata, keep = normalize(matrix, method=opts.method)
+        norm = {"columns": cols, "rows": [rows[i] for i in keep], "data": ndata.tolist()}
+    elif opts.engine == 'r':
+        # BIOM rows are matched back by id
+        rnames = [r['id'] for r in biom['rows']] if biom else rows
         r_cmd = """source("%s/preprocessing.r")
-suppressMessages( MGRAST_preprocessing(
-    file_in="%s",
-    file_out="%s"
-))"""%(opts.rlib, tmp_in, tmp_out)
-        execute_r(r_cmd)
-        nrows, ncols, ndata = tab_to_matrix(open(tmp_out, 'r').read())
-        num_data = map(lambda x: map(float, x), ndata)
-        norm = {"columns": ncols, "rows": nrows, "data": num_data}
-        os.remove(tmp_out)
+mgrast_norm <- suppressMessages( MGRAST_preprocessing(
+    file_in=mgrast_data,
+    file_out=NULL
+))"""%(opts.rlib)
+        nrows, ncols, ndata = execute_r(r_cmd, data={'mgrast_data': (rnames, cols, matrix)}, fetch=['mgrast_norm'])[0]
+        norm = {"columns": ncols, "rows": nrows, "data": ndata.tolist()}
     else:
+        data = matrix.toarray().tolist() if hasattr(matrix, 'toarray') else matrix.tolist()
         post = {"columns": cols, "rows": rows, "data": data}
         norm = obj_from_url(opts.url+'/compute/normalize', data=json.dumps(post, separators=(',',':')))
     
     # output data
-    os.remove(tmp_in)
     if (not opts.output) or (opts.output == '-'):
         out_hdl = sys.stdout
     else:
@@ -129,11 +132,10 @@ suppressMessages( MGRAST_preprocessing(
     
     if biom and (opts.format == 'biom'):
         # may have rows removed
-        new_rows = []
-        for r in biom['rows']:
-            if r['id'] in norm['rows']:
-                new_rows.append(r)
-        biom['rows'] = new_rows
+        if keep is not None:
+            biom['rows'] = [biom['rows'][i] for i in keep]
+        else:
+            biom['rows'] = [r for r in biom['rows'] if r['id'] in norm['rows']]
         biom['data'] = norm['data']
         biom['shape'][0] = len(biom['rows'])
         biom['id'] = biom['id']+'_normalized'
@@ -3,8 +3,9 @@
 import os
 import sys
 import json
+import numpy as np
 from argparse import ArgumentParser
-from mglib import VERSION, AUTH_LIST, get_auth_token, random_str, biom_to_tab, tab_to_matrix, execute_r, metadata_from_biom
+from mglib import VERSION, AUTH_LIST, get_auth_token, random_str, biom_to_tab_array, tab_to_array, tab_to_matrix, execute_r, metadata_from_biom
 
 prehelp = """
 NAME
@@ -14,7 +15,7 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-compare-pcoa-plot [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --plot <filename for png>, --reference <boolean>, --distance <cv: bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference>, --metadata <metadata field>, --groups <json string or filepath>, --group_pos <integer>, --color_auto <boolean>, --rlib <R lib path>, --height <image height in inches>, --width <image width in inches>, --dpi <image DPI>, --three <boolean>, --name <boolean>, --label <boolean> ]
+    mg-compare-pcoa-plot [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --plot <filename for png>, --distance <cv: bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference>, --metadata <metadata field>, --groups <json string or filepath>, --group_pos <integer>, --color_auto <boolean>, --rlib <R lib path>, --height <image height in inches>, --width <image width in inches>, --dpi <image DPI>, --three <boolean>, --name <boolean>, --label <boolean> ]
 
 DESCRIPTION
     Tool to generate PCoA vizualizations from metagenome abundance profiles.
@@ -81,7 +82,7 @@ def main(args):
         return 1
     if opts.metadata:
         opts.color_auto = 1
-    for o in ['reference', 'color_auto', 'three', 'name', 'label']:
+    for o in ['color_auto', 'three', 'name', 'label']:
         if getattr(opts, o) not in [0, 1]:
             sys.stderr.write("ERROR: invalid value for '%s'\n"%o)
             return 1
@@ -90,30 +91,27 @@ def main(args):
     token = get_auth_token(opts)
     
     # parse inputs
-    tmp_in  = 'tmp_'+random_str()+'.txt'
-    tmp_hdl = open(tmp_in, 'w')
     mg_list = []
     groups  = []
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
+        in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
         if opts.format == 'biom':
             try:
-                indata  = json.loads(indata)
-                mg_list = map(lambda x: x['id'], indata['columns'])
+                indata  = json.load(in_hdl)
+                mg_list = [c['id'] for c in indata['columns']]
                 col_name = True if opts.name == 1 else False
-                biom_to_tab(indata, tmp_hdl, col_name=col_name)
+                rows, cols, matrix = biom_to_tab_array(indata, col_name=col_name)
                 if opts.metadata:
                     groups = metadata_from_biom(indata, opts.metadata)
             except:
                 sys.stderr.write("ERROR: input BIOM data not correct format\n")
                 return 1
         else:
-            tmp_hdl.write(indata)
-            mg_list = indata.split('\n')[0].strip().split('\t')
+            rows, cols, matrix = tab_to_array(in_hdl, dtype=np.float64)
+            mg_list = cols
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
-    tmp_hdl.close()
     
     # get groups if not in BIOM metadata and option used
     if (len(groups) == 0) and opts.groups:
@@ -170,7 +168,7 @@ def main(args):
     color = 'TRUE' if opts.color_auto == 1 else 'FALSE'
     r_cmd = """source("%s/plot_mg_pcoa.r")
 suppressMessages( plot_mg_pcoa(
-    table_in="%s",
+    table_in=mgrast_data,
     image_out="%s",
     plot_pcs=%s,
     dist_metric="%s",
@@ -181,11 +179,10 @@ suppressMessages( plot_mg_pcoa(
     image_height_in=%.1f,
     image_width_in=%.1f,
     image_res_dpi=%d
-))"""%(opts.rlib, tmp_in, opts.plot, three, opts.distance, label, table, color, opts.height, opts.width, opts.dpi)
-    execute_r(r_cmd)
+))"""%(opts.rlib, opts.plot, three, opts.distance, label, table, color, opts.height, opts.width, opts.dpi)
+    execute_r(r_cmd, data={'mgrast_data': (rows, cols, matrix)})
     
     # cleanup
-    os.remove(tmp_in)
     if tmp_group:
         os.remove(tmp_group)
     
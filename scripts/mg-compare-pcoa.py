@@ -4,7 +4,9 @@ import os
 import sys
 import json
 from argparse import ArgumentParser
-from mglib import biom_to_matrix, metadata_from_biom, tab_to_matrix, obj_from_url, AUTH_LIST, VERSION, API_URL
+from mglib import biom_to_matrix, metadata_from_biom, tab_to_array, obj_from_url, AUTH_LIST, VERSION, API_URL, load_biom
+from mglib.biom import Biom
+from mglib.compute import normalize, distance_matrix, pcoa as principal_coordinates, DISTANCES
 
 prehelp = """
 NAME
@@ -14,7 +16,7 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-compare-pcoa [ --help, --input <input file or stdin>, --output <output file or stdout>, --format <cv: 'text' or 'biom'>, --distance <cv: bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference>, --metadata <metadata field>, --name <boolean>, --normalize <boolean> ]
+    mg-compare-pcoa [ --help, --input <input file or stdin>, --output <output file or stdout>, --format <cv: 'text' or 'biom'>, --distance <cv: bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference>, --metadata <metadata field>, --name <boolean>, --normalize <boolean>, --engine <cv: 'local' or 'api'>, --components <integer> ]
 
 DESCRIPTION
     Retrieve PCoA (Principal Coordinate Analysis) from abundance profiles for multiple metagenomes.
@@ -44,42 +46,57 @@ def main(args):
     ArgumentParser.format_epilog = lambda self, formatter: self.epilog
     parser = ArgumentParser(usage='', description=prehelp%VERSION, epilog=posthelp%AUTH_LIST)
     parser.add_argument("--url", dest="url", default=API_URL, help="communities API url")
-    parser.add_argument("--input", dest="input", default='-', help="input: filename or stdin (-), default is stdin")
+    parser.add_argument("--input", dest="input", default='-', help="input: filename, BIOM bundle directory, or stdin (-), default is stdin")
     parser.add_argument("--output", dest="output", default='-', help="output: filename or stdout (-), default is stdout")
     parser.add_argument("--format", dest="format", default='biom', help="input / output format: 'text' for tabbed table, 'biom' for BIOM / json format, default is biom")
     parser.add_argument("--metadata", dest="metadata", default=None, help="metadata field to group by, only for 'biom' input")
     parser.add_argument("--distance", dest="distance", default='bray-curtis', help="distance metric, one of: bray-curtis, euclidean, maximum, manhattan, canberra, minkowski, difference, default is bray-curtis")
     parser.add_argument("--name", dest="name", type=int, default=0, help="label columns by name, default is by id: 1=true, 0=false")
     parser.add_argument("--normalize", dest="normalize", type=int, default=0, help="normalize the input data, default is off: 1=true, 0=false")
+    parser.add_argument("--engine", dest="engine", default='local', help="where to compute: 'local' in-process or 'api' on MG-RAST compute API, default is local")
+    parser.add_argument("--components", dest="components", type=int, default=0, help="number of principal coordinates to compute, only for 'local' engine, default is all")
     
     # get inputs
     opts = parser.parse_args()
-    if (opts.input != '-') and (not os.path.isfile(opts.input)):
+    if (opts.input != '-') and (not os.path.exists(opts.input)):
         sys.stderr.write("ERROR: input data missing\n")
         return 1
     if opts.format not in ['text', 'biom']:
         sys.stderr.write("ERROR: invalid input format\n")
         return 1
+    if opts.engine not in ['local', 'api']:
+        sys.stderr.write("ERROR: invalid engine\n")
+        return 1
+    if opts.distance not in DISTANCES:
+        sys.stderr.write("ERROR: invalid distance\n")
+        return 1
     
     # parse inputs
     rows = []
     cols = []
     data = []
+    matrix = None
     groups = []
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
         if opts.format == 'biom':
             try:
-                biom = json.loads(indata)
+                biom = load_biom(opts.input)
                 col_name = True if opts.name == 1 else False
-                rows, cols, data = biom_to_matrix(biom, col_name=col_name)
+                if opts.engine == 'local':
+                    obj = Biom.from_dict(biom)
+                    cols = [c['name'] for c in obj.columns] if col_name else obj.col_ids
+                    matrix = obj.matrix
+                else:
+                    rows, cols, data = biom_to_matrix(biom, col_name=col_name)
                 if opts.metadata:
                     groups = metadata_from_biom(biom, opts.metadata)
             except:
                 sys.stderr.write("ERROR: input BIOM data not correct format\n")
                 return 1
         else:
-            rows, cols, data = tab_to_matrix(indata)
+            in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
+            rows, cols, matrix = tab_to_array(in_hdl)
+            data = matrix.tolist()
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
@@ -91,9 +108,16 @@ def main(args):
             gmap[cols[i]] = g
     
     # retrieve data
-    raw  = '0' if opts.normalize == 1 else '1'
-    post = {"raw": raw, "distance": opts.distance, "columns": cols, "rows": rows, "data": data}
-    pcoa = obj_from_url(opts.url+'/compute/pcoa', data=json.dumps(post, separators=(',',':')))
+    if opts.engine == 'local':
+        if opts.normalize == 1:
+            matrix, _ = normalize(matrix)
+        values, vectors = principal_coordinates(distance_matrix(matrix, opts.distance), k=opts.components or None)
+        coords = vectors.tolist()
+        pcoa = {"data": [{"id": c, "pco": coords[i]} for i, c in enumerate(cols)], "pco": values.tolist()}
+    else:
+        raw  = '0' if opts.normalize == 1 else '1'
+        post = {"raw": raw, "distance": opts.distance, "columns": cols, "rows": rows, "data": data}
+        pcoa = obj_from_url(opts.url+'/compute/pcoa', data=json.dumps(post, separators=(',',':')))
     
     # output data
     if (not opts.output) or (opts.output == '-'):
@@ -5,8 +5,8 @@ import sys
 import json
 from argparse import ArgumentParser
 import numpy as np
-from scipy import stats
-from mglib import safe_print, VERSION, AUTH_LIST, biom_to_matrix, metadata_from_biom, tab_to_matrix
+from mglib import safe_print, VERSION, AUTH_LIST, biom_to_array, metadata_from_biom, tab_to_matrix, load_biom, tab_to_array
+from mglib.compute import correlate, fdr
 
 prehelp = """
 NAME
@@ -16,10 +16,11 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-correlate-metadata [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --output <cv: 'full', 'minimum', 'biom'>, --metadata <metadata field>, --groups <json string or filepath>, --group_pos <integer>, --cutoff <float>, --fdr <boolean> ]
+    mg-correlate-metadata [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --output <cv: 'full', 'minimum', 'biom'>, --metadata <metadata fields>, --groups <json string or filepath>, --group_pos <integers>, --cutoff <float>, --fdr <boolean> ]
 
 DESCRIPTION
     Identify annotations with a significant correlation to a given metadata field using linear regression.
+    Several metadata fields (or group positions) may be given as a comma seperated list, each is correlated separately.
 """
 
 posthelp = """
@@ -40,36 +41,22 @@ AUTHORS
     %s
 """
 
-def calculate_fdr(p_values):
-    p_values = np.atleast_1d(p_values)
-    n_samples = p_values.size
-    order = p_values.argsort()
-    sp_values = p_values[order]
-    # compute q while in ascending order
-    q = np.minimum(1, n_samples * sp_values / np.arange(1, n_samples + 1))
-    for i in range(n_samples - 1, 0, - 1):
-        q[i - 1] = min(q[i], q[i - 1])
-    # reorder the results
-    inverse_order = np.arange(n_samples)
-    inverse_order[order] = np.arange(n_samples)
-    return q[inverse_order]
-
 def main(args):
     ArgumentParser.format_description = lambda self, formatter: self.description
     ArgumentParser.format_epilog = lambda self, formatter: self.epilog
     parser = ArgumentParser(usage='', description=prehelp%VERSION, epilog=posthelp%AUTH_LIST)
-    parser.add_argument("--input", dest="input", default='-', help="input: filename or stdin (-), default is stdin")
+    parser.add_argument("--input", dest="input", default='-', help="input: filename, BIOM bundle directory, or stdin (-), default is stdin")
     parser.add_argument("--format", dest="format", default='biom', help="input format: 'text' for tabbed table, 'biom' for BIOM format, default is biom")
     parser.add_argument("--output", dest="output", default='biom', help="output format: 'full' for tabbed abundances and stats, 'minimum' for tabbed stats only, 'biom' for BIOM format, default is biom")
-    parser.add_argument("--metadata", dest="metadata", default=None, help="metadata field to correlate, only for 'biom' input")
+    parser.add_argument("--metadata", dest="metadata", default=None, help="metadata field to correlate, or comma seperated list of fields, only for 'biom' input")
     parser.add_argument("--groups", dest="groups", default=None, help="list of groups in JSON or tabbed format - either as input string or filename")
-    parser.add_argument("--group_pos", dest="group_pos", type=int, default=1, help="position of group to use, default is 1 (first)")
-    parser.add_argument("--cutoff", dest="cutoff", default=None, help="only show p-value less than this, default show all")
+    parser.add_argument("--group_pos", dest="group_pos", default='1', help="position of group to use, or comma seperated list of positions, default is 1 (first)")
+    parser.add_argument("--cutoff", dest="cutoff", type=float, default=None, help="only show p-value less than this, default show all")
     parser.add_argument("--fdr", dest="fdr", action="store_true", default=False, help="output FDR for computed p-values, default is off")
     
     # get inputs
     opts = parser.parse_args()
-    if (opts.input != '-') and (not os.path.isfile(opts.input)):
+    if (opts.input != '-') and (not os.path.exists(opts.input)):
         sys.stderr.write("ERROR: input data missing\n")
         return 1
     if opts.format not in ['text', 'biom']:
@@ -78,103 +65,121 @@ def main(args):
     if opts.output not in ['full', 'minimum', 'biom']:
         sys.stderr.write("ERROR: invalid output format\n")
         return 1
+    try:
+        positions = [int(x) for x in opts.group_pos.split(',')]
+    except ValueError:
+        sys.stderr.write("ERROR: invalid group position\n")
+        return 1
     
     # parse inputs
     biom = None
     rows = []
     cols = []
-    data = []    
-    groups = []
+    matrix = None
+    fields = []  # (name, value for each metagenome)
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
         if opts.format == 'biom':
             try:
-                biom = json.loads(indata)
-                rows, cols, data = biom_to_matrix(biom)
+                biom = load_biom(opts.input)
+                rows, cols, matrix = biom_to_array(biom)
                 if opts.metadata:
-                    groups = metadata_from_biom(biom, opts.metadata)
+                    for name in opts.metadata.split(','):
+                        fields.append((name, metadata_from_biom(biom, name)))
             except:
                 sys.stderr.write("ERROR: input BIOM data not correct format\n")
                 return 1
         else:
-            rows, cols, data = tab_to_matrix(indata)
+            in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
+            rows, cols, matrix = tab_to_array(in_hdl)
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
     
     # get groups if not in BIOM metadata and option used
-    if (len(groups) == 0) and opts.groups:
+    if (len(fields) == 0) and opts.groups:
         # is it json ?
         ## example of 2 group sets in json format
         ## [ {"group1": ["mg_id_1", "mg_id_2"], "group2": ["mg_id_3", "mg_id_4", "mg_id_5"]},
         ##   {"group1": ["mg_id_1", "mg_id_2", "mg_id_3"], "group2": ["mg_id_4", "mg_id_5"]} ]
         try:
             gdata = json.load(open(opts.groups, 'r')) if os.path.isfile(opts.groups) else json.loads(opts.groups)
-            if opts.group_pos > len(gdata):
-                sys.stderr.write("ERROR: position (%d) of metadata is out of bounds\n"%opts.group_pos)
-                return 1
-            for m in cols:
-                found_g = None
-                for g, mgs in gdata[opts.group_pos-1].items():
-                    if m in mgs:
-                        found_g = g
-                        break
-                if found_g:
-                    groups.append(found_g)
-                else:
-                    sys.stderr.write("ERROR: metagenome %s missing metadata\n"%m)
-                    return 1                  
+            for pos in positions:
+                if pos > len(gdata):
+                    sys.stderr.write("ERROR: position (%d) of metadata is out of bounds\n"%pos)
+                    return 1
+                groups = []
+                for m in cols:
+                    found_g = None
+                    for g, mgs in gdata[pos-1].items():
+                        if m in mgs:
+                            found_g = g
+                            break
+                    if found_g:
+                        groups.append(found_g)
+                    else:
+                        sys.stderr.write("ERROR: metagenome %s missing metadata\n"%m)
+                        return 1
+                fields.append((str(pos), groups))
         # no - its tabbed
         except:
             gtext = open(opts.groups, 'r').read() if os.path.isfile(opts.groups) else opts.groups
             grows, gcols, gdata = tab_to_matrix(gtext)
-            if opts.group_pos > len(gdata[0]):
-                sys.stderr.write("ERROR: position (%d) of metadata is out of bounds\n"%opts.group_pos)
-            for m in cols:
-                try:
-                    midx = gcols.index(m)
-                    groups.append(gdata[midx][opts.group_pos-1])
-                except:
-                    sys.stderr.write("ERROR: metagenome %s missing metadata\n"%m)
-                    return 1
+            for pos in positions:
+                if pos > len(gdata[0]):
+                    sys.stderr.write("ERROR: position (%d) of metadata is out of bounds\n"%pos)
+                groups = []
+                for m in cols:
+                    try:
+                        midx = gcols.index(m)
+                        groups.append(gdata[midx][pos-1])
+                    except:
+                        sys.stderr.write("ERROR: metagenome %s missing metadata\n"%m)
+                        return 1
+                fields.append((str(pos), groups))
     
     # validate metadata
-    if len(groups) != len(cols):
+    if (len(fields) == 0) or any(len(groups) != len(cols) for name, groups in fields):
         sys.stderr.write("ERROR: Not all metagenomes have metadata\n")
         return 1
     try:
-        groups = map(lambda x: float(x), groups)
-    except:
+        meta = np.array([groups for name, groups in fields], dtype=np.float64).T
+    except (TypeError, ValueError):
         sys.stderr.write("ERROR: Metadata is not numeric\n")
         return 1
     
-    # check correlation
-    results = []
-    pvalues = []
-    for i, a in enumerate(rows): # annotations
-        l_meta = []
-        l_anno = []
-        for j, m in enumerate(cols): # metagenomes
-            l_meta.append(groups[j])
-            l_anno.append(float(data[i][j]))
-        gradient, intercept, r_value, p_value, std_err = stats.linregress(l_meta, l_anno)
-        if biom and (opts.output == 'biom'):
-            results.append([('r-value', r_value), ('p-value', p_value)])
-            pvalues.append(p_value)
-        else:
-            if opts.output == 'full':
-                l_result = [a]+[float(x) for x in data[i]]+[r_value, p_value]
-            elif opts.output == 'minimum':
-                l_result = [a, r_value, p_value]
-            if (not opts.cutoff) or (opts.cutoff and (p_value < opts.cutoff)):
-                results.append(l_result)
-                pvalues.append(p_value)
+    # check correlation, all annotations against all metadata fields at once
+    names = [name for name, groups in fields]
+    gradient, r_value, p_value = correlate(matrix, meta)
+    as_biom = biom and (opts.output == 'biom')
+    if as_biom or (not opts.cutoff):
+        keep = np.arange(len(rows))
+    else:
+        keep = np.flatnonzero((p_value < opts.cutoff).any(axis=1))
+    r_value, p_value = r_value[keep], p_value[keep]
     
     # calculate fdr
-    if opts.fdr and pvalues:
-        fdr_values = calculate_fdr(pvalues)
-        for i, x in enumerate(fdr_values):
-            results[i].append(('fdr', x) if biom and (opts.output == 'biom') else x)
+    fdr_value = None
+    if opts.fdr and len(keep):
+        fdr_value = np.column_stack([fdr(p_value[:,j]) for j in range(len(names))])
+    
+    # per-row stats for each metadata field
+    results = []
+    for i in range(len(keep)):
+        stats = []
+        for j in range(len(names)):
+            if as_biom:
+                fstats = [('r-value', r_value[i,j]), ('p-value', p_value[i,j])]
+                if fdr_value is not None:
+                    fstats.append(('fdr', fdr_value[i,j]))
+            else:
+                fstats = [r_value[i,j], p_value[i,j]]
+                if fdr_value is not None:
+                    fstats.append(fdr_value[i,j])
+            stats.append(fstats)
+        if as_biom:
+            results.append(stats[0] if len(names) == 1 else dict(zip(names, stats)))
+        else:
+            results.append(sum(stats, []))
     
     # output
     if biom and (opts.output == 'biom'):
@@ -191,15 +196,20 @@ def main(args):
         biom['rows'] = new_rows
         safe_print(json.dumps(biom)+'\n')
     else:
+        if (opts.output == 'full') and hasattr(matrix, 'toarray'):
+            matrix = matrix.toarray()
         header = ['r-value', 'p-value']
-        if opts.output == 'full':
-            header = header
         if opts.fdr:
             header.append('fdr')
+        if len(names) > 1:
+            header = [n+' '+h for n in names for h in header]
         safe_print("\t%s\n"%"\t".join(header))
-        for r in results:
-            safe_print(r[0])
-            for x in r[1:]:
+        for i, k in enumerate(keep):
+            safe_print(rows[k])
+            values = results[i]
+            if opts.output == 'full':
+                values = matrix[k].tolist() + values
+            for x in values:
                 if int(x) == float(x):
                     safe_print("\t%d"%int(x))
                 else:
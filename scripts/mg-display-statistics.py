@@ -3,7 +3,7 @@
 import sys
 import math
 from argparse import ArgumentParser
-from mglib import safe_print, VERSION, API_URL, AUTH_LIST, obj_from_url, get_auth_token
+from mglib import safe_print, VERSION, API_URL, AUTH_LIST, cached_obj_from_url, get_auth_token
 import mglib.aplotter as aplotter
 
 prehelp = """
@@ -86,7 +86,7 @@ def main(args):
     url = opts.url+'/metagenome/'+opts.id+'?verbosity=stats&public=1'
 
     # retrieve / output data
-    result = obj_from_url(url, auth=token)
+    result = cached_obj_from_url(url, auth=token)
     stats  = result['statistics']
     if opts.stat == 'sequence':
         for s in sorted(stats['sequence_stats'].keys()):
@@ -2,9 +2,12 @@
 
 import sys
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from argparse import ArgumentParser
 from prettytable import PrettyTable
-from mglib import VERSION, get_auth_token, AUTH_LIST, API_URL, obj_from_url, file_from_url
+from mglib import VERSION, get_auth_token, AUTH_LIST, API_URL, obj_from_url, download_file, file_md5, aio
 
 prehelp = """
 NAME
@@ -14,7 +17,7 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-download [ --help, --user <user>, --passwd <password>, --token <oAuth token>, --project <project id>, --metagenome <metagenome id>, --file <file id> --dir <directory name> --list <list files for given id>]
+    mg-download [ --help, --user <user>, --passwd <password>, --token <oAuth token>, --project <project id>, --metagenome <metagenome id>, --file <file id> --dir <directory name> --list <list files for given id> --workers <number of parallel downloads>]
 
 DESCRIPTION
     Retrieve metadata for a metagenome.
@@ -36,16 +39,49 @@ AUTHORS
     %s
 """
 
-# download a file
+# number of attempts per file, later attempts resume the partial download
+MAX_TRIES = 3
+# returned by file_download for listing entries that cannot be downloaded
+SKIPPED = 'skipped'
+print_lock = threading.Lock()
+
+# download a file, returns (bytes transferred, seconds), SKIPPED if it has no url, or None on failure
+#  a transfer error or checksum mismatch is retried up to MAX_TRIES times
 def file_download(auth, info, dirpath="."):
-    sys.stdout.write("Downloading %s for %s ... "%(info['file_name'], info['id']))
-    if "url" in info.keys():  # all is well
-        fhandle = open(os.path.join(dirpath, info['file_name']), 'w')
-        file_from_url(info['url'], fhandle, auth=auth)
-        fhandle.close()
-    else:   # Don't open empty file if download doesn't have url
+    if "url" not in info.keys():  # Don't open empty file if download doesn't have url
         sys.stderr.write("WARNING Download info does not contain url.  Possibly datasets pre- human screening?\n" + repr(info)+"\n")
-    sys.stdout.write("Done\n")
+        return SKIPPED
+    path  = os.path.join(dirpath, info['file_name'])
+    md5   = info.get('file_md5')
+    if md5 and os.path.isfile(path) and (file_md5(path) == md5):
+        with print_lock:
+            sys.stdout.write("Skipping %s for %s, checksum matches\n"%(info['file_name'], info['id']))
+        return 0, 0.0
+    start = time.time()
+    size = None
+    resumed = False
+    for attempt in range(MAX_TRIES):
+        resumed = os.path.isfile(path + '.part')
+        try:
+            # None on checksum mismatch, the partial file is removed so the next attempt starts over
+            size = download_file(info['url'], path, auth=auth, md5=md5, size=int(info['file_size']) if info.get('file_size') else None)
+            if size is not None:
+                break
+            sys.stderr.write("ERROR downloading %s for %s (attempt %d of %d): checksum mismatch\n"%(info['file_name'], info['id'], attempt+1, MAX_TRIES))
+        except Exception as error:
+            sys.stderr.write("ERROR downloading %s for %s (attempt %d of %d): %s\n"%(info['file_name'], info['id'], attempt+1, MAX_TRIES, error))
+            size = None
+    if size is None:
+        return None
+    secs = time.time() - start
+    with print_lock:
+        if (size == 0) and resumed:
+            sys.stdout.write("Finished %s for %s, partial download was already complete\n"%(info['file_name'], info['id']))
+        elif size == 0:
+            sys.stdout.write("Downloaded %s for %s: empty file\n"%(info['file_name'], info['id']))
+        else:
+            sys.stdout.write("Downloaded %s for %s: %d bytes in %.1fs (%.2f MB/s)\n"%(info['file_name'], info['id'], size, secs, size / max(secs, 1e-6) / 1e6))
+    return size, secs
 
 def main(args):
     ArgumentParser.format_description = lambda self, formatter: self.description
@@ -60,6 +96,7 @@ def main(args):
     parser.add_argument("--file", dest="file", default="299.1", help="file ID for given project or metagenome")
     parser.add_argument("--dir", dest="dir", default=".", help="directory to do downloads")
     parser.add_argument("--list", dest="list", action="store_true", default=False, help="list files and their info for given ID")
+    parser.add_argument("--workers", dest="workers", type=int, default=4, help="number of files to download in parallel, default is 4")
 
     # get inputs
     opts = parser.parse_args()
@@ -91,9 +128,8 @@ def main(args):
         mgs.append(METAGENOME)
     # get file lists
     all_files = {}
-    for mg in mgs:
-        url = URL + '/download/' + mg
-        data = obj_from_url(url, auth=token)
+    listings = aio.run(aio.gather([aio.obj_from_url(URL+'/download/'+mg, auth=token) for mg in mgs]))
+    for mg, data in zip(mgs, listings):
         all_files[mg] = data['data']
 
     # just list
@@ -113,6 +149,7 @@ def main(args):
         DOWNDIR = os.path.join(DOWNDIR, PROJECT)
         if not os.path.isdir(DOWNDIR):
             os.mkdir(DOWNDIR)
+    jobs = []
     for mg, files in all_files.items():
         mgdir = os.path.join(DOWNDIR, mg)
         if not os.path.isdir(mgdir):
@@ -122,15 +159,30 @@ def main(args):
             if FILE:
                 if f['file_id'] == FILE:
                     filecount += 1
-                    file_download(token, f, dirpath=mgdir)
+                    jobs.append((f, mgdir))
                 elif f['file_name'] == FILE:
                     filecount += 1
-                    file_download(token, f, dirpath=mgdir)
+                    jobs.append((f, mgdir))
             else:
-                file_download(token, f, dirpath=mgdir)
+                jobs.append((f, mgdir))
                 filecount += 1
         if filecount == 0:
             sys.exit("Didn't find file number " + FILE)
+
+    # download in parallel, partial files are resumed on rerun
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=opts.workers) as pool:
+        results = list(pool.map(lambda job: file_download(token, job[0], dirpath=job[1]), jobs))
+    secs   = time.time() - start
+    failed  = len([r for r in results if r is None])
+    skipped = len([r for r in results if r is SKIPPED])
+    total   = sum([r[0] for r in results if isinstance(r, tuple)])
+    sys.stdout.write("Downloaded %d of %d files: %d bytes in %.1fs (%.2f MB/s)\n"%(len(jobs)-failed-skipped, len(jobs), total, secs, total / max(secs, 1e-6) / 1e6))
+    if skipped:
+        sys.stderr.write("WARNING: %d file(s) without download url skipped\n"%skipped)
+    if failed:
+        sys.stderr.write("ERROR: %d file(s) failed, rerun to resume\n"%failed)
+        return 1
     return 0
 
 if __name__ == "__main__":
@@ -145,7 +145,7 @@ def main(args):
             open(dst, 'w').write(text)
             sha1s.append([ hashlib.sha1(text).hexdigest(), os.path.join(folder, info["bundledAs"]["filename"]) ])
         else:
-            fh = open(os.path.join(folder_dir, info["bundledAs"]["filename"]), 'w')
+            fh = open(os.path.join(folder_dir, info["bundledAs"]["filename"]), 'wb')
             s1 = file_from_url(info["uri"], fh, auth=token, sha1=True)
             fh.close()
             sha1s.append([ s1, os.path.join(folder, info["bundledAs"]["filename"]) ])
@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 
 import sys
+import shutil
+import tempfile
 from argparse import ArgumentParser
-from mglib import urlencode, API_URL, VERSION, AUTH_LIST, get_auth_token, obj_from_url, SEARCH_FIELDS, stdout_from_url, safe_print
+from mglib import urlencode, API_URL, VERSION, AUTH_LIST, get_auth_token, obj_from_url, SEARCH_FIELDS, safe_print, aio
 
 prehelp = """
 NAME
@@ -81,7 +83,9 @@ def main(args):
         for d in result['data']:
             mgids.add(d['id'])
 
-    # get sequences for mgids
+    # get sequences for mgids, fetched concurrently into temp files
+    mgids = sorted(mgids)
+    urls  = []
     for mg in mgids:
         params = [ ('source', opts.source),
                    ('evalue', opts.evalue),
@@ -95,10 +99,17 @@ def main(args):
             params.append(('filter', opts.function))
             if opts.level:
                 params.append(('filter_level', opts.level))
-        url = opts.url+'/annotation/sequence/'+mg+'?'+urlencode(params, True)
-        # output data
+        urls.append(opts.url+'/annotation/sequence/'+mg+'?'+urlencode(params, True))
+    tmp_hdls = [tempfile.TemporaryFile('w+b') for mg in mgids]
+    aio.run(aio.gather([aio.file_from_url(url, tmp_hdls[i], auth=token) for i, url in enumerate(urls)]))
+    
+    # output data
+    for mg, tmp_hdl in zip(mgids, tmp_hdls):
         safe_print('Results from '+mg+":\n")
-        stdout_from_url(url, auth=token)
+        sys.stdout.flush()
+        tmp_hdl.seek(0)
+        shutil.copyfileobj(tmp_hdl, sys.stdout.buffer)
+        tmp_hdl.close()
     
     return 0
     
@@ -3,8 +3,10 @@
 import os
 import sys
 import json
+import numpy as np
 from argparse import ArgumentParser
-from mglib import AUTH_LIST, VERSION, random_str, biom_to_tab, metadata_from_biom, tab_to_matrix, execute_r, safe_print
+from mglib import AUTH_LIST, VERSION, biom_to_tab_array, metadata_from_biom, tab_to_matrix, tab_to_array, execute_r, r_table, safe_print, load_biom
+from mglib.compute import group_test, holm, GROUP_TESTS
 
 
 prehelp = """
@@ -15,10 +17,11 @@ VERSION
     %s
 
 SYNOPSIS
-    mg-group-significance [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --output <cv: 'text' or 'biom'>, --metadata <metadata field>, --groups <json string or filepath>, --group_pos <integer>, --plot <filename for pdf>, --rlib <R lib path>, --stat_test <cv: Kruskal-Wallis, t-test-paired, Wilcoxon-paired, t-test-unpaired, Mann-Whitney-unpaired-Wilcoxon, ANOVA-one-way>, --order <column number>, --direction <cv: 'asc', 'desc'>, --height <image height in inches>, --width <image width in inches>, --dpi <image DPI> ]
+    mg-group-significance [ --help, --input <input file or stdin>, --format <cv: 'text' or 'biom'>, --output <cv: 'text' or 'biom'>, --metadata <metadata field>, --groups <json string or filepath>, --group_pos <integer>, --plot <filename for pdf>, --rlib <R lib path>, --stat_test <cv: Kruskal-Wallis, t-test-paired, Wilcoxon-paired, t-test-unpaired, Mann-Whitney-unpaired-Wilcoxon, ANOVA-one-way>, --order <column number>, --direction <cv: 'asc', 'desc'>, --height <image height in inches>, --width <image width in inches>, --dpi <image DPI>, --engine <cv: 'local' or 'r'> ]
 
 DESCRIPTION
     Tool to apply matR-based statistical tests to grouped metagenomic abundace profiles.
+    Tests are computed in-process, R is used for Wilcoxon-paired, for plots, or when requested with --engine r.
 """
 
 posthelp = """
@@ -41,11 +44,26 @@ AUTHORS
     %s
 """
 
+# tabbed table of group_stats_plot.r: data columns, mean of all samples, group means and sds,
+# test statistic, p-value and Holm adjusted p-value, rows ordered by given 1-based column
+# (default last) with missing values last
+def stats_table(rows, cols, matrix, groups, stat_test, order_by=None, decreasing=True):
+    dense = matrix.toarray() if hasattr(matrix, 'toarray') else np.asarray(matrix, dtype=np.float64)
+    res = group_test(dense, groups, stat_test)
+    summary = np.column_stack([dense, dense.mean(axis=1), res['mean'], res['sd'], res['statistic'], res['p'], holm(res['p'])])
+    header = cols + ['mean_all_samples'] + [l+'::group_mean' for l in res['levels']] + [l+'::group_sd' for l in res['levels']]
+    header += [stat_test+'::stat', stat_test+'::p', stat_test+'::fdr']
+    key = summary[:, (int(order_by) - 1) if order_by is not None else -1]
+    valid = np.flatnonzero(~np.isnan(key))
+    order = valid[np.argsort(-key[valid] if decreasing else key[valid], kind='stable')]
+    order = np.concatenate([order, np.flatnonzero(np.isnan(key))])
+    return r_table([rows[i] for i in order], header, summary[order])
+
 def main(args):
     ArgumentParser.format_description = lambda self, formatter: self.description
     ArgumentParser.format_epilog = lambda self, formatter: self.epilog
     parser = ArgumentParser(usage='', description=prehelp%VERSION, epilog=posthelp%AUTH_LIST)
-    parser.add_argument("--input", dest="input", default='-', help="input: filename or stdin (-), default is stdin")
+    parser.add_argument("--input", dest="input", default='-', help="input: filename, BIOM bundle directory, or stdin (-), default is stdin")
     parser.add_argument("--format", dest="format", default='biom', help="input format: 'text' for tabbed table, 'biom' for BIOM format, default is biom")
     parser.add_argument("--output", dest="output", default='biom', help="output format: 'text' for tabbed table, 'biom' for BIOM format, default is biom")
     parser.add_argument("--plot", dest="plot", default=None, help="filename for output plot, optional")
@@ -59,10 +77,11 @@ def main(args):
     parser.add_argument("--height", dest="height", type=float, default=6, help="image height in inches, default is 6")
     parser.add_argument("--width", dest="width", type=float, default=6, help="image width in inches, default is 6")
     parser.add_argument("--dpi", dest="dpi", type=int, default=300, help="image DPI, default is 300")
+    parser.add_argument("--engine", dest="engine", default='local', help="where to compute: 'local' in-process (R only for tests or plots without a native version) or 'r' with R in rlib, default is local")
     
     # get inputs
     opts = parser.parse_args()
-    if (opts.input != '-') and (not os.path.isfile(opts.input)):
+    if (opts.input != '-') and (not os.path.exists(opts.input)):
         sys.stderr.write("ERROR: input data missing\n")
         return 1
     if opts.format not in ['text', 'biom']:
@@ -71,9 +90,13 @@ def main(args):
     if opts.output not in ['text', 'biom']:
         sys.stderr.write("ERROR: invalid output format\n")
         return 1
+    if opts.engine not in ['local', 'r']:
+        sys.stderr.write("ERROR: invalid engine\n")
+        return 1
+    use_r = (opts.engine == 'r') or opts.plot or (opts.stat_test not in GROUP_TESTS)
     if (not opts.rlib) and ('KB_PERL_PATH' in os.environ):
         opts.rlib = os.environ['KB_PERL_PATH']
-    if not opts.rlib:
+    if use_r and (not opts.rlib):
         sys.stderr.write("ERROR: missing path to R libs\n")
         return 1
     if opts.direction not in ['asc', 'desc']:
@@ -81,31 +104,27 @@ def main(args):
         return 1
     
     # parse inputs
-    tmp_in  = 'tmp_'+random_str()+'.txt'
-    tmp_out = 'tmp_'+random_str()+'.txt'
-    tmp_hdl = open(tmp_in, 'w')
     mg_list = []
     groups  = []
     biom = None
+    rows = []
+    matrix = None
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
         if opts.format == 'biom':
             try:
-                biom = json.loads(indata)
-                mg_list = map(lambda x: x['id'], biom['columns'])
-                biom_to_tab(biom, tmp_hdl)
+                biom = load_biom(opts.input)
+                rows, mg_list, matrix = biom_to_tab_array(biom)
                 if opts.metadata:
                     groups = metadata_from_biom(biom, opts.metadata)
             except:
                 sys.stderr.write("ERROR: input BIOM data not correct format\n")
                 return 1
         else:
-            tmp_hdl.write(indata)
-            mg_list = indata.split('\n')[0].strip().split('\t')
+            in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
+            rows, mg_list, matrix = tab_to_array(in_hdl, dtype=np.float64)
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
-    tmp_hdl.close()
     
     # get groups if not in BIOM metadata and option used
     if (len(groups) == 0) and opts.groups:
@@ -148,15 +167,16 @@ def main(args):
         sys.stderr.write("ERROR: Not all metagenomes in a group\n")
         return 1
     
-    # build R cmd
-    fig_out    = '"%s"'%opts.plot if opts.plot else 'NULL'
-    order_by   = 'NULL' if opts.order is None else int(opts.order)
-    order_desc = 'TRUE' if opts.direction == 'desc' else 'FALSE'
-    group_str  = 'c('+','.join(map(lambda x: '"%s"'%x, groups))+')'
-    r_cmd = """source("%s/group_stats_plot.r")
-suppressMessages( group_stats_plot(
-    file_in="%s",
-    file_out="%s",
+    if use_r:
+        # build R cmd
+        fig_out    = '"%s"'%opts.plot if opts.plot else 'NULL'
+        order_by   = 'NULL' if opts.order is None else int(opts.order)
+        order_desc = 'TRUE' if opts.direction == 'desc' else 'FALSE'
+        group_str  = 'c('+','.join(map(lambda x: '"%s"'%x, groups))+')'
+        r_cmd = """source("%s/group_stats_plot.r")
+mgrast_stats <- suppressMessages( group_stats_plot(
+    file_in=mgrast_data,
+    file_out=NULL,
     figure_out=%s,
     figure_width_in=%.1f,
     figure_height_in=%.1f,
@@ -165,14 +185,17 @@ suppressMessages( group_stats_plot(
     order_by=%s,
     order_decreasing=%s,
     my_grouping=%s
-))"""%(opts.rlib, tmp_in, tmp_out, fig_out, opts.height, opts.width, opts.dpi, opts.stat_test, order_by, order_desc, group_str)
-    execute_r(r_cmd)
+))"""%(opts.rlib, fig_out, opts.height, opts.width, opts.dpi, opts.stat_test, order_by, order_desc, group_str)
+        srows, scols, stats = execute_r(r_cmd, data={'mgrast_data': (rows, mg_list, matrix)}, fetch=['mgrast_stats'])[0]
+        results = r_table(srows, scols, stats)
+    else:
+        try:
+            results = stats_table(rows, mg_list, matrix, groups, opts.stat_test, opts.order, opts.direction == 'desc')
+        except (ValueError, IndexError) as e:
+            sys.stderr.write("ERROR: %s\n"%e)
+            return 1
     
     # output results
-    results = open(tmp_out, 'r').read()
-    os.remove(tmp_in)
-    os.remove(tmp_out)
-    
     if biom and (opts.output == 'biom'):
         cnum = biom['shape'][1]
         rids = [r['id'] for r in biom['rows']]
@@ -6,7 +6,7 @@ import json
 from operator import itemgetter
 from argparse import ArgumentParser
 from prettytable import PrettyTable
-from mglib import VERSION, API_URL, AUTH_LIST, get_auth_token, obj_from_url, SHOCK_URL, post_file, get_auth, login
+from mglib import VERSION, API_URL, AUTH_LIST, get_auth_token, obj_from_url, SHOCK_URL, post_file, post_file_parts, PART_SIZE, get_auth, login
 
 DEBUG = 0
 
@@ -179,7 +179,15 @@ def upload(files):
         data = {
             "attributes_str": attr
         }
-        result = post_file(SHOCK_URL+"/node", fformat, f, data=data, auth=mgrast_auth['token'], debug=DEBUG)
+        # large files go in parts, rerunning an interrupted upload resumes it
+        if os.path.getsize(f) > PART_SIZE:
+            compression = None if fformat == "upload" else fformat
+            result = post_file_parts(SHOCK_URL+"/node", f, data=data, auth=mgrast_auth['token'], debug=DEBUG, compression=compression)
+        else:
+            result = post_file(SHOCK_URL+"/node", fformat, f, data=data, auth=mgrast_auth['token'], debug=DEBUG)
+        if not result:
+            sys.stderr.write("ERROR: can not upload %s\n"%f)
+            sys.exit(1)
         # compute file info
         info = obj_from_url(API_URL+"/inbox/info/"+result['data']['id'], auth=mgrast_auth['token'], debug=DEBUG)
         print(info['status'])
@@ -4,7 +4,7 @@ import sys
 import os
 import json
 from argparse import ArgumentParser
-from mglib import API_URL, obj_from_url, VERSION, AUTH_LIST, biom_to_matrix, safe_print
+from mglib import API_URL, cached_obj_from_url, VERSION, AUTH_LIST, biom_to_matrix, safe_print, aio
 
 prehelp = """
 NAME
@@ -36,26 +36,64 @@ AUTHORS
     %s
 """
 
-# get subsystems->roles and md5s per ko id
-def ko2roles(opts, sshier, koid):
-    ko_anno = obj_from_url(opts.url+'/m5nr/accession/'+koid+'?version=1&source=KO&limit=1000')
-    ko_md5s = set(map(lambda x: x['md5'], ko_anno['data']))
-    if len(ko_md5s) == 0:
-        return [], []
-    ko_post = {'version': 1, 'source': 'Subsystems', 'data': list(ko_md5s), 'limit': 10000}
-    ss_anno = obj_from_url(opts.url+'/m5nr/md5', data=json.dumps(ko_post, separators=(',',':')))
-    roles   = set()
-    for ss in ss_anno['data']:
+# number of values per m5nr POST, chunks are sent concurrently
+CHUNK_SIZE = 100
+# maximum m5nr records returned per value
+RECORD_LIMIT = 1000
+
+# POST values in chunks to m5nr resource, return all annotation records
+def m5nr_post(opts, resource, values, params):
+    posts = []
+    for i in range(0, len(values), CHUNK_SIZE):
+        post = dict(params)
+        post['data'] = values[i:i+CHUNK_SIZE]
+        post['limit'] = RECORD_LIMIT * len(post['data'])
+        posts.append(aio.obj_from_url(opts.url+'/m5nr/'+resource, data=json.dumps(post, separators=(',',':'))))
+    records = []
+    for result in aio.run(aio.gather(posts)):
+        records.extend(result['data'])
+    return records
+
+# get subsystems->roles and md5s for all ko ids
+def ko2roles(opts, sshier, koids):
+    ko_md5s = dict([ (k, set()) for k in koids ])
+    for ko in m5nr_post(opts, 'accession', sorted(ko_md5s.keys()), {'version': 1, 'source': 'KO'}):
+        if ko['accession'] in ko_md5s:
+            ko_md5s[ko['accession']].add(ko['md5'])
+    md5_roles = {}
+    all_md5s  = set()
+    for md5s in ko_md5s.values():
+        all_md5s.update(md5s)
+    for ss in m5nr_post(opts, 'md5', sorted(all_md5s), {'version': 1, 'source': 'Subsystems'}):
         if ss['accession'] in sshier:
-            roles.add(sshier[ss['accession']]['level4'])
-    return list(roles), list(ko_md5s)
+            md5_roles.setdefault(ss['md5'], set()).add(sshier[ss['accession']]['level4'])
+    ko_roles = {}
+    for ko, md5s in ko_md5s.items():
+        ko_roles[ko] = set()
+        for md5 in md5s:
+            ko_roles[ko].update(md5_roles.get(md5, []))
+    return ko_roles, ko_md5s
 
-# get fig ids per subsystem and roles
-def role2figs(opts, role, md5s):
-    post = {'version': 1, 'source': 'SEED', 'data': [role], 'md5s': md5s, 'exact': 1, 'limit': 10000}
-    anno = obj_from_url(opts.url+'/m5nr/function', data=json.dumps(post, separators=(',',':')))
-    fids = set(map(lambda x: x['accession'], anno['data']))
-    return list(fids)
+# get fig ids per (role, md5) for all roles
+def role2figs(opts, ko_roles, ko_md5s):
+    role_md5s = {}
+    for ko, roles in ko_roles.items():
+        for role in roles:
+            role_md5s.setdefault(role, set()).update(ko_md5s[ko])
+    roles = sorted(role_md5s.keys())
+    posts = []
+    for i in range(0, len(roles), CHUNK_SIZE):
+        sub_roles = roles[i:i+CHUNK_SIZE]
+        md5s = set()
+        for role in sub_roles:
+            md5s.update(role_md5s[role])
+        post = {'version': 1, 'source': 'SEED', 'data': sub_roles, 'md5s': sorted(md5s), 'exact': 1, 'limit': RECORD_LIMIT * len(md5s)}
+        posts.append(aio.obj_from_url(opts.url+'/m5nr/function', data=json.dumps(post, separators=(',',':'))))
+    figs = {}
+    for result in aio.run(aio.gather(posts)):
+        for anno in result['data']:
+            figs.setdefault((anno['function'], anno['md5']), set()).add(anno['accession'])
+    return figs
 
 def main(args):
     ArgumentParser.format_description = lambda self, formatter: self.description
@@ -85,17 +123,24 @@ def main(args):
         return 1
     
     # get SS hierarchy
-    ss_hier = dict([ (x['accession'], x) for x in obj_from_url(opts.url+'m5nr/ontology?version=1&source=Subsystems')['data'] ])
+    ss_hier = dict([ (x['accession'], x) for x in cached_obj_from_url(opts.url+'m5nr/ontology?version=1&source=Subsystems')['data'] ])
+    
+    # resolve all KOs up front: KO -> md5s -> SS roles -> fig ids
+    ko_roles, ko_md5s = ko2roles(opts, ss_hier, rows)
+    role_figs = role2figs(opts, ko_roles, ko_md5s)
     
     # biom KO -> SS
     ssrows = []
     ssmatrix = []
     for r, rid in enumerate(rows):
-        roles, md5s = ko2roles(opts, ss_hier, rid)
+        roles = ko_roles[rid]
         if not roles:
             continue
-        for role in roles:
-            fig_ids = role2figs(opts, role, md5s)
+        for role in sorted(roles):
+            fig_ids = set()
+            for md5 in ko_md5s[rid]:
+                fig_ids.update(role_figs.get((role, md5), []))
+            fig_ids = sorted(fig_ids)
             if opts.output == 'text':
                 # text output: feature list, function, abundance for function, avg evalue for function, organism
                 safe_print("%s\t%s\t%d\t%.2e\t%s\n" %(",".join(fig_ids), role, matrix[r][0], 0, 'glob'))
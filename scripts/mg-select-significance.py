@@ -2,9 +2,10 @@
 
 import os
 import sys
+import math
 import json
 from argparse import ArgumentParser
-from mglib import AUTH_LIST, VERSION, safe_print, biom_to_matrix, tab_to_matrix, sub_matrix
+from mglib import AUTH_LIST, VERSION, safe_print, biom_to_matrix, tab_to_matrix, sub_matrix, load_biom
 
 prehelp = """
 NAME
@@ -37,11 +38,19 @@ AUTHORS
     %s
 """
 
+# cell as number for sorting, None if missing or not a number
+def sort_value(cell):
+    try:
+        value = float(cell)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
 def main(args):
     ArgumentParser.format_description = lambda self, formatter: self.description
     ArgumentParser.format_epilog = lambda self, formatter: self.epilog
     parser = ArgumentParser(usage='', description=prehelp%VERSION, epilog=posthelp%AUTH_LIST)
-    parser.add_argument("--input", dest="input", default='-', help="input: filename or stdin (-), default is stdin")
+    parser.add_argument("--input", dest="input", default='-', help="input: filename, BIOM bundle directory, or stdin (-), default is stdin")
     parser.add_argument("--format", dest="format", default='biom', help="input format: 'text' for tabbed table, 'biom' for BIOM format, default is biom")
     parser.add_argument("--output", dest="output", default='biom', help="output format: 'text' for tabbed table, 'biom' for BIOM format, default is biom")
     parser.add_argument("--order", dest="order", type=int, default=None, help="column number to order output by (0 for last column), default is no ordering")
@@ -51,7 +60,7 @@ def main(args):
     
     # get inputs
     opts = parser.parse_args()
-    if (opts.input != '-') and (not os.path.isfile(opts.input)):
+    if (opts.input != '-') and (not os.path.exists(opts.input)):
         sys.stderr.write("ERROR: input data missing\n")
         return 1
     if opts.format not in ['text', 'biom']:
@@ -70,16 +79,17 @@ def main(args):
     cols = []
     data = []    
     try:
-        indata = sys.stdin.read() if opts.input == '-' else open(opts.input, 'r').read()
         if opts.format == 'biom':
             try:
-                biom = json.loads(indata)
+                biom = load_biom(opts.input)
                 rows, cols, data = biom_to_matrix(biom, sig_stats=True)
             except:
                 sys.stderr.write("ERROR: input BIOM data not correct format\n")
                 return 1
         else:
-            rows, cols, data = tab_to_matrix(indata)
+            # cells are kept as written, stats may be NA
+            in_hdl = sys.stdin if opts.input == '-' else open(opts.input, 'r')
+            rows, cols, data = tab_to_matrix(in_hdl)
     except:
         sys.stderr.write("ERROR: unable to load input data\n")
         return 1
@@ -91,10 +101,12 @@ def main(args):
         if order_col > len(cols):
             sys.stderr.write("ERROR: --order value is greater than number of columns in table\n")
         order_col  = order_col - 1
-        rd_merged  = zip(rows, data)
-        rd_sorted  = sorted(rd_merged, key=lambda x: x[1][order_col], reverse=rev_order)
-        rows, data = zip(*rd_sorted)
-        rows, data = list(rows), list(data)
+        # numeric order, missing values (NA, null) last as in R
+        rd_merged  = [(sort_value(d[order_col]), r, d) for r, d in zip(rows, data)]
+        rd_sorted  = sorted([x for x in rd_merged if x[0] is not None], key=lambda x: x[0], reverse=rev_order)
+        rd_sorted += [x for x in rd_merged if x[0] is None]
+        rows = [x[1] for x in rd_sorted]
+        data = [x[2] for x in rd_sorted]
         
     # subselect rows
     if opts.rows is not None:
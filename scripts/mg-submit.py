@@ -6,9 +6,10 @@ import json
 import time
 import pprint
 from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 from argparse import ArgumentParser
 from prettytable import PrettyTable
-from mglib import obj_from_url, get_auth_token, get_auth, API_URL, SHOCK_URL, post_file, file_from_url, VERSION, AUTH_LIST, login
+from mglib import obj_from_url, get_auth_token, get_auth, API_URL, SHOCK_URL, post_file, post_file_parts, PART_SIZE, file_from_url, poll_delays, VERSION, AUTH_LIST, login
 
 prehelp = """
 NAME
@@ -80,6 +81,11 @@ AUTHORS
 """
 
 synch_pause = 900
+# concurrent file uploads, and per-file retries with backoff between UPLOAD_FLOOR and UPLOAD_CEILING seconds
+UPLOAD_WORKERS = 4
+UPLOAD_TRIES   = 3
+UPLOAD_FLOOR   = 10
+UPLOAD_CEILING = 120
 mgrast_auth = {}
 valid_actions = ["login", "list", "status", "delete", "submit"]
 submit_types = ["simple", "batch", "demultiplex", "pairjoin", "pairjoin_demultiplex"]
@@ -225,7 +231,7 @@ def seqs_from_json(json_in, tmp_dir):
         stype = "simple"
         down_url  = "%s/node/%s?download"%(seq_obj['handle']['url'], seq_obj['handle']['id'])
         down_file = os.path.join(tmp_dir, seq_obj['handle']['file_name'])
-        down_hdl  = open(down_file, 'w')
+        down_hdl  = open(down_file, 'wb')
         file_from_url(down_url, down_hdl, auth=mgrast_auth['token'])
         down_hdl.close()
         files.append(down_file)
@@ -236,8 +242,8 @@ def seqs_from_json(json_in, tmp_dir):
         down_url_2  = "%s/node/%s?download"%(seq_obj['handle_2']['url'], seq_obj['handle_2']['id'])
         down_file_1 = os.path.join(tmp_dir, seq_obj['handle_1']['file_name'])
         down_file_2 = os.path.join(tmp_dir, seq_obj['handle_2']['file_name'])
-        down_hdl_1  = open(down_file_1, 'w')
-        down_hdl_2  = open(down_file_2, 'w')
+        down_hdl_1  = open(down_file_1, 'wb')
+        down_hdl_2  = open(down_file_2, 'wb')
         file_from_url(down_url_1, down_hdl_1, auth=mgrast_auth['token'])
         file_from_url(down_url_2, down_hdl_2, auth=mgrast_auth['token'])
         down_hdl_1.close()
@@ -255,22 +261,23 @@ def submit(stype, files, opts):
     stype one of "simple" "demultiplex" "pairjoin" "pairjoin_demultiplex" '''
 
     fids = []
-    # post files to shock
+    # post files to shock, barcode and metadata files go up alongside the inputs
+    extra = [f for f in (opts.barcode, opts.metadata) if f]
     if stype == 'batch':
         fids = archive_upload(files[0], opts.verbose)
+        eids = upload(extra, opts.verbose) if extra else []
     else:
-        fids = upload(files, opts.verbose)
+        fids = upload(files + extra, opts.verbose)
+        fids, eids = fids[:len(files)], fids[len(files):]
 
     # set POST data
     data = {}
     if opts.debug:
         data['debug'] = 1
     if opts.barcode:
-        bids = upload([opts.barcode], opts.verbose)
-        data['barcode_file'] = bids[0]
+        data['barcode_file'] = eids.pop(0)
     if opts.metadata:
-        mids = upload([opts.metadata], opts.verbose)
-        data['metadata_file'] = mids[0]
+        data['metadata_file'] = eids.pop(0)
     elif opts.project_id:
         data['project_id'] = opts.project_id
     elif opts.project_name:
@@ -339,88 +346,74 @@ def submit(stype, files, opts):
         print("Submission ID: "+result['id'])
         status(result['id'])
 
-def upload(files, verbose):
-    ''' upload(files, verbose) -- call MG-RAST api to upload one or more files to inbox '''
-    fids = []
-    attr = json.dumps({
-        "type": "inbox",
-        "id": mgrast_auth['id'],
-        "user": mgrast_auth['login'],
-        "email": mgrast_auth['email']
-    })
-
-    results = {
-        'submitted': [],
-        'failed': [],
-        'files': files
+def upload_file(f, attr, verbose):
+    ''' upload_file(f, attr, verbose) -- upload one file to inbox, retrying on its own, returns node id or None '''
+    # get format
+    if f.endswith(".gz"):
+        fformat = "gzip"
+        fname = os.path.basename(f[:-3])
+    elif f.endswith(".bz2"):
+        fformat = "bzip2"
+        fname = os.path.basename(f[:-4])
+    else:
+        fformat = "upload"
+        fname = os.path.basename(f)
+    data = {
+        "file_name": fname,
+        "attributes_str": attr
     }
-
-    # Settings for nr tries
-    maxtries = 3
-    current = 0
-    sleep   = 60
-
-    while len(results['files']) and current < maxtries:
-
-        # increase counter
-        current += 1
-
-        for i, f in enumerate(results['files']):
-            # get format
-            print(i,f)
-            if f.endswith(".gz"):
-                fformat = "gzip"
-                fname = os.path.basename(f[:-3])
-            elif f.endswith(".bz2"):
-                fformat = "bzip2"
-                fname = os.path.basename(f[:-4])
-            else:
-                fformat = "upload"
-                fname = os.path.basename(f)
-            # POST to shock
-            data = {
-                "file_name": fname,
-                "attributes_str": attr
-            }
-            if verbose:
-                if len(files) > 1:
-                    print("Uploading file %d of %d (%s) to MG-RAST Shock"%(i+1, len(files), f))
-                else:
-                    print("Uploading file %s to MG-RAST Shock"%(f))
-            if True: # change to debug
-                print("Submitting %s to %s " % (f,SHOCK_URL))
-            result = post_file(SHOCK_URL+"/node", fformat, f, data=data, auth=mgrast_auth['token'], debug=verbose)
-
-            if result:
+    delays = poll_delays(UPLOAD_FLOOR, UPLOAD_CEILING)
+    for tries in range(1, UPLOAD_TRIES+1):
+        print("Submitting %s to %s " % (f,SHOCK_URL))
+        # POST to shock, md5 is computed while the file is sent
+        # large files go in parts, a retry only resends the parts that failed
+        if os.path.getsize(f) > PART_SIZE:
+            compression = None if fformat == "upload" else fformat
+            result, md5 = post_file_parts(SHOCK_URL+"/node", f, data=data, auth=mgrast_auth['token'], debug=verbose, md5=True, compression=compression)
+        else:
+            result, md5 = post_file(SHOCK_URL+"/node", fformat, f, data=data, auth=mgrast_auth['token'], debug=verbose, md5=True, tries=1)
+        if result and result.get('data'):
+            # compressed files are unpacked by shock, only plain uploads can be compared
+            checksum = result['data'].get('file', {}).get('checksum', {}).get('md5')
+            if (fformat != "upload") or (not checksum) or (checksum == md5):
                 if verbose:
                     print(json.dumps(result['data']))
-                    if len(files) > 1:
-                        print("Setting info for file %d of %d (%s) in MG-RAST inbox"%(i+1, len(files), f))
-                    else:
-                        print("Setting info for file %s in MG-RAST inbox"%(f))
+                    print("Setting info for file %s in MG-RAST inbox"%(f))
                 # compute file info
                 info = obj_from_url(API_URL+"/inbox/info/"+result['data']['id'], auth=mgrast_auth['token'], debug=verbose)
                 if verbose:
                     print(json.dumps(info))
                 else:
-                    print(info['status'])
-                fids.append(result['data']['id'])
-                results['submitted'].append(f)
-            else:
-                print(f)
-                sys.stderr.write("ERROR: can not submit %s\n" % (f))
-                results['failed'].append(f)
+                    print("%s: %s"%(f, info['status']))
+                return result['data']['id']
+            sys.stderr.write("ERROR: md5 mismatch for %s (local %s, shock %s)\n" %(f, md5, checksum))
+        if tries < UPLOAD_TRIES:
+            wait = next(delays)
+            sys.stderr.write("retrying %s in %.0f seconds\n" %(f, wait))
+            time.sleep(wait)
+    return None
 
-        if verbose:
-            print(results)
-            print("Processed %d\tFailed %d" % (len(results['files']), len(results['failed'])))
-        # switch list, process failed again
-        results['files']    = results['failed']
-        results['failed']   = []
-
-        # wait
-        time.sleep(current * sleep)
+def upload(files, verbose):
+    ''' upload(files, verbose) -- call MG-RAST api to upload one or more files to inbox
+    files are uploaded concurrently, returns node ids in input order '''
+    attr = json.dumps({
+        "type": "inbox",
+        "id": mgrast_auth['id'],
+        "user": mgrast_auth['login'],
+        "email": mgrast_auth['email']
+    })
+    if verbose:
+        print("Uploading %d file(s) to MG-RAST Shock"%(len(files)))
+    with ThreadPoolExecutor(max_workers=max(1, min(UPLOAD_WORKERS, len(files)))) as pool:
+        fids = list(pool.map(lambda f: upload_file(f, attr, verbose), files))
 
+    failed = [f for f, fid in zip(files, fids) if fid is None]
+    for f in failed:
+        sys.stderr.write("ERROR: can not submit %s\n" % (f))
+    if verbose:
+        print("Processed %d\tFailed %d" % (len(files), len(failed)))
+    if failed:
+        sys.exit(1)
     return fids
 
 def archive_upload(afile, verbose):
@@ -14,7 +14,10 @@ setup(name='mglib',
     scripts=glob.glob('scripts/[a-z]*') + glob.glob('examples/python/*.py'),
     install_requires=  ['prettytable >= 0.7', 
                         'requests_toolbelt >= 0.8', 
-                        'setuptools > 29.0' ]  # >28 fail
+                        'numpy',
+                        'scipy',
+                        'setuptools > 29.0' ],  # >28 fail
+    extras_require={'hdf5': ['h5py']}
      )
 
 
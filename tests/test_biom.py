@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+import io
+import pytest
+from mglib import merge_bioms, sparse_to_dense, biom_to_tab, Biom
+
+def make_biom(bid, rows, cols, data, matrix_type='sparse'):
+    return {"id": bid, "generated_by": "test", "type": "Taxon table",
+            "matrix_type": matrix_type, "matrix_element_type": "int",
+            "matrix_element_value": "abundance", "shape": [len(rows), len(cols)],
+            "rows": [{"id": r, "metadata": {}} for r in rows],
+            "columns": [{"id": c} for c in cols], "data": data}
+
+def test_merge_bioms():
+    b1 = make_biom("a", ["r1", "r2"], ["c1", "c2"], [[0, 0, 1], [1, 1, 2]])
+    b2 = make_biom("b", ["r2", "r3"], ["c2", "c3"], [[5, 6], [7, 8]], matrix_type='dense')
+    b3 = make_biom("c", ["r1"], ["c4"], [[0, 0, 9]])
+    m = merge_bioms([b1, None, b2, b3])
+    assert [r['id'] for r in m['rows']] == ["r1", "r2", "r3"]
+    assert [c['id'] for c in m['columns']] == ["c1", "c2", "c3", "c4"]
+    # c2 is kept from first input, rows present in several inputs are combined
+    assert m['matrix_type'] == 'sparse'
+    assert sparse_to_dense(m['data'], 3, 4) == [[1, 0, 0, 9], [0, 2, 6, 0], [0, 0, 8, 0]]
+    assert m['shape'] == [3, 4]
+    assert m['id'] == "a_b_c"
+
+def test_biom_roundtrip():
+    b = make_biom("a", ["r1", "r2", "r3"], ["c1", "c2"], [[0, 1, 3], [2, 0, 1.5]])
+    biom = Biom.from_dict({"data": b})
+    assert biom.shape == (3, 2)
+    assert biom.dense().tolist() == [[0, 3], [0, 0], [1.5, 0]]
+    assert Biom.from_dict(biom.to_dict(dense=True)).to_dict()['data'] == [[0, 1, 3.0], [2, 0, 1.5]]
+    assert biom.to_dict()['id'] == "a"
+
+def test_sparse_values_kept():
+    # integral values stay int, a repeated cell keeps its last value
+    assert sparse_to_dense([[0, 0, 1], [1, 1, 2.0], [0, 0, 4]], 2, 2) == [[4, 0], [0, 2]]
+    assert all(type(v) is int for row in sparse_to_dense([[0, 0, 1], [1, 1, 2.0]], 2, 2) for v in row)
+    assert Biom.from_dict(make_biom("a", ["r1"], ["c1", "c2"], [[1.0, 3]], matrix_type='dense')).matrix.dtype.kind == 'i'
+    assert sparse_to_dense([[0, 1, 0.5], [0, 1, 2]], 1, 2) == [[0, 2]]
+
+def test_bundle(tmp_path):
+    b = make_biom("a", ["r1", "r2", "r3"], ["c1", "c2", "c3"], [[0, 1, 3], [2, 0, 1], [2, 2, 7]])
+    Biom.from_dict(b).save_bundle(str(tmp_path / "t.biomb"))
+    full = Biom.load_bundle(str(tmp_path / "t.biomb"))
+    assert full.dense().tolist() == [[0, 3, 0], [0, 0, 0], [1, 0, 7]]
+    assert full.to_dict()['id'] == "a"
+    part = Biom.load_bundle(str(tmp_path / "t.biomb"), rows=slice(1, 3), columns=[0, 2])
+    assert part.dense().tolist() == [[0, 0], [1, 7]]
+    assert part.row_ids == ["r2", "r3"] and part.col_ids == ["c1", "c3"]
+    part = Biom.load_bundle(str(tmp_path / "t.biomb"), columns=[2, 1])
+    assert part.dense().tolist() == [[0, 3], [0, 0], [7, 0]]
+    part = Biom.load_bundle(str(tmp_path / "t.biomb"), rows=[2, 0])
+    assert part.dense().tolist() == [[1, 0, 7], [0, 3, 0]]
+
+def test_hdf5(tmp_path):
+    pytest.importorskip("h5py")
+    b = make_biom("a", ["r1", "r2", "r3"], ["c1", "c2", "c3"], [[0, 1, 3], [2, 0, 1.5], [2, 2, 7]])
+    b['rows'][0]['metadata'] = {"taxonomy": ["Bacteria", "Firmicutes"], "hierarchy": {"level1": "x"}}
+    b['columns'][1]['name'] = "sample 2"
+    path = str(tmp_path / "t.h5")
+    Biom.from_dict(b).save_hdf5(path)
+    full = Biom.load_hdf5(path)
+    assert full.dense().tolist() == [[0, 3, 0], [0, 0, 0], [1.5, 0, 7]]
+    assert full.rows[0]['metadata'] == b['rows'][0]['metadata']
+    assert full.columns[1] == {"id": "c2", "name": "sample 2", "metadata": {}}
+    assert full.info['id'] == "a" and full.info['type'] == "Taxon table"
+    part = Biom.load_hdf5(path, columns=[2, 0])
+    assert part.dense().tolist() == [[0, 0], [0, 0], [7, 1.5]]
+    part = Biom.load_hdf5(path, rows=slice(2, 3), columns=[2])
+    assert part.dense().tolist() == [[7]] and part.row_ids == ["r3"]
+
+# tabbed writer as it was before biom_to_tab streamed rows, output must not change
+def baseline_biom_to_tab(biom, hdl, rows=None, use_id=True, col_name=False, hierarchy=False):
+    if biom['matrix_type'] == 'sparse':
+        matrix = [[0 for i in range(biom['shape'][1])] for j in range(biom['shape'][0])]
+        for r, c, v in biom['data']:
+            matrix[r][c] = v
+    else:
+        matrix = biom['data']
+    key = 'name' if col_name else 'id'
+    hdl.write("\t%s\n" %"\t".join([c[key] for c in biom['columns']]))
+    rowmax = []
+    for i, row in enumerate(matrix):
+        name = biom['rows'][i]['id']
+        if hierarchy:
+            h = [biom['rows'][i]['metadata']['hierarchy'][l] for l in ['level1', 'level2', 'level3', 'level4', 'function'] if l in biom['rows'][i]['metadata'].get('hierarchy', {})]
+            if len(h):
+                name = name + "\t" + ":".join(h)
+        if rows and (name not in rows):
+            continue
+        rowmax.append(max(row))
+        hdl.write("%s\t%s\n" %(name, "\t".join(map(str, row))))
+    return max(rowmax)
+
+def test_biom_to_tab_baseline():
+    rows, cols = ["r1", "r2", "r3"], ["c1", "c2", "c3"]
+    inputs = [make_biom("int", rows, cols, [[0, 1, 5], [2, 2, 7], [2, 0, 3], [0, 1, 4]]),
+              make_biom("mixed", rows, cols, [[0, 1, 5], [1, 0, 2.5], [2, 2, 7]]),
+              make_biom("dense", rows, cols, [[0.0, 1.5, 2.0], [0.0, 0.0, 0.0], [3.25, 0.0, 7.0]], matrix_type='dense')]
+    for i, c in enumerate(cols):
+        for b in inputs:
+            b['columns'][i]['name'] = "name "+c
+    for b in inputs:
+        b['rows'][0]['metadata'] = {"hierarchy": {"level1": "A", "level2": "B"}}
+        b['rows'][2]['metadata'] = {"hierarchy": {"level1": "C"}}
+        for kwargs in [{}, {"col_name": True}, {"hierarchy": True}, {"hierarchy": True, "col_name": True}, {"rows": ["r2", "r3"]}]:
+            new, old = io.StringIO(), io.StringIO()
+            top = biom_to_tab(b, new, **kwargs)
+            expect = baseline_biom_to_tab(b, old, **kwargs)
+            assert new.getvalue() == old.getvalue()
+            assert (top, type(top)) == (expect, type(expect))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import os
+import pytest
+import mglib.mglib as mgl
+
+URL = 'https://api.mg-rast.org/m5nr/ontology?version=1&source=Subsystems'
+
+def test_cache_put_get(tmp_path, monkeypatch):
+    monkeypatch.setattr(mgl, 'CACHE_DIR', str(tmp_path))
+    mgl.cache_put(URL, {'data': [1, 2, 3]})
+    assert mgl.cache_get(URL) == {'data': [1, 2, 3]}
+    # different auth scope does not see it
+    assert mgl.cache_get(URL, auth='sometoken') is None
+
+def test_cache_ttl(tmp_path, monkeypatch):
+    monkeypatch.setattr(mgl, 'CACHE_DIR', str(tmp_path))
+    assert mgl.cache_ttl(URL) == 7 * 86400
+    assert mgl.cache_ttl('https://api.mg-rast.org/inbox') == mgl.CACHE_TTL_DEFAULT
+    mgl.cache_put(URL, {'data': []})
+    assert mgl.cache_get(URL, ttl=-1) is None
+
+def test_cache_eviction(tmp_path, monkeypatch):
+    monkeypatch.setattr(mgl, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(mgl, 'CACHE_SIZE', 250)
+    mgl.cache_put(URL+'&a', {'data': 'x' * 100})
+    os.utime(mgl._cache_path(URL+'&a'), (1, 1))
+    mgl.cache_put(URL+'&b', {'data': 'x' * 100})
+    mgl.cache_put(URL+'&c', {'data': 'x' * 100})
+    assert mgl.cache_get(URL+'&a', ttl=10**10) is None
+    assert mgl.cache_get(URL+'&c') is not None
+
+def test_cache_offline(tmp_path, monkeypatch):
+    monkeypatch.setattr(mgl, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(mgl, 'CACHE_MODE', 'offline')
+    mgl.cache_put(URL, {'data': 'cached'})
+    assert mgl.cached_obj_from_url(URL, ttl=-1) == {'data': 'cached'}
+    with pytest.raises(SystemExit):
+        mgl.cached_obj_from_url(URL+'&missing')
+
+def test_cache_walk_only_over_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(mgl, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(mgl, 'CACHE_SIZE', 1000)
+    walks = []
+    entries = mgl._cache_entries
+    monkeypatch.setattr(mgl, '_cache_entries', lambda: walks.append(1) or entries())
+    for i in range(5):
+        mgl.cache_put(URL+'&%d'%i, {'data': 'x' * 100})
+    # one walk to seed the running total
+    assert len(walks) == 1
+    for i in range(5, 10):
+        mgl.cache_put(URL+'&%d'%i, {'data': 'x' * 100})
+    assert len(walks) > 1
+    assert mgl._cache_usage[str(tmp_path)] <= 1000
+    assert mgl.cache_get(URL+'&9') is not None
+
+def test_cache_entry_vanishes(tmp_path, monkeypatch):
+    monkeypatch.setattr(mgl, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(mgl, 'CACHE_SIZE', 150)
+    monkeypatch.setattr(mgl, '_cache_usage', {})
+    mgl.cache_put(URL+'&a', {'data': 'x' * 100})
+    gone = str(tmp_path / 'gone')
+    # another process evicted an entry between the walk and the remove
+    entries = mgl._cache_entries
+    monkeypatch.setattr(mgl, '_cache_entries', lambda: (lambda e, t: (e + [(0, 200, gone)], t + 200))(*entries()))
+    mgl.cache_put(URL+'&b', {'data': 'x' * 100})
+    assert mgl.cache_get(URL+'&b') is not None
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+import numpy as np
+import scipy.sparse as sp
+from mglib import compute
+
+COUNTS = np.array([[10, 0, 5], [1, 1, 0], [3, 40, 2], [0, 2, 7], [100, 50, 1]])
+
+# MGRAST_preprocessing of preprocessing.r, written out step by step
+def r_preprocessing(x):
+    x = np.where(x <= 1, 0, x).astype(float)
+    x = x[x.sum(axis=1) >= 1]
+    x = np.log2(x + 1)
+    x = (x - x.mean(axis=0)) / x.std(axis=0, ddof=1)
+    return (x - x.min()) / (x.max() - x.min())
+
+def test_normalize_mgrast():
+    data, keep = compute.normalize(COUNTS)
+    assert keep.tolist() == [0, 2, 3, 4]
+    assert np.allclose(data, r_preprocessing(COUNTS))
+    assert (data.min(), data.max()) == (0, 1)
+    sdata, skeep = compute.normalize(sp.csr_matrix(COUNTS))
+    assert np.allclose(sdata, data) and skeep.tolist() == keep.tolist()
+
+def test_normalize_methods():
+    data, keep = compute.normalize(COUNTS, method='log')
+    assert len(keep) == 5 and np.allclose(data, np.log2(COUNTS + 1))
+    data, keep = compute.normalize(np.array([[4, 1], [4, 3]]), method='standardize')
+    assert np.allclose(data[:,0], 0) and np.allclose(data[:,1], [-0.70710678, 0.70710678])
+
+def test_distance_matrix():
+    counts = np.array([[1, 0, 4], [0, 0, 2], [3, 0, 0]])
+    dist = compute.distance_matrix(counts, 'bray-curtis')
+    assert np.isclose(dist[0, 2], 8.0 / 10) and dist[0, 1] == 1
+    assert np.isclose(compute.distance_matrix(counts, 'euclidean')[0, 2], np.sqrt(22))
+    assert compute.distance_matrix(counts, 'maximum')[0, 2] == 3
+    assert compute.distance_matrix(counts, 'manhattan')[0, 2] == 8
+    assert compute.distance_matrix(counts, 'difference').tolist() == [[0, 2, 2], [2, 0, 2], [2, 2, 0]]
+    # R leaves out features absent from both and rescales, here 2 of 3 are used
+    assert np.isclose(compute.distance_matrix(counts, 'canberra')[0, 1], (1 + 1) * 3.0 / 2)
+    for method in compute.DISTANCES:
+        assert np.allclose(compute.distance_matrix(sp.csr_matrix(counts), method), compute.distance_matrix(counts, method))
+
+def test_pcoa():
+    counts = np.random.RandomState(1).poisson(5, size=(50, 150))
+    dist = compute.distance_matrix(counts)
+    values, vectors = compute.pcoa(dist)
+    assert np.isclose(values.sum(), 1) and vectors.shape == (150, 150)
+    top, tvectors = compute.pcoa(dist, k=4)
+    assert np.allclose(top, values[:4])
+    assert np.allclose(np.abs(tvectors), np.abs(vectors[:,:4]), atol=1e-6)
+
+# naive R hclust heights, Lance-Williams updates applied to the distances as given
+def r_hclust_heights(dist, method):
+    dist = dist.astype(float).copy()
+    np.fill_diagonal(dist, np.inf)
+    size = dict((i, 1) for i in range(len(dist)))
+    heights = []
+    while len(size) > 1:
+        live = sorted(size)
+        sub = dist[np.ix_(live, live)]
+        a, b = np.unravel_index(np.argmin(sub), sub.shape)
+        i, j = live[a], live[b]
+        dij, ni, nj = dist[i, j], size[i], size[j]
+        heights.append(dij)
+        for k in live:
+            if k in (i, j):
+                continue
+            dki, dkj, nk = dist[k, i], dist[k, j], size[k]
+            if method == 'ward':
+                new = ((ni + nk) * dki + (nj + nk) * dkj - nk * dij) / (ni + nj + nk)
+            elif method == 'median':
+                new = (dki + dkj) / 2 - dij / 4
+            elif method == 'centroid':
+                new = (ni * dki + nj * dkj) / (ni + nj) - ni * nj * dij / (ni + nj) ** 2
+            else:
+                new = (dki + dkj) / 2
+            dist[k, i] = dist[i, k] = new
+        dist[j, :] = dist[:, j] = np.inf
+        size[i] += size.pop(j)
+    return heights
+
+def test_linkage_as_r():
+    from scipy.spatial.distance import squareform
+    counts = np.random.RandomState(2).poisson(20, size=(12, 9))
+    dist = compute.pairwise_distances(counts, 'euclidean')
+    for method in ['ward', 'median', 'centroid', 'mcquitty']:
+        tree = compute.linkage(dist, method)
+        assert np.allclose(tree[:,2], r_hclust_heights(squareform(dist), method))
+    order, dend = compute.dendrogram(compute.linkage(dist, 'single'))
+    assert sorted(order.tolist()) == list(range(12)) and len(dend['merge']) == 11
+    assert dend['merge'][0][0] < 0
+
+def test_heatmap():
+    hmap = compute.heatmap(COUNTS, list('abcde'), ['mg1', 'mg2', 'mg3'], distance='manhattan', method='complete')
+    assert sorted(hmap['rows']) == list('abcde') and len(hmap['coldend']['height']) == 2
+    for i, r in enumerate(hmap['rows']):
+        assert 'abcde'[hmap['rowindex'][i] - 1] == r
+        assert hmap['data'][i] == [COUNTS[hmap['rowindex'][i] - 1][c - 1] for c in hmap['colindex']]
+    assert compute.top_variance_rows(sp.csr_matrix(COUNTS), 2).tolist() == [2, 4]
+
+def test_alpha_diversity():
+    counts = np.array([[10, 0, 0], [1, 1, 0], [3, 40, 0], [0, 2, 0], [100, 50, 0]])
+    for index in compute.ALPHA_INDEXES:
+        values = compute.alpha_diversity(sp.csr_matrix(counts), index)
+        assert np.allclose(values, compute.alpha_diversity(counts, index)) and values[2] == 0
+    p = counts[:,0][counts[:,0] > 0] / 114.0
+    assert np.isclose(compute.alpha_diversity(counts, 'shannon')[0], -(p * np.log(p)).sum())
+    assert np.isclose(compute.alpha_diversity(counts, 'alpha')[0], np.exp(-(p * np.log(p)).sum()))
+    assert np.isclose(compute.alpha_diversity(counts, 'simpson')[0], 1 - (p ** 2).sum())
+    # one singleton, one doubleton in second column
+    assert compute.alpha_diversity(counts, 'chao1').tolist() == [4, 4, 0]
+
+def test_correlate_fdr():
+    from scipy import stats
+    meta = np.array([1.0, 2.5, 3.0, 4.5, 7.0, 8.0])
+    counts = np.random.RandomState(3).poisson(10, size=(20, 6)).astype(float)
+    counts[1] = 3
+    slope, r, p = compute.correlate(sp.csr_matrix(counts), meta)
+    for i in [0, 5, 19]:
+        expect = stats.linregress(meta, counts[i])
+        assert np.allclose([slope[i], r[i], p[i]], [expect.slope, expect.rvalue, expect.pvalue])
+    # constant row has no correlation
+    assert (r[1], p[1]) == (0, 1)
+    slope2, r2, p2 = compute.correlate(counts, np.column_stack([meta, -meta]))
+    assert r2.shape == (20, 2) and np.allclose(r2[:,1], -r)
+    assert np.allclose(compute.fdr([0.01, 0.04, 0.03, 0.5]), [0.04, 0.16 / 3, 0.16 / 3, 0.5])
+    # R p.adjust(c(0.01, 0.04, NA, 0.03, 0.5), "BH")
+    assert np.allclose(compute.fdr([0.01, 0.04, np.nan, 0.03, 0.5]), [0.04, 0.16 / 3, np.nan, 0.16 / 3, 0.5], equal_nan=True)
+    assert np.isnan(compute.fdr([np.nan, np.nan])).all() and compute.fdr([]).shape == (0,)
+
+def test_group_test():
+    from scipy import stats
+    counts = np.random.RandomState(5).poisson(6, size=(10, 9)).astype(float)
+    groups = list('aaabbbccc')
+    res = compute.group_test(sp.csr_matrix(counts), groups, 'Kruskal-Wallis')
+    assert res['levels'] == ['a', 'b', 'c'] and res['mean'].shape == (10, 3)
+    for i in range(10):
+        expect = stats.kruskal(counts[i,:3], counts[i,3:6], counts[i,6:])
+        assert np.allclose([res['statistic'][i], res['p'][i]], [expect.statistic, expect.pvalue])
+    res = compute.group_test(counts, groups, 'ANOVA-one-way')
+    expect = stats.f_oneway(counts[0,:3], counts[0,3:6], counts[0,6:])
+    assert np.allclose([res['statistic'][0], res['p'][0]], [expect.statistic, expect.pvalue])
+    res = compute.group_test(counts, list('aaaabbbbb'), 't-test-unpaired')
+    expect = stats.ttest_ind(counts[0,:4], counts[0,4:], equal_var=False)
+    assert np.allclose([res['statistic'][0], res['p'][0]], [expect.statistic, expect.pvalue])
+    # R wilcox.test(1:4, 5:9) is exact, with ties it is the corrected normal approximation
+    res = compute.group_test(np.array([[1, 2, 3, 4, 5, 6, 7, 8, 9], [1, 2, 2, 4, 3, 5, 6, 7, 8]]), list('aaaabbbbb'), 'Mann-Whitney-unpaired-Wilcoxon')
+    assert res['statistic'].tolist() == [0, 1] and np.allclose(res['p'], [0.01587302, 0.03654634])
+
+def test_group_test_constant_rows():
+    # as R kruskal.test / aov: a constant row has no statistic (NA), other rows are unaffected
+    counts = np.array([[5, 5, 5, 5, 5, 5], [1, 2, 3, 4, 5, 7], [0, 0, 0, 0, 0, 0]], dtype=float)
+    groups = list('aaabbb')
+    for test in ['Kruskal-Wallis', 'ANOVA-one-way', 't-test-unpaired', 't-test-paired']:
+        res = compute.group_test(counts, groups, test)
+        assert np.isnan(res['statistic'][[0, 2]]).all() and np.isnan(res['p'][[0, 2]]).all()
+        assert np.isfinite(res['p'][1]) and np.allclose(res['sd'][0], 0)
+    res = compute.group_test(counts, groups, 'Kruskal-Wallis')
+    assert np.allclose(res['p'][1], 0.04953461)
+    assert np.allclose(compute.holm(res['p']), [np.nan, 0.04953461, np.nan], equal_nan=True)
+
+def test_holm():
+    adjusted = compute.holm([0.01, 0.04, np.nan, 0.03, 0.5])
+    assert np.allclose(adjusted, [0.04, 0.09, np.nan, 0.09, 0.5], equal_nan=True)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import io
+import json
+import pytest
+from mglib import jsonstream
+
+BIOM = {"id": "mgm4441680.3", "matrix_type": "sparse", "shape": [3, 2],
+        "rows": [{"id": "Bacteria", "metadata": {"taxonomy": ["Bacteria", "Fusobacteria"]}},
+                 {"id": "Archaea", "metadata": {"taxonomy": ["Archaea", "éé"]}},
+                 {"id": "Eukaryota", "metadata": None}],
+        "columns": [{"id": "mgm4441680.3"}, {"id": "mgm4441681.3"}],
+        "data": [[0, 0, 123456789], [1, 1, 2.5], [2, 0, 3]]}
+
+def test_load_small_chunks():
+    raw = json.dumps(BIOM, ensure_ascii=False).encode('utf8')
+    for size in [1, 2, 5, 64, 1024]:
+        assert jsonstream.JsonStream(io.BytesIO(raw), chunk_size=size).load() == BIOM
+
+def test_numbers_across_chunks():
+    values = [1.25, -0.5, 1e-07, 2.5e+300, 123456789, -3, 0, 1.0, 6.02e23, True, None]
+    raw = json.dumps(values).encode('utf8')
+    for size in range(1, len(raw) + 1):
+        assert jsonstream.JsonStream(io.BytesIO(raw), chunk_size=size).load() == values
+    # bare number document
+    for size in range(1, 6):
+        assert jsonstream.JsonStream(io.BytesIO(b'-1.5e3'), chunk_size=size).load() == -1500.0
+
+def test_iter_biom_envelope():
+    raw = json.dumps({"status": "done", "url": "x", "data": BIOM}).encode('utf8')
+    items = list(jsonstream.iter_biom(io.BytesIO(raw)))
+    assert [v for k, v in items if k == 'rows'] == BIOM['rows']
+    assert [v for k, v in items if k == 'data'] == BIOM['data']
+    assert ('shape', [3, 2]) in items
+
+def test_invalid():
+    for bad in [b'{"a": 1,', b'[1 2]', b'']:
+        with pytest.raises(ValueError):
+            jsonstream.load(io.BytesIO(bad))
+
+def test_biom_window(tmp_path):
+    import mglib.mglib as mgl
+    path = str(tmp_path / "t.biom")
+    with open(path, 'wb') as hdl:
+        hdl.write(json.dumps({"data": BIOM}, ensure_ascii=False).encode('utf8'))
+    index = mgl.biom_index(path)
+    assert len(index['rows']) == 3
+    assert mgl.biom_index(path, build=False) == index
+    for start, end in [(0, None), (1, 3), (2, 10)]:
+        expect = BIOM['rows'][start:end]
+        got = mgl.biom_window_from_index(path, index, start, end)
+        assert got['rows'] == expect
+        assert got['data'] == [[r - start, c, v] for r, c, v in BIOM['data'] if r >= start and (end is None or r < end)]
+        assert jsonstream.window_biom(open(path, 'rb'), start, end) == got
+
+class FakeResponse(io.BytesIO):
+    def __init__(self, body, headers):
+        io.BytesIO.__init__(self, body)
+        self.headers = headers
+
+def test_obj_from_url_decoding(monkeypatch):
+    import mglib.mglib as mgl
+    raw = json.dumps(BIOM).encode('utf8')
+    calls = []
+    def fake_body(url, accept, **kwargs):
+        calls.append(url)
+        return FakeResponse(body, {"content-type": "application/json", "content-length": str(len(body))})
+    monkeypatch.setattr(mgl, 'body_from_url', fake_body)
+    monkeypatch.setattr(mgl, 'STREAM_JSON_SIZE', 100)
+    for body, size in [(b'{"a": 1}', 8), (raw, len(raw))]:
+        resp = FakeResponse(body, {"content-type": "application/json", "content-length": str(size)})
+        assert mgl._stream_response(resp) == (size > 100)
+        assert mgl.obj_from_url("http://x/y") == json.loads(body.decode('utf8'))
+        assert mgl.obj_from_url("http://x/y", stream=True) == json.loads(body.decode('utf8'))
+    # malformed body is not requested again
+    del calls[:]
+    body = b'{"a": 1,'
+    with pytest.raises(ValueError):
+        mgl.obj_from_url("http://x/y")
+    assert len(calls) == 1
@@ -25,9 +25,9 @@ def runme(command, workingdir=".", fail_ok=False):
 
     try:
         p = subprocess.Popen(command, stdout=PIPE, stderr=PIPE, shell=True)
-    except SystemExit as err:
-        p = err.code
-    out, err = p.communicate()
+        out, err = p.communicate()
+    finally:
+        os.chdir(cwd)
     status = p.returncode
     # sys.stdout.getvalue(), sys.stderr.getvalue()
     if status != 0 and not fail_ok:
@@ -37,7 +37,6 @@ def runme(command, workingdir=".", fail_ok=False):
 
 # Now undo all the renamed streams
 #    sys.stdout, sys.stderr = oldout, olderr
-    os.chdir(cwd)
     return status, out, err
 
 
@@ -209,9 +208,9 @@ def test_mg_m5nrtoolspl():
     assert stat == 0
     assert b"alcohol dehydrogenase" in out
 
-def test_query_matrix():
+def test_query_matrix(tmpdir):
     s = '''mg-query.py 'http://api.mg-rast.org/matrix/organism?group_level=phylum&source=SEED&hit_type=single&result_type=abundance&evalue=1&identity=60&length=15&taxid=0&id=mgm4510219.3' > mgm4510219.3SEED.biom'''
-    stat, out, err = runme(s)
+    stat, out, err = runme(s, workingdir=str(tmpdir))
     assert stat == 0
 def test_mg_biom_view():
     s = '''mg-biom-view.py < {}/mgm4514486.3.refseq.biom.json'''.format(DATADIR)
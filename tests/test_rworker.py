@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import shutil
+import pytest
+import numpy as np
+from mglib import rworker
+
+def test_split_sources():
+    files, code = rworker.split_sources('source("/a/b.r")\n  source("c.r");\nx <- 1\nsource("d.r")')
+    assert files == ["/a/b.r", "c.r"]
+    assert code == 'x <- 1\nsource("d.r")'
+
+def test_missing_r():
+    with pytest.raises(rworker.RError):
+        rworker.RWorker(command=["/nonexistent/R"])
+
+@pytest.mark.skipif(shutil.which('R') is None, reason="R not installed")
+def test_worker_roundtrip(tmp_path):
+    lib = tmp_path / "lib.r"
+    lib.write_text("double_it <- function(x) x * 2\n")
+    pool = rworker.RPool(size=1)
+    try:
+        matrix = np.array([[1, 2.5, 0], [3, np.nan, 6]])
+        with pool.worker() as r:
+            r.source(str(lib))
+            r.assign("m", matrix, ["r1", "r2"], ["a", "b", "c"])
+            r.run("m2 <- double_it(m)")
+            rows, cols, data = r.fetch("m2")
+        assert (rows, cols) == (["r1", "r2"], ["a", "b", "c"])
+        np.testing.assert_array_equal(data, matrix * 2)
+        # same worker, library already sourced, errors keep it usable
+        with pytest.raises(rworker.RError):
+            with pool.worker() as r:
+                assert str(lib) in r.sourced
+                r.run("stop('bad input')")
+        with pool.worker() as r:
+            r.run("z <- double_it(m)")
+            assert r.fetch("z")[2].shape == (2, 3)
+        assert pool.started == 1
+    finally:
+        pool.close()
+
+def test_execute_r_debug(capsys):
+    import mglib.mglib as mgl
+    results = mgl.execute_r('x <- 1', debug=True, fetch=['x', 'y'])
+    assert [r[0] for r in results] == [[], []] and results[1][2].shape == (0, 0)
+    assert 'x <- 1' in capsys.readouterr().out
+
+def test_execute_r_falls_back(monkeypatch):
+    import mglib.mglib as mgl
+    calls = []
+    monkeypatch.setattr(mgl, 'R_COMMAND', ['/nonexistent/R'])
+    monkeypatch.setattr(mgl, '_r_worker_failed', False)
+    monkeypatch.setattr(rworker, '_pool', None)
+    monkeypatch.setattr(mgl, 'execute_r_once', lambda cmd, data=None, fetch=None: calls.append(cmd) or ['once'])
+    assert mgl.execute_r('source("a.r")\nx <- 1', fetch=['x']) == ['once']
+    # no second attempt to start a worker
+    assert mgl._r_worker_failed and mgl.execute_r('y <- 2') == ['once']
+    assert calls == ['source("a.r")\nx <- 1', 'y <- 2']
+
+@pytest.mark.skipif(shutil.which('R') is None, reason="R not installed")
+def test_execute_r_once_roundtrip():
+    import mglib.mglib as mgl
+    matrix = np.array([[1, 2.5, 0], [3, np.nan, 6]])
+    rows, cols, data = mgl.execute_r_once("m2 <- m * 2", data={'m': (["r1", "r2"], ["a", "b", "c"], matrix)}, fetch=['m2'])[0]
+    assert (rows, cols) == (["r1", "r2"], ["a", "b", "c"])
+    np.testing.assert_array_equal(data, matrix * 2)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import hashlib
+import subprocess
+import pytest
+import numpy as np
+from mglib import r_table
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# run a script from scripts/ with the checked out mglib, returns (status, stdout, stderr)
+def run_script(name, args, stdin=None):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'scripts', name)] + args, env=env,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate(stdin.encode('utf8') if stdin else None)
+    return proc.returncode, out.decode('utf8'), err.decode('utf8')
+
+def test_select_significance_na_stats():
+    # mg-group-significance --output text writes NA for undefined stats
+    table = r_table(["r1", "r2", "r3"], ["mg1", "mg2", "KW::stat", "KW::p"],
+                    [[5, 5, np.nan, np.nan], [1, 9, 2.4, 0.12], [3, 8, 3.1, 0.05]])
+    status, out, err = run_script('mg-select-significance.py', ['--input', '-', '--format', 'text', '--output', 'text', '--order', '4', '--direction', 'asc'], stdin=table)
+    assert status == 0, err
+    lines = out.strip('\n').split('\n')
+    assert lines[0] == "\tmg1\tmg2\tKW::stat\tKW::p"
+    # numeric order, NA row last and written unchanged
+    assert [l.split('\t')[0] for l in lines[1:]] == ["r3", "r2", "r1"]
+    assert lines[3] == "r1\t5\t5\tNA\tNA"
+
+# load a script from scripts/ as a module, to call main with collaborators replaced
+def load_script(name):
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_')[:-3], os.path.join(ROOT, 'scripts', name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_boxplot_plot_runs_r(tmp_path, monkeypatch):
+    # the script used to return before parsing input, it now hands the matrix to R
+    table = tmp_path / "in.txt"
+    table.write_text("\tmg1\tmg2\nr1\t1\t2\nr2\t3\t4.5\n")
+    script = load_script('mg-compare-boxplot-plot.py')
+    calls = []
+    monkeypatch.setattr(script, 'execute_r', lambda cmd, data=None, fetch=None: calls.append((cmd, data)) or [])
+    monkeypatch.setattr(sys, 'argv', ['mg-compare-boxplot-plot', '--input', str(table), '--format', 'text',
+                                      '--plot', str(tmp_path / "box.png"), '--rlib', '/r/lib'])
+    assert script.main(sys.argv) == 0
+    cmd, data = calls[0]
+    assert cmd.startswith('source("/r/lib/plot_mg_boxplot.r")') and 'table_in=mgrast_data' in cmd
+    rows, cols, matrix = data['mgrast_data']
+    assert (rows, cols, matrix.tolist()) == (["r1", "r2"], ["mg1", "mg2"], [[1, 2], [3, 4.5]])
+
+def test_compare_taxa_temp_chunks(tmp_path, monkeypatch):
+    # chunks arriving out of order give the same biom with and without --temp
+    ids = ["mgm%d.3" % i for i in range(120)]
+    def chunk(n):
+        return {'id': str(n), 'type': 'Taxon table', 'matrix_type': 'sparse', 'matrix_element_type': 'int',
+                'matrix_element_value': 'abundance', 'shape': [2, 1], 'generated_by': 'test', 'date': 'now',
+                'format': 'Biological Observation Matrix 1.0', 'format_url': '', 'data': [[0, 0, n + 1], [1, 0, 2]],
+                'rows': [{'id': 'r%d' % n, 'metadata': {}}, {'id': 'shared', 'metadata': {}}],
+                'columns': [{'id': 'mg%d' % n, 'metadata': {}}]}
+    script = load_script('mg-compare-taxa.py')
+    monkeypatch.setattr(script, 'async_rest_api_many', lambda urls, **kw: iter([(2, chunk(2)), (0, chunk(0)), (1, {'data': chunk(1)})]))
+    results = []
+    for extra in ([], ['--temp', str(tmp_path / 'temp.biom')]):
+        out = tmp_path / 'out.biom'
+        monkeypatch.setattr(sys, 'argv', ['mg-compare-taxa', '--ids', ','.join(ids), '--format', 'biom', '--output', str(out)] + extra)
+        assert script.main(sys.argv) == 0
+        results.append(json.loads(out.read_text()))
+    assert results[0] == results[1]
+    assert json.loads((tmp_path / 'temp.biom').read_text()) == results[1]
+    assert [c['id'] for c in results[0]['columns']] == ['mg0', 'mg1', 'mg2']
+
+def test_download_messages(tmp_path, monkeypatch, capsys):
+    # "checksum matches" only when an md5 was compared
+    pytest.importorskip('prettytable')
+    script = load_script('mg-download.py')
+    monkeypatch.setattr(script, 'download_file', lambda url, path, **kw: open(path, 'wb').close() or 0)
+    (tmp_path / 'a').write_bytes(b'abc')
+    assert script.file_download(None, {'url': 'u', 'file_name': 'a', 'id': 'x', 'file_md5': hashlib.md5(b'abc').hexdigest()}, str(tmp_path)) == (0, 0.0)
+    assert script.file_download(None, {'url': 'u', 'file_name': 'b', 'id': 'x'}, str(tmp_path))[0] == 0
+    out = capsys.readouterr().out
+    assert "Skipping a for x, checksum matches" in out
+    assert "Downloaded b for x: empty file" in out
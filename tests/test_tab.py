@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+import io
+import numpy as np
+from mglib import tab_to_matrix, tab_to_array, iter_tab_chunks, r_table
+
+TABLE = "\tmg1\tmg2\nr1\t1\t2\nbad\t3\nr2\t4\t5\n\nr3\t6\t7\n"
+
+def test_tab_to_array():
+    rows, cols, data = tab_to_array(io.StringIO(TABLE), chunk_rows=2)
+    assert (rows, cols) == (["r1", "r2", "r3"], ["mg1", "mg2"])
+    assert data.dtype == np.int64 and data.tolist() == [[1, 2], [4, 5], [6, 7]]
+    rows, cols, data = tab_to_array(TABLE.replace("\t7", "\t7.5"))
+    assert data.dtype == np.float64 and data[2, 1] == 7.5
+    # same rows as string parser
+    assert tab_to_matrix(TABLE)[0] == tab_to_matrix(io.StringIO(TABLE))[0] == rows
+
+def test_iter_tab_chunks():
+    hdl = io.StringIO(TABLE)
+    cols = hdl.readline().strip().split('\t')
+    chunks = list(iter_tab_chunks(hdl, cols, chunk_rows=2, dtype=np.float64))
+    assert [r for r, a in chunks] == [["r1", "r2"], ["r3"]]
+    assert chunks[1][1].tolist() == [[6.0, 7.0]]
+
+def test_r_table():
+    text = r_table(["r1", "r2"], ["mg1", "mg2"], [[1, 0.1], [np.nan, np.inf]])
+    assert text == "\tmg1\tmg2\nr1\t1\t0.1\nr2\tNA\tInf\n"
+    rows, cols, data = tab_to_array(text.replace("NA", "nan"))
+    assert (rows, cols) == (["r1", "r2"], ["mg1", "mg2"])